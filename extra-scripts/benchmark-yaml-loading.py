@@ -0,0 +1,70 @@
+"""
+Compare how long the different ruamel.yaml loaders take to parse every YAML file
+under config/clusters, to check the benefit of `deployer.utils.yaml_loader`.
+
+Encrypted files are parsed too, as they are still valid YAML.
+
+Usage:
+    python extra-scripts/benchmark-yaml-loading.py [--rounds N]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from ruamel.yaml import YAML
+
+from deployer.utils.yaml_loader import HAS_LIBYAML, load_yaml
+
+CONFIG_CLUSTERS_PATH = Path(__file__).parent.parent / "config/clusters"
+
+
+def time_loader(name, load, contents, rounds):
+    best = None
+    for _ in range(rounds):
+        start_time = time.perf_counter()
+        for content in contents:
+            load(content)
+        duration = time.perf_counter() - start_time
+        best = duration if best is None else min(best, duration)
+    print(f"{name:<30} {best:8.3f}s")
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__)
+    argparser.add_argument(
+        "--rounds",
+        type=int,
+        default=3,
+        help="Number of times to parse all files. The fastest round is reported.",
+    )
+    args = argparser.parse_args()
+
+    # Read all files upfront, so we only measure parsing and not disk access
+    # Files under templates/ are jinja2 templates rather than YAML
+    paths = [
+        p
+        for p in sorted(CONFIG_CLUSTERS_PATH.glob("**/*.yaml"))
+        if "templates" not in p.relative_to(CONFIG_CLUSTERS_PATH).parts
+    ]
+    contents = [p.read_text() for p in paths]
+    total_size = sum(len(c) for c in contents)
+    print(
+        f"Parsing {len(paths)} files ({total_size / 1024:.0f} KiB), "
+        f"best of {args.rounds} rounds"
+    )
+    if not HAS_LIBYAML:
+        print("ruamel.yaml.clib is not installed, so load_yaml uses the pure loader")
+
+    time_loader("YAML(typ='rt')", YAML(typ="rt").load, contents, args.rounds)
+    time_loader(
+        "YAML(typ='safe', pure=True)",
+        YAML(typ="safe", pure=True).load,
+        contents,
+        args.rounds,
+    )
+    time_loader("load_yaml", load_yaml, contents, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,12 @@ for the same CLI application. So we can put deployment related stuff under
 deployer.py, debug related stuff under debug.py, etc
 """
 
+from pathlib import Path
+
 import typer
 
+from deployer.utils import tracing
+
 # Category for tools that are required in CI/CD
 CONTINUOUS_DEPLOYMENT = "Continuous Deployment"
 # The typer app to which all subcommands are attached
@@ -21,3 +25,23 @@ app.add_typer(
     help="Validate configuration files such as helm chart values and cluster.yaml files.",
     rich_help_panel=CONTINUOUS_DEPLOYMENT,
 )
+
+
+@app.callback()
+def main(
+    ctx: typer.Context,
+    trace_file: Path = typer.Option(
+        None,
+        "--trace-file",
+        help="Record how long each call to an external tool (helm, kubectl, sops, jsonnet, cloud provider CLIs) takes, write it to this file and print a summary at the end. Files ending in .json get the Chrome trace format (open with https://ui.perfetto.dev), other files get one JSON object per line.",
+    ),
+):
+    if trace_file:
+        tracing.start_tracing()
+
+        def finish_tracing():
+            spans = tracing.get_spans()
+            tracing.write_trace(trace_file, spans)
+            tracing.print_trace_summary(spans)
+
+        ctx.call_on_close(finish_tracing)
@@ -4,34 +4,56 @@ Actions available when deploying many JupyterHubs to many Kubernetes clusters
 
 import asyncio
 import base64
+import json
+import os
 import subprocess
 import sys
+import time
+from pathlib import Path
 
 import typer
-from ruamel.yaml import YAML
+from rich.console import Console
+from rich.table import Table
 
 from deployer.app import CONTINUOUS_DEPLOYMENT, app
 from deployer.commands.validate.config import (
+    _prepare_hub_helm_charts_dependencies_and_schema,
     cleanup_values_schema_json,
 )
 from deployer.commands.validate.config import cluster_config as validate_cluster_config
-from deployer.commands.validate.config import get_chart_dir
-from deployer.commands.validate.config import support_config as validate_support_config
 from deployer.commands.validate.config import (
-    validate_authenticator_config,
-    validate_hub_config,
+    get_chart_dir,
+    get_hub_chart_dir,
+    get_hub_chart_override,
+)
+from deployer.commands.validate.config import support_config as validate_support_config
+from deployer.commands.validate.config import validate_hub
+from deployer.health_check_tests.probe_hub_health import probe_hubs_concurrently
+from deployer.health_check_tests.test_hub_health import (
+    NotebookMode,
+    test_hub_healthy,
 )
-from deployer.health_check_tests.test_hub_health import test_hub_healthy
 from deployer.infra_components.cluster import Cluster
-from deployer.utils.file_acquisition import (
-    HELM_CHARTS_DIR,
-    REPO_ROOT_PATH,
-    get_decrypted_file,
+from deployer.utils import tracing
+from deployer.utils.deploy_digests import (
+    describe_changes,
+    forget_deploy_digest,
+    get_manifests_digest,
+    load_deploy_digest,
+    save_deploy_digest,
 )
-from deployer.utils.rendering import print_colour
-
-# Without `pure=True`, I get an exception about str / byte issues
-yaml = YAML(typ="safe", pure=True)
+from deployer.utils.deploy_stats import merge_deploy_stats as merge_stats_files
+from deployer.utils.deploy_stats import record_deploy_durations
+from deployer.utils.file_acquisition import HELM_CHARTS_DIR, get_decrypted_file
+from deployer.utils.health_history import (
+    load_health_history,
+    record_health_check,
+    summarize_health_history,
+)
+from deployer.utils.helm import get_release_revision, get_release_revisions
+from deployer.utils.parallel import run_in_parallel
+from deployer.utils.rendering import print_colour, print_timing_table
+from deployer.utils.yaml_loader import load_yaml
 
 
 @app.command(rich_help_panel=CONTINUOUS_DEPLOYMENT)
@@ -84,12 +106,196 @@ def determine_dask_gateway_version(chart_dir):
     # We check the Chart file directly to get this info
     chart_config = chart_dir / "Chart.yaml"
     with open(chart_config, "r+") as f:
-        config = yaml.load(f)
+        config = load_yaml(f)
         for dep in config["dependencies"]:
             if dep["name"] == "dask-gateway":
                 return dep["version"]
 
 
+def deploy_hub(
+    cluster_name,
+    hub,
+    debug,
+    dry_run,
+    skip_refresh,
+    progress_str="",
+    cleanup_schema=True,
+    incremental=False,
+):
+    """
+    Validate and deploy a single hub. Expects to be called from inside
+    `cluster.auth()` of the hub's cluster.
+
+    When `incremental` is set, the hub's manifests are rendered first, and the
+    deploy is skipped if they are the same as the last time the hub was
+    deployed incrementally (see `deployer.utils.deploy_digests`).
+
+    Returns:
+        bool: False if the deploy was skipped as nothing changed, True otherwise
+    """
+    default_chart_dir = HELM_CHARTS_DIR / hub.spec["helm_chart"]
+    chart_override, chart_override_path = get_hub_chart_override(hub)
+    chart_dir = get_chart_dir(
+        default_chart_dir,
+        chart_override,
+        chart_override_path,
+        hub.legacy_daskhub,
+    )
+    with tracing.trace_attributes(hub=hub.spec["name"]):
+        if hub.legacy_daskhub:
+            dask_gateway_version = determine_dask_gateway_version(
+                chart_dir.parent / "basehub"
+            )
+        else:
+            dask_gateway_version = determine_dask_gateway_version(chart_dir)
+        print_colour(
+            f"Installing CRDs for dask-gateway version {dask_gateway_version}",
+            "yellow",
+        )
+
+        if chart_override_path:
+            print_colour(
+                f"Deploying a custom helm chart for a {hub.spec['helm_chart']} from {chart_dir}, for {chart_override_path}",
+                "yellow",
+            )
+        else:
+            print_colour(f"Deploying a {hub.spec['helm_chart']} from {chart_dir}")
+        if not skip_refresh:
+            _prepare_hub_helm_charts_dependencies_and_schema(
+                chart_dir, hub.legacy_daskhub
+            )
+        print_colour(
+            f"{progress_str}Validating hub and authenticator config for {hub.spec['name']}..."
+        )
+        validate_hub(hub, chart_dir)
+        if cleanup_schema:
+            cleanup_values_schema_json(chart_dir)
+
+        release_name = hub.spec["name"]
+        if incremental:
+            print_colour(f"{progress_str}Rendering manifests of {release_name}...")
+            digest = {
+                "dask_gateway_version": dask_gateway_version,
+                "resources": get_manifests_digest(
+                    hub.render_manifests(chart_dir), release_name
+                ),
+            }
+            previous = load_deploy_digest(cluster_name, release_name)
+            revision = get_release_revision(release_name, release_name)
+            if previous is None:
+                print_colour(f"No previous deploy of {release_name} recorded")
+            elif revision is None or previous.pop("revision", None) != revision:
+                print_colour(
+                    f"{release_name} has been deployed since its last recorded deploy",
+                    "yellow",
+                )
+            elif previous == digest:
+                print_colour(
+                    f"{progress_str}Rendered manifests of {release_name} are unchanged, skipping deploy",
+                    "green",
+                )
+                return False
+            else:
+                print_colour(f"Rendered manifests of {release_name} have changed:")
+                for change in describe_changes(
+                    previous["resources"], digest["resources"]
+                ):
+                    print(f"  {change}")
+        else:
+            # The hub may end up with different manifests than the ones recorded,
+            # so make sure its next incremental deploy doesn't get skipped
+            forget_deploy_digest(cluster_name, release_name)
+
+        print_colour(f"{progress_str}Deploying hub {release_name}...")
+        hub.deploy(chart_dir, dask_gateway_version, debug, dry_run)
+        if cleanup_schema:
+            cleanup_values_schema_json(chart_dir)
+
+        if incremental and not dry_run:
+            digest["revision"] = get_release_revision(release_name, release_name)
+            save_deploy_digest(cluster_name, release_name, digest)
+    return True
+
+
+def _deploy_hub_in_worker(cluster_name, hub_name, debug, dry_run, incremental):
+    """
+    Entrypoint for deploying a hub from a worker process of `run_in_parallel`.
+
+    The parent process has already authenticated with the cluster, so the
+    environment variables we inherit from it already point to the cluster.
+    """
+    hub = Cluster.from_name(cluster_name).get_hub(hub_name)
+    # Chart directories are prepared once by the parent process, as they can be
+    # shared between hubs
+    return deploy_hub(
+        cluster_name,
+        hub,
+        debug,
+        dry_run,
+        skip_refresh=True,
+        cleanup_schema=False,
+        incremental=incremental,
+    )
+
+
+def deploy_hubs_in_parallel(
+    cluster_name, hubs, parallel, debug, dry_run, skip_refresh, incremental=False
+):
+    """
+    Deploy `hubs` with up to `parallel` hubs being deployed at the same time.
+
+    All staging hubs are deployed before any production hub is started, and no
+    new deployments are started once one has failed.
+
+    Returns a list of per hub results as described in `run_in_parallel`, with
+    the status of hubs skipped by an incremental deploy set to "unchanged".
+    """
+    # Running `helm dep up` concurrently on the same chart directory is not safe,
+    # so we prepare every chart directory upfront, one at a time. Hubs using the
+    # same `chart_override` file share a chart directory too.
+    shared_chart_dirs = {(get_hub_chart_dir(h), h.legacy_daskhub) for h in hubs}
+    if not skip_refresh:
+        for chart_dir, legacy_daskhub in sorted(shared_chart_dirs):
+            _prepare_hub_helm_charts_dependencies_and_schema(chart_dir, legacy_daskhub)
+
+    def make_tasks(hubs):
+        return [
+            (
+                h.spec["name"],
+                _deploy_hub_in_worker,
+                (cluster_name, h.spec["name"], debug, dry_run, incremental),
+            )
+            for h in hubs
+        ]
+
+    staging_hubs = [h for h in hubs if "staging" in h.spec["name"]]
+    prod_hubs = [h for h in hubs if "staging" not in h.spec["name"]]
+
+    results = run_in_parallel(make_tasks(staging_hubs), parallel)
+    if any(r["status"] == "failed" for r in results):
+        # Don't start on production hubs if a staging hub failed
+        results += [
+            {
+                "name": h.spec["name"],
+                "status": "skipped",
+                "duration": None,
+                "error": None,
+                "result": None,
+            }
+            for h in prod_hubs
+        ]
+    else:
+        results += run_in_parallel(make_tasks(prod_hubs), parallel)
+
+    for chart_dir, _ in shared_chart_dirs:
+        cleanup_values_schema_json(chart_dir)
+
+    for r in results:
+        if r["status"] == "succeeded" and r.get("result") is False:
+            r["status"] = "unchanged"
+    return results
+
+
 @app.command(rich_help_panel=CONTINUOUS_DEPLOYMENT)
 def deploy(
     cluster_name: str = typer.Argument(..., help="Name of cluster to operate on"),
@@ -112,6 +318,17 @@ def deploy(
         "--skip-refresh",
         help="""When present, the helm charts and schemas will not be updated.""",
     ),
+    parallel: int = typer.Option(
+        1,
+        "--parallel",
+        min=1,
+        help="""Number of hubs to deploy at the same time. Staging hubs are always deployed before production hubs.""",
+    ),
+    incremental: bool = typer.Option(
+        False,
+        "--incremental",
+        help="""When present, render the manifests of each hub first, and skip deploying hubs whose manifests are unchanged since their last incremental deploy.""",
+    ),
 ):
     """
     Deploy one or more hubs in a given cluster
@@ -125,63 +342,76 @@ def deploy(
             hubs = [h for h in cluster.hubs if h.spec["name"] in hub_names]
         else:
             hubs = cluster.hubs
+
+        if parallel > 1 and len(hubs) > 1:
+            results = deploy_hubs_in_parallel(
+                cluster_name, hubs, parallel, debug, dry_run, skip_refresh, incremental
+            )
+            print_timing_table(results, title=f"Hub deployments on {cluster_name}")
+            if not dry_run:
+                record_deploy_durations(
+                    {
+                        (cluster_name, r["name"]): r["duration"]
+                        for r in results
+                        if r["status"] == "succeeded"
+                    }
+                )
+            if any(r["status"] == "failed" for r in results):
+                sys.exit(1)
+            return
+
         progress_str = ""
         for i, hub in enumerate(hubs):
-            default_chart_dir = HELM_CHARTS_DIR / hub.spec["helm_chart"]
-            chart_override = hub.spec.get("chart_override", None)
-            if chart_override and "/" in chart_override:
-                # It's probably a path relative to the repo root
-                chart_override_path = REPO_ROOT_PATH / chart_override
-                chart_override = chart_override.split("/")[-1]
-            else:
-                chart_override_path = (
-                    hub.cluster.config_dir / chart_override if chart_override else None
-                )
-            with get_chart_dir(
-                default_chart_dir,
-                chart_override,
-                chart_override_path,
-                hub.legacy_daskhub,
-            ) as chart_dir:
-                if hub.legacy_daskhub:
-                    dask_gateway_version = determine_dask_gateway_version(
-                        chart_dir.parent / "basehub"
-                    )
-                else:
-                    dask_gateway_version = determine_dask_gateway_version(chart_dir)
-                print_colour(
-                    f"Installing CRDs for dask-gateway version {dask_gateway_version}",
-                    "yellow",
+            if len(hubs) > 1:
+                progress_str = f"{i + 1} / {len(hubs)}: "
+            start_time = time.perf_counter()
+            deployed = deploy_hub(
+                cluster_name,
+                hub,
+                debug,
+                dry_run,
+                skip_refresh,
+                progress_str,
+                incremental=incremental,
+            )
+            # Skipped deploys say nothing about how long deploying the hub takes
+            if deployed and not dry_run:
+                record_deploy_durations(
+                    {(cluster_name, hub.spec["name"]): time.perf_counter() - start_time}
                 )
 
-                if chart_override_path:
-                    print_colour(
-                        f"Deploying a custom helm chart for a {hub.spec['helm_chart']} from {chart_dir}, for {chart_override_path}",
-                        "yellow",
-                    )
-                else:
-                    print_colour(
-                        f"Deploying a {hub.spec['helm_chart']} from {chart_dir}"
-                    )
-                if len(hubs) > 1:
-                    progress_str = f"{i + 1} / {len(hubs)}: "
-                print_colour(
-                    f"{progress_str}Validating non-encrypted hub values files for {hub.spec['name']}..."
-                )
-                validate_hub_config(
-                    cluster_name, hub.spec["name"], chart_dir, skip_refresh
-                )
-                print_colour(
-                    f"{progress_str}Validating authenticator config for {hub.spec['name']}..."
-                )
-                validate_authenticator_config(
-                    cluster_name, hub.spec["name"], chart_dir, skip_refresh
-                )
-                cleanup_values_schema_json(chart_dir)
 
-                print_colour(f"{progress_str}Deploying hub {hub.spec['name']}...")
-                hub.deploy(chart_dir, dask_gateway_version, debug, dry_run)
-                cleanup_values_schema_json(chart_dir)
+@app.command(rich_help_panel=CONTINUOUS_DEPLOYMENT)
+def merge_deploy_stats(
+    stats_files: list[Path] = typer.Argument(
+        ..., help="Deploy stats files, as written by `deployer deploy`, to merge"
+    ),
+):
+    """
+    Add the deploy durations recorded in other files to the ones used to plan
+    upgrades, like the ones recorded by each CI job deploying hubs.
+    """
+    merge_stats_files(stats_files)
+
+
+def get_hub_url(hub):
+    """
+    Return the URL of `hub`, taking its domain from its domain override file if
+    it has one.
+    """
+    # Check if this hub has a domain override file. If yes, apply override.
+    if "domain_override_file" in hub.spec.keys():
+        domain_override_file = hub.spec["domain_override_file"]
+
+        with get_decrypted_file(
+            hub.cluster.config_dir / domain_override_file
+        ) as decrypted_path:
+            with open(decrypted_path) as f:
+                domain_override_config = load_yaml(f)
+
+        hub.spec["domain"] = domain_override_config["domain"]
+
+    return f"https://{hub.spec['domain']}"
 
 
 async def test_health_attempts(
@@ -191,21 +421,40 @@ async def test_health_attempts(
     attempts: int,
     attempt_timeout_s: int,
     verbose: bool,
+    notebook_mode: NotebookMode = NotebookMode.SEQUENTIAL,
 ):
+    """
+    Run the health check of a hub until it passes, at most `attempts` times.
+
+    Returns:
+        list[dict]: Timings of each test notebook in the attempt that passed, as
+            returned by `test_hub_healthy`
+
+    Raises:
+        RuntimeError: When all attempts failed, with the error of the last one
+    """
+    error = None
     for i in range(attempts):
         try:
             async with asyncio.timeout(attempt_timeout_s):
-                await test_hub_healthy(hub_url, service_api_token, hub_type, verbose)
+                timings = await test_hub_healthy(
+                    hub_url, service_api_token, hub_type, verbose, notebook_mode
+                )
         except asyncio.TimeoutError:
-            print_colour(f"Attempt {i + 1} timed out, retrying", colour="red")
-        except Exception:
+            error = f"Timed out after {attempt_timeout_s}s"
             print_colour(
-                f"An error occurred during attempt {i + 1}, retrying", colour="red"
+                f"Attempt {i + 1} for {hub_url} timed out, retrying", colour="red"
+            )
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print_colour(
+                f"An error occurred during attempt {i + 1} for {hub_url}, retrying",
+                colour="red",
             )
         else:
-            return
+            return timings
 
-    raise RuntimeError("All attempts failed")
+    raise RuntimeError(f"All {attempts} attempts failed, the last one with: {error}")
 
 
 @app.command(rich_help_panel=CONTINUOUS_DEPLOYMENT)
@@ -219,6 +468,10 @@ def run_hub_health_check(
         600, help="Number of seconds before giving up on an attempt"
     ),
     verbose: bool = typer.Option(False, help="Print traceback on error"),
+    notebook_mode: NotebookMode = typer.Option(
+        NotebookMode.SEQUENTIAL,
+        help="Run the test notebooks one after another on fresh servers (sequential), one after another on the same server (shared-server), or all at once on servers of separate users (concurrent)",
+    ),
 ):
     """
     Run a health check on a given hub on a given cluster. Optionally check scaling
@@ -249,25 +502,12 @@ def run_hub_health_check(
 
     print_colour(f"Running hub health check for {hub.spec['name']}...")
 
-    # Check if this hub has a domain override file. If yes, apply override.
-    if "domain_override_file" in hub.spec.keys():
-        domain_override_file = hub.spec["domain_override_file"]
-
-        with get_decrypted_file(
-            hub.cluster.config_dir / domain_override_file
-        ) as decrypted_path:
-            with open(decrypted_path) as f:
-                domain_override_config = yaml.load(f)
-
-        hub.spec["domain"] = domain_override_config["domain"]
-
-    # Retrieve hub's URL
-    hub_url = f"https://{hub.spec['domain']}"
+    hub_url = get_hub_url(hub)
 
     # Read in the service api token from a k8s Secret in the k8s cluster
     with cluster.auth():
         try:
-            service_api_token_b64encoded = subprocess.check_output(
+            service_api_token_b64encoded = tracing.check_output(
                 [
                     "kubectl",
                     "get",
@@ -283,9 +523,471 @@ def run_hub_health_check(
                 f"Failed to acquire a JupyterHub API token for the hub-health service: {e.stdout}"
             )
         service_api_token = base64.b64decode(service_api_token_b64encoded).decode()
+        revision = get_release_revision(hub.spec["name"], hub.spec["name"])
+
+    start_time = time.perf_counter()
+    result = {
+        "url": hub_url,
+        "revision": revision,
+        "notebook_mode": notebook_mode.value,
+        "status": "failed",
+        "error": None,
+        "notebooks": [],
+    }
+    try:
+        result["notebooks"] = asyncio.run(
+            test_health_attempts(
+                hub_url,
+                service_api_token,
+                hub.type,
+                attempts,
+                attempt_timeout_s,
+                verbose,
+                notebook_mode,
+            )
+        )
+        result["status"] = "passed"
+    except Exception as e:
+        result["error"] = str(e)
+        raise
+    finally:
+        result["duration"] = round(time.perf_counter() - start_time, 1)
+        record_health_check(cluster_name, hub.spec["name"], result)
 
-    asyncio.run(
-        test_health_attempts(
-            hub_url, service_api_token, hub.type, attempts, attempt_timeout_s, verbose
+
+def get_hub_health_api_tokens():
+    """
+    Return the API token of the hub-health service of every hub on the cluster,
+    keyed by the hub's namespace, reading all of them with a single `kubectl` call.
+
+    Expects to be called from inside `cluster.auth()`.
+    """
+    secrets = json.loads(
+        tracing.check_output(
+            [
+                "kubectl",
+                "get",
+                "secrets",
+                "--all-namespaces",
+                "--field-selector=metadata.name=hub",
+                "--output=json",
+            ],
+            text=True,
         )
     )
+    tokens = {}
+    for secret in secrets["items"]:
+        token = secret.get("data", {}).get("hub.services.hub-health.apiToken")
+        if token:
+            tokens[secret["metadata"]["namespace"]] = base64.b64decode(token).decode()
+    return tokens
+
+
+async def run_health_checks_concurrently(
+    checks,
+    concurrency,
+    attempts,
+    attempt_timeout_s,
+    verbose,
+    notebook_mode=NotebookMode.SEQUENTIAL,
+):
+    """
+    Run the health checks of many hubs on one event loop, with at most
+    `concurrency` of them running at the same time.
+
+    Args:
+        checks (list[dict]): One dict per hub with its "cluster", "hub", "url",
+            "type", the "token" of its hub-health service and the "revision" of
+            its helm release
+
+    Returns:
+        list[dict]: One result per check, in the same order, with the "cluster",
+            "hub", "url" and "revision" of the hub, its "status" ("passed" or "failed"), how
+            long checking it took in seconds as "duration", the "error" it
+            failed with, and the timings of its test "notebooks" as returned by
+            `test_hub_healthy`
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_health_check(check):
+        async with semaphore:
+            start_time = time.perf_counter()
+            error = None
+            notebooks = []
+            with tracing.span(
+                "health check", cluster=check["cluster"], hub=check["hub"]
+            ):
+                try:
+                    notebooks = await test_health_attempts(
+                        check["url"],
+                        check["token"],
+                        check["type"],
+                        attempts,
+                        attempt_timeout_s,
+                        verbose,
+                        notebook_mode,
+                    )
+                except Exception as e:
+                    error = str(e)
+            return {
+                "cluster": check["cluster"],
+                "hub": check["hub"],
+                "url": check["url"],
+                "revision": check["revision"],
+                "status": "failed" if error else "passed",
+                "duration": round(time.perf_counter() - start_time, 1),
+                "error": error,
+                "notebooks": notebooks,
+            }
+
+    return await asyncio.gather(*(run_health_check(check) for check in checks))
+
+
+def _read_health_check_secrets_in_worker(cluster_name):
+    """
+    Entrypoint for reading what the health checks of a cluster's hubs need from a
+    worker process of `run_in_parallel`.
+
+    Authenticating sets process wide environment variables (like `KUBECONFIG`),
+    so each cluster is authenticated with in a process of its own.
+
+    Returns:
+        tuple[dict, dict]: The API tokens of the hub-health services, as returned
+            by `get_hub_health_api_tokens`, and the revisions of the helm releases,
+            as returned by `get_release_revisions`
+    """
+    cluster = Cluster.registry().get(cluster_name)
+    print_colour(f"Reading hub-health service tokens on {cluster_name}...")
+    with cluster.auth():
+        tokens = get_hub_health_api_tokens()
+        # The revisions only label the health history, so checks can run
+        # without them
+        try:
+            revisions = get_release_revisions()
+        except (subprocess.CalledProcessError, ValueError) as e:
+            print_colour(
+                f"Failed to read the helm release revisions on {cluster_name}: {e}",
+                "yellow",
+            )
+            revisions = {}
+    return tokens, revisions
+
+
+def get_health_check_targets(hubs):
+    """
+    Gather what is needed to check the health of `hubs`, authenticating with each
+    of their clusters once, all clusters at the same time, to read the API tokens
+    of their hub-health services and the revisions of their helm releases.
+
+    Args:
+        hubs (list[str]): Hubs as <cluster>/<hub>, or just <cluster> for all hubs
+            of a cluster. All hubs of all clusters are checked when empty.
+
+    Returns:
+        tuple[list[dict], list[dict]]: The checks to run, one dict per hub with
+            its "cluster", "hub", "url", "revision", "type" and "token", and the
+            results of the hubs that can't be checked, as "skipped" or "failed"
+    """
+    clusters = Cluster.get_all()
+    hub_names_per_cluster = {}
+    for target in hubs or clusters.names:
+        cluster_name, _, hub_name = target.partition("/")
+        cluster_hub_names = hub_names_per_cluster.setdefault(cluster_name, [])
+        if cluster_hub_names is not None:
+            if hub_name:
+                cluster_hub_names.append(hub_name)
+            else:
+                # All hubs of the cluster
+                hub_names_per_cluster[cluster_name] = None
+
+    secrets = run_in_parallel(
+        [
+            (cluster_name, _read_health_check_secrets_in_worker, (cluster_name,))
+            for cluster_name in hub_names_per_cluster
+        ],
+        os.cpu_count() or 1,
+        fail_fast=False,
+    )
+
+    checks = []
+    results = []
+    for (cluster_name, hub_names), cluster_secrets in zip(
+        hub_names_per_cluster.items(), secrets
+    ):
+        cluster = clusters.get(cluster_name)
+        cluster_hubs = (
+            cluster.hubs
+            if hub_names is None
+            else [cluster.get_hub(hub_name) for hub_name in hub_names]
+        )
+        tokens, revisions = cluster_secrets["result"] or ({}, {})
+
+        for hub in cluster_hubs:
+            result = {
+                "cluster": cluster_name,
+                "hub": hub.spec["name"],
+                "url": get_hub_url(hub),
+                "revision": revisions.get((hub.spec["name"], hub.spec["name"])),
+                "status": "skipped",
+                "duration": None,
+                "error": None,
+                "notebooks": [],
+            }
+            # Skip the regular hub health check for hubs with binderhub ui that
+            # are not authenticated
+            if hub.binderhub_ui and hub.authenticator == "null":
+                result["error"] = "Testing this hub is not supported yet"
+            elif cluster_secrets["error"]:
+                result["status"] = "failed"
+                result["error"] = (
+                    f"Failed to read the hub-health service tokens of the cluster: {cluster_secrets['error']}"
+                )
+            elif hub.spec["name"] not in tokens:
+                result["status"] = "failed"
+                result["error"] = (
+                    "Failed to acquire a JupyterHub API token for the hub-health service"
+                )
+            else:
+                checks.append(
+                    {
+                        **result,
+                        "type": hub.type,
+                        "token": tokens[hub.spec["name"]],
+                    }
+                )
+                continue
+            results.append(result)
+
+    return checks, results
+
+
+@app.command(rich_help_panel=CONTINUOUS_DEPLOYMENT)
+def run_health_checks(
+    hubs: list[str] = typer.Argument(
+        ...,
+        help="Hubs to check, as <cluster>/<hub>, or just <cluster> to check all hubs of a cluster",
+    ),
+    concurrency: int = typer.Option(
+        10, min=1, help="Number of hubs to check at the same time"
+    ),
+    attempts: int = typer.Option(
+        3, help="Number of failures before declaring a hub unhealthy"
+    ),
+    attempt_timeout_s: int = typer.Option(
+        600, help="Number of seconds before giving up on an attempt"
+    ),
+    output: Path = typer.Option(
+        None, help="File to write the JSON summary to, instead of printing it"
+    ),
+    verbose: bool = typer.Option(False, help="Print traceback on error"),
+    notebook_mode: NotebookMode = typer.Option(
+        NotebookMode.SEQUENTIAL,
+        help="Run the test notebooks of each hub one after another on fresh servers (sequential), one after another on the same server (shared-server), or all at once on servers of separate users (concurrent)",
+    ),
+):
+    """
+    Run health checks on many hubs, across any number of clusters, at the same
+    time. Each cluster is authenticated with once, all of them in parallel, to
+    read the API tokens the checks need, and the checks themselves all run on a single event loop.
+
+    A JSON summary with the status and duration of the check of every hub is
+    printed (or written to `--output`) at the end.
+    """
+    checks, results = get_health_check_targets(hubs)
+
+    results += asyncio.run(
+        run_health_checks_concurrently(
+            checks, concurrency, attempts, attempt_timeout_s, verbose, notebook_mode
+        )
+    )
+
+    record_notebook_checks(results, notebook_mode)
+
+    summary = print_health_check_summary(results, "Hub health checks", output)
+    if summary["failed"]:
+        sys.exit(1)
+
+
+def record_notebook_checks(results, notebook_mode):
+    """
+    Add the results of notebook health checks that ran to the health history
+    """
+    for result in results:
+        if result["status"] != "skipped":
+            record_health_check(
+                result["cluster"],
+                result["hub"],
+                {**result, "notebook_mode": notebook_mode.value},
+            )
+
+
+def print_health_check_summary(results, title, output=None):
+    """
+    Print a table of how long checking each hub took, and a JSON summary of the
+    results (or write it to `output`).
+
+    Returns:
+        dict: The summary, with the number of hubs that "passed", "failed" or
+            were "skipped", and the results of all "hubs"
+    """
+    print_timing_table(
+        [
+            {
+                "name": f"{r['cluster']}/{r['hub']}",
+                "status": r["status"],
+                "duration": r["duration"],
+            }
+            for r in results
+        ],
+        title=title,
+    )
+    summary = {
+        "passed": sum(r["status"] == "passed" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+        "skipped": sum(r["status"] == "skipped" for r in results),
+        "hubs": results,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(summary, f, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
+    return summary
+
+
+@app.command(rich_help_panel=CONTINUOUS_DEPLOYMENT)
+def probe_hubs(
+    hubs: list[str] = typer.Argument(
+        None,
+        help="Hubs to probe, as <cluster>/<hub>, or just <cluster> to probe all hubs of a cluster. Probes all hubs of all clusters when left out.",
+    ),
+    concurrency: int = typer.Option(
+        50, min=1, help="Number of hubs to probe at the same time"
+    ),
+    timeout_s: float = typer.Option(
+        10, help="Number of seconds before giving up on a single request"
+    ),
+    run_notebooks_on_failure: bool = typer.Option(
+        False,
+        help="Run the full health check, with test notebooks, on hubs that failed a probe",
+    ),
+    attempts: int = typer.Option(
+        3,
+        help="Number of failures of a full health check before declaring a hub unhealthy",
+    ),
+    attempt_timeout_s: int = typer.Option(
+        600,
+        help="Number of seconds before giving up on an attempt of a full health check",
+    ),
+    output: Path = typer.Option(
+        None, help="File to write the JSON summary to, instead of printing it"
+    ),
+    verbose: bool = typer.Option(False, help="Print traceback on error"),
+    notebook_mode: NotebookMode = typer.Option(
+        NotebookMode.SEQUENTIAL,
+        help="How to run the test notebooks of full health checks, see run-health-checks",
+    ),
+):
+    """
+    Quickly check many hubs, by probing their JupyterHub API, proxy routes and
+    dask-gateway API with the hub-health service token, without starting any
+    user servers.
+
+    With `--run-notebooks-on-failure`, hubs that fail a probe get the full health
+    check, and their status is the one of that check. A JSON summary with the
+    results of every hub is printed (or written to `--output`) at the end.
+    """
+    checks, results = get_health_check_targets(hubs)
+
+    with tracing.span("probe hubs"):
+        probe_results = asyncio.run(
+            probe_hubs_concurrently(checks, concurrency, timeout_s)
+        )
+
+    failed_checks = []
+    for check, probes in zip(checks, probe_results):
+        errors = [
+            f"{name}: {probe['error']}"
+            for name, probe in probes.items()
+            if probe["status"] == "failed"
+        ]
+        result = {
+            k: v for k, v in check.items() if k not in ["type", "token", "notebooks"]
+        }
+        result.update(
+            {
+                "status": "failed" if errors else "passed",
+                # The probes of a hub run at the same time
+                "duration": max(p["duration"] for p in probes.values()),
+                "error": "; ".join(errors) or None,
+                "probes": probes,
+            }
+        )
+        results.append(result)
+        if errors:
+            failed_checks.append(check)
+
+    if run_notebooks_on_failure and failed_checks:
+        print_colour(
+            f"Running full health checks on {len(failed_checks)} hubs that failed a probe...",
+            "yellow",
+        )
+        notebook_results = asyncio.run(
+            run_health_checks_concurrently(
+                failed_checks,
+                concurrency,
+                attempts,
+                attempt_timeout_s,
+                verbose,
+                notebook_mode,
+            )
+        )
+        record_notebook_checks(notebook_results, notebook_mode)
+        notebook_results = {(r["cluster"], r["hub"]): r for r in notebook_results}
+        for result in results:
+            notebook_result = notebook_results.get((result["cluster"], result["hub"]))
+            if notebook_result:
+                result["status"] = notebook_result["status"]
+                result["notebook_check"] = notebook_result
+
+    summary = print_health_check_summary(results, "Hub probes", output)
+    if summary["failed"]:
+        sys.exit(1)
+
+
+@app.command(rich_help_panel=CONTINUOUS_DEPLOYMENT)
+def health_history(
+    cluster_name: str = typer.Argument(
+        None, help="Name of cluster to show the health check history of"
+    ),
+    hub_name: str = typer.Argument(
+        None, help="Name of hub to show the health check history of"
+    ),
+):
+    """
+    Show percentiles of how long the recorded health checks of hubs took, per
+    phase of running their test notebooks, and the phases that got slower since
+    the deploy before the latest one.
+    """
+    history = load_health_history(cluster_name, hub_name)
+    if not history:
+        print_colour("No health checks have been recorded yet", "yellow")
+        return
+
+    percentiles = (50, 90, 99)
+    for (cluster, hub), records in history.items():
+        summary = summarize_health_history(records, percentiles)
+        table = Table(
+            title=f"{cluster}/{hub}: {summary['checks']} checks, {summary['failures']} failed"
+        )
+        table.add_column("Phase")
+        for p in percentiles:
+            table.add_column(f"p{p}", justify="right")
+        for key, phase_percentiles in summary["percentiles"].items():
+            table.add_row(
+                key.replace("_", " ").capitalize(),
+                *(f"{phase_percentiles[p]:0.1f}s" for p in percentiles),
+            )
+        Console().print(table)
+        for regression in summary["regressions"]:
+            print_colour(f"{cluster}/{hub} regressed: {regression}", "red")
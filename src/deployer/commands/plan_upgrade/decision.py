@@ -5,20 +5,24 @@ added or modified in a GitHub Pull Request.
 """
 
 import fnmatch
+import os
+from pathlib import Path
 
 from rich.console import Console
 from rich.table import Table
-from ruamel.yaml import YAML
 
+from deployer.utils.file_acquisition import REPO_ROOT_PATH
 from deployer.utils.rendering import print_colour
-
-yaml = YAML(typ="safe", pure=True)
+from deployer.utils.yaml_loader import load_yaml
 
 
 def discover_modified_common_files(modified_paths):
     """There are certain common files which, if modified, we should upgrade all hubs
-    and/or all clusters appropriately. These common files include the helm charts we
-    deploy, as well as the GitHub Actions and deployer package we use to deploy them.
+    and/or all clusters appropriately. These common files include the support helm
+    chart, as well as the GitHub Actions and deployer package we use to deploy them.
+
+    Changes to the basehub and daskhub helm charts are not considered here, as
+    they only affect the hubs deployed with them (see `get_modified_chart_files`).
 
     Args:
         modified_paths (list[str]): The list of files that have been added or modified
@@ -52,6 +56,12 @@ def discover_modified_common_files(modified_paths):
         "deployer.dev.commands/*",
         # We don't want to handle support in this clause
         support_chart_pattern,
+        # Only hubs deployed with these charts need upgrading when they change
+        "helm-charts/basehub/*",
+        "helm-charts/daskhub/*",
+        # The hub image is built and published separately, and only used by hubs
+        # once its new tag is set in the basehub chart
+        "helm-charts/images/*",
     ]
 
     # Discover if the support chart has been modified
@@ -115,6 +125,73 @@ def discover_modified_iaac_files(modified_paths):
     return health_check
 
 
+def get_modified_chart_files(
+    cluster_file, hub, modified_charts, added_or_modified_files
+):
+    """Find the modified files of the helm chart a hub is deployed with.
+
+    Every hub is deployed with the basehub chart, legacy daskhubs through the daskhub
+    chart that depends on it. Hubs with a `chart_override` use their own Chart.yaml
+    file in place of the basehub one.
+
+    Args:
+        cluster_file (path obj): The absolute path to the cluster.yaml file of the
+            hub's cluster
+        hub (dict): The config of the hub from the cluster.yaml file
+        modified_charts (dict): Maps the name of each modified chart to its
+            modified files, as found with `find_modified_charts`
+        added_or_modified_files (set[path obj]): A set of all added or modified
+            files provided in a GitHub Pull Request
+
+    Returns:
+        list[str]: The modified files of the chart, relative to the root of the
+            repository
+    """
+    modified_files = list(modified_charts.get("basehub", []))
+    if hub.get("helm_chart") == "daskhub":
+        modified_files += modified_charts.get("daskhub", [])
+
+    chart_override = hub.get("chart_override")
+    if chart_override:
+        # As in `get_hub_chart_override`, paths with a / are relative to the
+        # root of the repository rather than to the cluster's directory
+        chart_override_path = (
+            REPO_ROOT_PATH if "/" in chart_override else cluster_file.parent
+        ) / chart_override
+        modified_files = [
+            f for f in modified_files if f != "helm-charts/basehub/Chart.yaml"
+        ]
+        if chart_override_path in added_or_modified_files:
+            modified_files.append(os.path.relpath(chart_override_path, REPO_ROOT_PATH))
+    return modified_files
+
+
+def get_choice_reason(
+    modified_values_files, modified_imports, modified_chart_files=None
+):
+    """Describe why a hub or support chart needs upgrading, given the values files,
+    the files imported by jsonnet values files, and the files of the helm chart it
+    is deployed with that have been modified.
+    """
+    reasons = []
+    if modified_chart_files:
+        reasons.append(
+            "Following helm chart files were modified: "
+            + ", ".join(modified_chart_files)
+        )
+    if modified_values_files:
+        reasons.append(
+            "Following helm chart values files were modified: "
+            + ", ".join([Path(path).name for path in modified_values_files])
+        )
+    if modified_imports:
+        reasons.append(
+            "Following files imported by helm chart values files were modified: "
+            + ", ".join([Path(path).name for path in modified_imports])
+        )
+    return "; ".join(reasons)
+
+
 def filter_out_staging_hubs(all_hub_matrix_jobs):
     """Separate staging hubs from prod hubs in hub matrix jobs.
 
@@ -150,6 +227,8 @@ def generate_hub_matrix_jobs(
     pr_labels=None,
     upgrade_all_hubs_on_this_cluster=False,
     upgrade_all_hubs_on_all_clusters=False,
+    modified_imports=None,
+    modified_charts=None,
 ):
     """Generate a list of dictionaries describing which hubs on a given cluster need
     to undergo a helm upgrade based on whether their associated helm chart values
@@ -175,6 +254,12 @@ def generate_hub_matrix_jobs(
         upgrade_all_hubs_on_all_clusters (bool, optional): If True, generates jobs to
             upgrade all hubs on all clusters. This is triggered when common config has
             been modified, such as the basehub or daskhub helm charts. Defaults to False.
+        modified_imports (dict[str, list], optional): The modified files imported by
+            each hub's jsonnet values files, keyed by hub name, as found with
+            `find_dependents`. Defaults to None.
+        modified_charts (dict[str, list], optional): The modified files of each
+            helm chart, keyed by chart name, as found with `find_modified_charts`.
+            Defaults to None.
 
     Returns:
         list[dict]: A list of dictionaries. Each dictionary contains: the name of a
@@ -213,19 +298,22 @@ def generate_hub_matrix_jobs(
                 cluster_file.parent.joinpath(values_file)
                 for values_file in hub.get("helm_chart_values_files", {})
             ]
-            # Establish if any of this hub's helm chart values files have been
-            # modified
+            # Establish if any of this hub's helm chart values files, files they
+            # import, or files of the chart it is deployed with have been modified
             intersection = added_or_modified_files.intersection(values_files)
+            imports = (modified_imports or {}).get(hub["name"], [])
+            chart_files = get_modified_chart_files(
+                cluster_file, hub, modified_charts or {}, added_or_modified_files
+            )
 
-            if intersection:
+            if intersection or imports or chart_files:
                 # If at least one of the helm chart values files associated with
                 # this hub has been modified, add it to list of matrix jobs to be
                 # upgraded
                 matrix_job = cluster_info.copy()
                 matrix_job["hub_name"] = hub["name"]
-                matrix_job["choice_reason"] = (
-                    "Following helm chart values files were modified: "
-                    + ", ".join([path.name for path in intersection])
+                matrix_job["choice_reason"] = get_choice_reason(
+                    intersection, imports, chart_files
                 )
                 matrix_jobs.append(matrix_job)
 
@@ -269,6 +357,7 @@ def generate_support_matrix_jobs(
     pr_labels=None,
     upgrade_support_on_this_cluster=False,
     upgrade_support_on_all_clusters=False,
+    modified_imports=None,
 ):
     """Generate a list of dictionaries describing which clusters need to undergo a helm
     upgrade of their support chart based on whether their associated support chart
@@ -294,6 +383,9 @@ def generate_support_matrix_jobs(
         upgrade_support_on_all_clusters (bool, optional): If True, generates jobs to
             update the support chart on all clusters. This is triggered when common
             config has been modified in the support helm chart. Defaults to False.
+        modified_imports (list, optional): The modified files imported by the
+            support chart's jsonnet values files, as found with `find_dependents`.
+            Defaults to None.
 
     Returns:
         list[dict]: A list of dictionaries. Each dictionary contains: the name of a
@@ -343,11 +435,10 @@ def generate_support_matrix_jobs(
             ]
             intersection = added_or_modified_files.intersection(values_files)
 
-            if intersection:
+            if intersection or modified_imports:
                 matrix_job = cluster_info.copy()
-                matrix_job["choice_reason"] = (
-                    "Following helm chart values files were modified: "
-                    + ", ".join([path.name for path in intersection])
+                matrix_job["choice_reason"] = get_choice_reason(
+                    intersection, modified_imports or []
                 )
                 matrix_jobs.append(matrix_job)
 
@@ -358,7 +449,7 @@ def generate_support_matrix_jobs(
 
 
 def assign_staging_jobs_for_missing_clusters(
-    staging_hub_matrix_jobs, prod_hub_matrix_jobs
+    staging_hub_matrix_jobs, prod_hub_matrix_jobs, cluster_configs=None
 ):
     """Ensure that for each cluster listed in prod_hub_matrix_jobs, there is an
     associated job in staging_hub_matrix_jobs. This is our last-hope catch-all
@@ -370,6 +461,9 @@ def assign_staging_jobs_for_missing_clusters(
             jobs to upgrade staging hubs on clusters that require it.
         prod_hub_matrix_jobs (list[dict]): A list of dictionaries representing
             jobs to upgrade production hubs that require it.
+        cluster_configs (dict, optional): The config of each cluster, keyed by
+            cluster name, as found in the dependency index. Read from the
+            cluster.yaml files of the missing clusters when not given.
 
     Returns:
         staging_hub_matrix_jobs (list[dict]): Updated to ensure any clusters
@@ -400,18 +494,21 @@ def assign_staging_jobs_for_missing_clusters(
                 if hub["cluster_name"] == missing_cluster
             ]
 
-            # HACK: This is here because the unit test for testing helm upgrade
-            # decisions tries to mock this global variable. Having to mock things
-            # that we control is always problematic. This whole file needs to be
-            # refactored to be far less indirect. Moving this import here
-            # lets us do that as part of a separate PR
-            from deployer.utils.file_acquisition import CONFIG_CLUSTERS_PATH
-
-            cluster_config_path = (
-                CONFIG_CLUSTERS_PATH / missing_cluster / "cluster.yaml"
-            )
-            with open(cluster_config_path) as f:
-                cluster_config = yaml.load(f)
+            if cluster_configs is not None:
+                cluster_config = cluster_configs[missing_cluster]
+            else:
+                # HACK: This is here because the unit test for testing helm upgrade
+                # decisions tries to mock this global variable. Having to mock things
+                # that we control is always problematic. This whole file needs to be
+                # refactored to be far less indirect. Moving this import here
+                # lets us do that as part of a separate PR
+                from deployer.utils.file_acquisition import CONFIG_CLUSTERS_PATH
+
+                cluster_config_path = (
+                    CONFIG_CLUSTERS_PATH / missing_cluster / "cluster.yaml"
+                )
+                with open(cluster_config_path) as f:
+                    cluster_config = load_yaml(f)
 
             staging_hubs = [
                 hub["name"]
@@ -433,6 +530,80 @@ def assign_staging_jobs_for_missing_clusters(
     return staging_hub_matrix_jobs
 
 
+def shard_hub_matrix_jobs(hub_matrix_jobs, shards_per_cluster, get_expected_duration):
+    """Combine the jobs upgrading hubs on the same cluster into at most
+    `shards_per_cluster` jobs per cluster, so each cluster is authenticated
+    against once per shard rather than once per hub.
+
+    Hubs are assigned to shards by expected deploy duration, longest first, each
+    to the shard with the least expected work so far, so the shards of a cluster
+    take about as long as each other.
+
+    Args:
+        hub_matrix_jobs (list[dict]): Jobs to upgrade a single hub each
+        shards_per_cluster (int): The most jobs to make per cluster
+        get_expected_duration (Callable[[str, str], float]): Takes a cluster and
+            hub name and returns how long deploying the hub is expected to take,
+            as returned by `deployer.utils.deploy_stats.get_expected_durations`
+
+    Returns:
+        sharded_matrix_jobs (list[dict]): Jobs in the same format, except that
+            "hub_name" is replaced by "hub_names", the list of the hubs to
+            upgrade, so they can all be passed to `deployer deploy` at once. An
+            "expected_duration" key holds the expected duration of the shard in
+            seconds.
+    """
+    jobs_per_cluster = {}
+    for job in hub_matrix_jobs:
+        jobs_per_cluster.setdefault(job["cluster_name"], []).append(job)
+
+    sharded_matrix_jobs = []
+    for cluster_name, jobs in jobs_per_cluster.items():
+        shards = [
+            {"jobs": [], "expected_duration": 0}
+            for _ in range(min(shards_per_cluster, len(jobs)))
+        ]
+        for job in sorted(
+            jobs,
+            key=lambda job: get_expected_duration(cluster_name, job["hub_name"]),
+            reverse=True,
+        ):
+            shard = min(shards, key=lambda shard: shard["expected_duration"])
+            shard["jobs"].append(job)
+            shard["expected_duration"] += get_expected_duration(
+                cluster_name, job["hub_name"]
+            )
+
+        for shard in shards:
+            # Keep the hubs in the order they were planned in
+            shard_jobs = sorted(shard["jobs"], key=jobs.index)
+            reasons = list(dict.fromkeys(job["choice_reason"] for job in shard_jobs))
+            sharded_matrix_jobs.append(
+                {
+                    "cluster_name": cluster_name,
+                    "provider": shard_jobs[0]["provider"],
+                    "hub_names": [job["hub_name"] for job in shard_jobs],
+                    "choice_reason": (
+                        reasons[0]
+                        if len(reasons) == 1
+                        else "; ".join(
+                            f"{job['hub_name']}: {job['choice_reason']}"
+                            for job in shard_jobs
+                        )
+                    ),
+                    "expected_duration": round(shard["expected_duration"]),
+                }
+            )
+
+    return sharded_matrix_jobs
+
+
+def get_hub_names(hub_matrix_job):
+    """Return the names of the hubs upgraded by a job, whether it was sharded by
+    `shard_hub_matrix_jobs` or not"""
+    return hub_matrix_job.get("hub_names") or [hub_matrix_job["hub_name"]]
+
+
 def pretty_print_matrix_jobs(
     staging_hub_matrix_jobs, prod_hub_matrix_jobs, support_matrix_jobs=[]
 ):
@@ -463,7 +634,7 @@ def pretty_print_matrix_jobs(
         staging_hub_table.add_row(
             job["provider"],
             job["cluster_name"],
-            job["hub_name"],
+            ", ".join(get_hub_names(job)),
             job["choice_reason"],
             end_section=True,
         )
@@ -480,7 +651,7 @@ def pretty_print_matrix_jobs(
         prod_hub_table.add_row(
             job["provider"],
             job["cluster_name"],
-            job["hub_name"],
+            ", ".join(get_hub_names(job)),
             job["choice_reason"],
             end_section=True,
         )
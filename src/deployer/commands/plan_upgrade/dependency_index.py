@@ -0,0 +1,357 @@
+"""
+A reverse index from files in the repository to the clusters, hubs and support
+charts that depend on them, so deciding what a set of changed files affects is a
+lookup per changed file rather than a pass over every cluster.yaml file.
+
+The index is built from the cluster.yaml files and the per-cluster terraform and
+eksctl files, following the imports of jsonnet files among them. It is cached on
+disk keyed by the git tree hashes of the directories those files are in. Imported
+files, and the values.jsonnet files of our helm charts, can live outside those
+directories, so the hashes of their contents are kept in the index and checked
+before a cached index is used.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+
+from deployer.utils import file_acquisition
+from deployer.utils.file_acquisition import REPO_ROOT_PATH, get_all_cluster_yaml_files
+from deployer.utils.jsonnet import find_jsonnet_imports
+from deployer.utils.yaml_loader import load_yaml
+
+DEPENDENCY_INDEX_CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    / "2i2c-deployer"
+    / "dependency-index"
+)
+
+# Bump this when the structure of the index changes, so cached indexes built by
+# older versions of the deployer are not used
+INDEX_VERSION = 4
+
+# The helm charts in the helm-charts directory we deploy. Other directories in it,
+# like the one for the hub image, are not deployed directly.
+CHARTS = ["basehub", "daskhub", "support"]
+
+
+def _relpath(path):
+    return Path(os.path.relpath(path, REPO_ROOT_PATH)).as_posix()
+
+
+def get_real_provider(cluster_config):
+    """
+    Return the cloud provider a cluster runs on. Clusters we access with a
+    kubeconfig file are recognised by the URL of their provider's console.
+    """
+    provider = cluster_config.get("provider", "")
+    if provider == "kubeconfig":
+        provider_url = cluster_config.get("provider_url", "")
+        if "azure" in provider_url:
+            return "azure"
+        elif "jetstream" in provider_url:
+            return "openstack"
+    return provider
+
+
+def _get_terraform_files(cluster_name, real_provider):
+    if real_provider != "kubeconfig":
+        candidates = [f"terraform/{real_provider}/projects/{cluster_name}.tfvars"]
+    else:
+        # It might be azure or jetstream2, so we check both
+        candidates = [
+            f"terraform/openstack/projects/{cluster_name}.tfvars",
+            f"terraform/azure/projects/{cluster_name}.tfvars",
+        ]
+    return [p for p in candidates if (REPO_ROOT_PATH / p).is_file()]
+
+
+def _hash_file(path):
+    return hashlib.sha256((REPO_ROOT_PATH / path).read_bytes()).hexdigest()
+
+
+def _get_jsonnet_imports(jsonnet_file):
+    """
+    Return all files imported, directly or transitively, by `jsonnet_file`,
+    resolving imports with the same `--jpath` as `render_jsonnet` uses.
+
+    Encrypted files are skipped, as their imports can't be read without
+    decrypting them.
+    """
+    jsonnet_file = Path(jsonnet_file)
+    if (
+        jsonnet_file.suffix != ".jsonnet"
+        or "secret" in jsonnet_file.name
+        or not jsonnet_file.is_file()
+    ):
+        return set()
+    return find_jsonnet_imports(jsonnet_file, [str(jsonnet_file.parent)])
+
+
+def build_dependency_index():
+    """
+    Build the dependency index by reading every cluster.yaml file.
+
+    Returns:
+        dict: With the keys
+
+            - "clusters": maps each cluster's name to a dict with its
+              "cluster_file", "provider", "real_provider" and a "config" holding
+              the parts of its cluster.yaml needed for planning (the name and
+              values files of its hubs and support chart)
+            - "dependents": maps the path of each file, relative to the root of
+              the repository, to a list of dicts with the "cluster" depending on
+              it, the "kind" of dependency ("cluster" for the cluster.yaml file,
+              "hub", "support", "terraform" or "eksctl" for files referred to
+              directly, or "hub_import" and "support_import" for files imported
+              by jsonnet values files) and for hubs the "hub" name
+            - "chart_imports": maps the path of each file imported by the
+              values.jsonnet file of one of our helm charts to the names of the
+              charts importing it
+            - "imports": maps the path of each file imported by jsonnet files,
+              and of the values.jsonnet files of our helm charts, to the
+              sha256 hash of its contents
+    """
+    clusters = {}
+    dependents = {}
+    chart_imports = {}
+    imports = {}
+
+    def add(path, **dependent):
+        path_dependents = dependents.setdefault(_relpath(path), [])
+        if dependent not in path_dependents:
+            path_dependents.append(dependent)
+
+    def add_imports(jsonnet_file, **dependent):
+        for imported_file in _get_jsonnet_imports(jsonnet_file):
+            imports[_relpath(imported_file)] = _hash_file(imported_file)
+            add(imported_file, **dependent)
+
+    for cluster_file in sorted(get_all_cluster_yaml_files()):
+        cluster_config = load_yaml(cluster_file)
+        cluster_name = cluster_config.get("name", {})
+        config = {
+            "name": cluster_name,
+            "provider": cluster_config.get("provider", {}),
+            "hubs": [
+                {
+                    "name": hub["name"],
+                    "helm_chart": hub.get("helm_chart"),
+                    "chart_override": hub.get("chart_override"),
+                    "helm_chart_values_files": hub.get("helm_chart_values_files", []),
+                }
+                for hub in cluster_config.get("hubs", [])
+            ],
+        }
+        if cluster_config.get("support"):
+            config["support"] = {
+                "helm_chart_values_files": cluster_config["support"].get(
+                    "helm_chart_values_files", []
+                )
+            }
+        real_provider = get_real_provider(cluster_config)
+        clusters[cluster_name] = {
+            "cluster_file": _relpath(cluster_file),
+            "provider": config["provider"],
+            "real_provider": real_provider,
+            "config": config,
+        }
+
+        add(cluster_file, cluster=cluster_name, kind="cluster")
+        for hub in config["hubs"]:
+            if hub["chart_override"]:
+                # Paths with a / are relative to the root of the repository, as in
+                # `get_hub_chart_override`
+                chart_override_path = (
+                    REPO_ROOT_PATH
+                    if "/" in hub["chart_override"]
+                    else cluster_file.parent
+                ) / hub["chart_override"]
+                add(
+                    chart_override_path,
+                    cluster=cluster_name,
+                    kind="hub",
+                    hub=hub["name"],
+                )
+            for values_file in hub["helm_chart_values_files"]:
+                add(
+                    cluster_file.parent / values_file,
+                    cluster=cluster_name,
+                    kind="hub",
+                    hub=hub["name"],
+                )
+                add_imports(
+                    cluster_file.parent / values_file,
+                    cluster=cluster_name,
+                    kind="hub_import",
+                    hub=hub["name"],
+                )
+        for values_file in config.get("support", {}).get("helm_chart_values_files", []):
+            add(cluster_file.parent / values_file, cluster=cluster_name, kind="support")
+            add_imports(
+                cluster_file.parent / values_file,
+                cluster=cluster_name,
+                kind="support_import",
+            )
+        for terraform_file in _get_terraform_files(cluster_name, real_provider):
+            add(REPO_ROOT_PATH / terraform_file, cluster=cluster_name, kind="terraform")
+        eksctl_file = REPO_ROOT_PATH / "eksctl" / f"{cluster_name}.jsonnet"
+        if eksctl_file.is_file():
+            add(eksctl_file, cluster=cluster_name, kind="eksctl")
+            add_imports(eksctl_file, cluster=cluster_name, kind="eksctl")
+
+    for chart in CHARTS:
+        chart_values_file = file_acquisition.HELM_CHARTS_DIR / chart / "values.jsonnet"
+        if chart_values_file.is_file():
+            # The charts aren't in the git trees cached indexes are keyed by, so
+            # their values.jsonnet files are checked like imports, as changing
+            # them can change what they import
+            imports[_relpath(chart_values_file)] = _hash_file(chart_values_file)
+        for imported_file in _get_jsonnet_imports(chart_values_file):
+            imports[_relpath(imported_file)] = _hash_file(imported_file)
+            chart_imports.setdefault(_relpath(imported_file), []).append(chart)
+
+    return {
+        "clusters": clusters,
+        "dependents": dependents,
+        "chart_imports": chart_imports,
+        "imports": imports,
+    }
+
+
+def _get_tree_key():
+    """
+    Return a key identifying the contents of every directory the index is built
+    from, or None if that can't be determined (for example because some of them
+    have uncommitted changes, or we are not in a git repository).
+    """
+    indexed_paths = [
+        _relpath(file_acquisition.CONFIG_CLUSTERS_PATH),
+        "terraform",
+        "eksctl",
+    ]
+    try:
+        trees = subprocess.check_output(
+            ["git", "rev-parse", *(f"HEAD:{p}" for p in indexed_paths)],
+            cwd=REPO_ROOT_PATH,
+            text=True,
+            stderr=subprocess.DEVNULL,
+        )
+        uncommitted = subprocess.check_output(
+            ["git", "status", "--porcelain", "--", *indexed_paths],
+            cwd=REPO_ROOT_PATH,
+            text=True,
+            stderr=subprocess.DEVNULL,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    if uncommitted.strip():
+        return None
+    key = json.dumps([INDEX_VERSION, indexed_paths, trees.split()])
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def get_dependency_index():
+    """
+    Return the dependency index described in `build_dependency_index`, reusing a
+    cached copy when one was built from the same git trees.
+    """
+    key = _get_tree_key()
+    if key is None:
+        return build_dependency_index()
+
+    cache_file = DEPENDENCY_INDEX_CACHE_DIR / f"{key}.json"
+    try:
+        with open(cache_file) as f:
+            index = json.load(f)
+        if all(
+            _hash_file(path) == file_hash
+            for path, file_hash in index["imports"].items()
+        ):
+            return index
+    except (OSError, json.JSONDecodeError):
+        pass
+
+    index = build_dependency_index()
+    DEPENDENCY_INDEX_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=DEPENDENCY_INDEX_CACHE_DIR, prefix=f".{key}-", suffix=".json"
+    )
+    with os.fdopen(fd, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, cache_file)
+    return index
+
+
+def find_dependents(index, changed_paths):
+    """
+    Find what depends on each of `changed_paths`.
+
+    Args:
+        index (dict): A dependency index as returned by `get_dependency_index`
+        changed_paths (list[str | Path]): Paths of changed files, either absolute
+            or relative to the root of the repository
+
+    Returns:
+        dict: Maps the name of every affected cluster to a dict with the lists of
+            changed paths it depends on, grouped by kind of dependency under the
+            "cluster", "support", "support_imports", "terraform" and "eksctl"
+            keys, and per hub name under the "hubs" and "hub_imports" keys
+    """
+    affected = {}
+    for path in changed_paths:
+        path = _relpath(REPO_ROOT_PATH / path)
+        for dependent in index["dependents"].get(path, []):
+            cluster = affected.setdefault(
+                dependent["cluster"],
+                {
+                    "cluster": [],
+                    "support": [],
+                    "support_imports": [],
+                    "terraform": [],
+                    "eksctl": [],
+                    "hubs": {},
+                    "hub_imports": {},
+                },
+            )
+            kind = dependent["kind"]
+            if kind == "hub":
+                cluster["hubs"].setdefault(dependent["hub"], []).append(path)
+            elif kind == "hub_import":
+                cluster["hub_imports"].setdefault(dependent["hub"], []).append(path)
+            elif kind == "support_import":
+                cluster["support_imports"].append(path)
+            else:
+                cluster[kind].append(path)
+    return affected
+
+
+def find_modified_charts(index, changed_paths):
+    """
+    Find which of our helm charts are affected by `changed_paths`, either because
+    they are files of the chart, or files imported by its values.jsonnet file.
+
+    Args:
+        index (dict): A dependency index as returned by `get_dependency_index`
+        changed_paths (list[str | Path]): Paths of changed files, either absolute
+            or relative to the root of the repository
+
+    Returns:
+        dict: Maps the name of every affected chart to the list of its changed
+            paths, relative to the root of the repository
+    """
+    charts_dir = _relpath(file_acquisition.HELM_CHARTS_DIR)
+    modified_charts = {}
+    for path in changed_paths:
+        path = _relpath(REPO_ROOT_PATH / path)
+        charts = list(index["chart_imports"].get(path, []))
+        if path.startswith(f"{charts_dir}/"):
+            chart = path.removeprefix(f"{charts_dir}/").split("/")[0]
+            if chart in CHARTS and chart not in charts:
+                charts.append(chart)
+        for chart in charts:
+            modified_charts.setdefault(chart, []).append(path)
+    return modified_charts
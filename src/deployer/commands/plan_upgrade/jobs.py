@@ -2,10 +2,10 @@ import json
 import os
 
 import typer
-from ruamel.yaml import YAML
 
 from deployer.app import CONTINUOUS_DEPLOYMENT, app
-from deployer.utils.file_acquisition import REPO_ROOT_PATH, get_all_cluster_yaml_files
+from deployer.utils.deploy_stats import get_expected_durations
+from deployer.utils.file_acquisition import REPO_ROOT_PATH
 from deployer.utils.rendering import create_markdown_comment, print_colour
 
 from .decision import (
@@ -16,10 +16,13 @@ from .decision import (
     generate_provider_hub_matrix_jobs,
     generate_support_matrix_jobs,
     pretty_print_matrix_jobs,
+    shard_hub_matrix_jobs,
+)
+from .dependency_index import (
+    find_dependents,
+    find_modified_charts,
+    get_dependency_index,
 )
-
-# Without `pure=True`, I get an exception about str / byte issues
-yaml = YAML(typ="safe", pure=True)
 
 
 @app.command(rich_help_panel=CONTINUOUS_DEPLOYMENT)
@@ -34,78 +37,44 @@ def plan_health_check(
     """
     changed_filepaths = changed_filepaths.split(",")
 
-    # Convert changed filepaths into absolute Posix Paths
     changes_per_provider = discover_modified_iaac_files(changed_filepaths)
-    changed_filepaths = [
-        REPO_ROOT_PATH.joinpath(filepath) for filepath in changed_filepaths
-    ]
 
-    # Get a list of filepaths to all cluster.yaml files in the repo
-    cluster_files = get_all_cluster_yaml_files()
+    # Look up which clusters have their terraform or eksctl files modified
+    index = get_dependency_index()
+    affected_clusters = find_dependents(index, changed_filepaths)
 
     # Empty lists to store job definitions in
     staging_hub_matrix_jobs = []
     prod_hub_matrix_jobs = []
 
-    for cluster_file in cluster_files:
-        # Read in the cluster.yaml file
-        with open(cluster_file) as f:
-            cluster_config = yaml.load(f)
-
-        # Get cluster's name and its cloud provider
-        cluster_name = cluster_config.get("name", {})
-        provider = cluster_config.get("provider", {})
-        real_provider = provider
-        if provider == "kubeconfig":
-            provider_url = cluster_config.get("provider_url", "")
-            if "azure" in provider_url:
-                real_provider = "azure"
-            elif "jetstream" in provider_url:
-                real_provider = "openstack"
+    for cluster_name, cluster in index["clusters"].items():
+        real_provider = cluster["real_provider"]
+        affected = affected_clusters.get(cluster_name, {})
+        if not (
+            affected.get("terraform")
+            or affected.get("eksctl")
+            or changes_per_provider.get(real_provider)
+        ):
+            continue
 
         # Generate template dictionary for all jobs associated with this cluster
         cluster_info = {
             "cluster_name": cluster_name,
-            "provider": provider,
+            "provider": cluster["provider"],
             "choice_reason": "Core common infrastructure has been updated",
         }
 
         # Check if this cluster's terraform file has been modified. If so, set boolean flags to True
-        if real_provider != "kubeconfig":
-            terraform_file_paths = [
-                REPO_ROOT_PATH
-                / "terraform"
-                / real_provider
-                / "projects"
-                / f"{cluster_name}.tfvars"
-            ]
-        else:
-            print(real_provider)
-            # It might be azure or jetstream2, so we check both
-            terraform_file_paths = [
-                REPO_ROOT_PATH
-                / "terraform/openstack/projects"
-                / f"{cluster_name}.tfvars",
-                REPO_ROOT_PATH / "terraform/openstack/azure" / f"{cluster_name}.tfvars",
-            ]
-        for terraform_file_path in terraform_file_paths:
-            intersection = set(changed_filepaths).intersection([terraform_file_path])
-            if intersection:
-                break
-
-        if intersection:
+        check_all_hubs_on_this_cluster = False
+        if affected.get("terraform"):
             print_colour(
                 f"This cluster's terraform file has been modified. Generating jobs to run the health check against all hubs on this cluster: {cluster_name}"
             )
             check_all_hubs_on_this_cluster = True
             cluster_info["choice_reason"] = "terraform file was modified"
-        else:
-            check_all_hubs_on_this_cluster = False
 
         # If this is an AWS cluster, check if this cluster's eksctl file file has been modified. If so, set boolean flags to True
-        eksctl_file_path = REPO_ROOT_PATH / "eksctl" / f"{cluster_name}.jsonnet"
-        intersection = set(changed_filepaths).intersection([eksctl_file_path])
-        if intersection:
+        if affected.get("eksctl"):
             print_colour(
                 f"This cluster.yaml eksctl file has been modified. Generating jobs to run the health check against all hubs on this cluster: {cluster_name}"
             )
@@ -114,7 +83,7 @@ def plan_health_check(
 
         # Generate a job matrix of all hubs that need upgrading on this cluster
         staging_hubs, prod_hubs = generate_provider_hub_matrix_jobs(
-            cluster_config,
+            cluster["config"],
             cluster_info,
             real_provider,
             all_hubs_on_this_cluster=check_all_hubs_on_this_cluster,
@@ -125,7 +94,9 @@ def plan_health_check(
 
     # Clean up the matrix jobs
     staging_hub_matrix_jobs = assign_staging_jobs_for_missing_clusters(
-        staging_hub_matrix_jobs, prod_hub_matrix_jobs
+        staging_hub_matrix_jobs,
+        prod_hub_matrix_jobs,
+        {name: c["config"] for name, c in index["clusters"].items()},
     )
     # Pretty print the jobs using rich
     pretty_print_matrix_jobs(staging_hub_matrix_jobs, prod_hub_matrix_jobs)
@@ -160,6 +131,12 @@ def plan_upgrade(
         "[]",
         help="JSON formatted list of PR labels, where 'deployer:skip-deploy', 'deployer:skip-deploy-hubs', 'deployer:deploy-support', and 'deployer:deploy-hubs' are respected.",
     ),
+    prod_shards_per_cluster: int = typer.Option(
+        0,
+        "--prod-shards-per-cluster",
+        min=0,
+        help="When set, combine the production hub upgrades on each cluster into at most this many jobs, balanced by how long each hub took to deploy before. By default, there is one job per hub.",
+    ),
 ):
     """
     Analyze added or modified files and labels from a GitHub Pull Request and
@@ -180,37 +157,47 @@ def plan_upgrade(
         upgrade_all_hubs_on_all_clusters = True
 
     # Convert changed filepaths into absolute Posix Paths
-    changed_filepaths = [
+    changed_filepaths = {
         REPO_ROOT_PATH.joinpath(filepath) for filepath in changed_filepaths
-    ]
-
-    # Get a list of filepaths to all cluster.yaml files in the repo
-    cluster_files = get_all_cluster_yaml_files()
+    }
+
+    # Look up which clusters have files they depend on modified, and which of
+    # our charts are modified, so we only need to consider the clusters with
+    # hubs affected by those changes
+    index = get_dependency_index()
+    affected_clusters = find_dependents(index, changed_filepaths)
+    modified_charts = find_modified_charts(index, changed_filepaths)
+    if "support" in modified_charts:
+        upgrade_support_on_all_clusters = True
 
     # Empty lists to store job definitions in
     support_matrix_jobs = []
     staging_hub_matrix_jobs = []
     prod_hub_matrix_jobs = []
 
-    for cluster_file in cluster_files:
-        # Read in the cluster.yaml file
-        with open(cluster_file) as f:
-            cluster_config = yaml.load(f)
+    for cluster_name, cluster in index["clusters"].items():
+        if not (
+            upgrade_support_on_all_clusters
+            or upgrade_all_hubs_on_all_clusters
+            or cluster_name in affected_clusters
+            or "basehub" in modified_charts
+            or "daskhub" in modified_charts
+        ):
+            continue
 
-        # Get cluster's name and its cloud provider
-        cluster_name = cluster_config.get("name", {})
-        provider = cluster_config.get("provider", {})
+        cluster_file = REPO_ROOT_PATH / cluster["cluster_file"]
+        cluster_config = cluster["config"]
 
         # Generate template dictionary for all jobs associated with this cluster
         cluster_info = {
             "cluster_name": cluster_name,
-            "provider": provider,
+            "provider": cluster["provider"],
             "choice_reason": "",
         }
 
         # Check if this cluster file has been modified. If so, set boolean flags to True
-        intersection = set(changed_filepaths).intersection([str(cluster_file)])
-        if intersection:
+        affected = affected_clusters.get(cluster_name, {})
+        if affected.get("cluster"):
             print_colour(
                 f"This cluster.yaml file has been modified. Generating jobs to upgrade all hubs and the support chart on THIS cluster: {cluster_name}"
             )
@@ -226,10 +213,12 @@ def plan_upgrade(
             cluster_file,
             cluster_config,
             cluster_info,
-            set(changed_filepaths),
+            changed_filepaths,
             pr_labels,
             upgrade_all_hubs_on_this_cluster=upgrade_all_hubs_on_this_cluster,
             upgrade_all_hubs_on_all_clusters=upgrade_all_hubs_on_all_clusters,
+            modified_imports=affected.get("hub_imports"),
+            modified_charts=modified_charts,
         )
         staging_hub_matrix_jobs.extend(staging_hubs)
         prod_hub_matrix_jobs.extend(prod_hubs)
@@ -240,17 +229,24 @@ def plan_upgrade(
                 cluster_file,
                 cluster_config,
                 cluster_info,
-                set(changed_filepaths),
+                changed_filepaths,
                 pr_labels,
                 upgrade_support_on_this_cluster=upgrade_support_on_this_cluster,
                 upgrade_support_on_all_clusters=upgrade_support_on_all_clusters,
+                modified_imports=affected.get("support_imports"),
             )
         )
 
     # Clean up the matrix jobs
     staging_hub_matrix_jobs = assign_staging_jobs_for_missing_clusters(
-        staging_hub_matrix_jobs, prod_hub_matrix_jobs
+        staging_hub_matrix_jobs,
+        prod_hub_matrix_jobs,
+        {name: c["config"] for name, c in index["clusters"].items()},
     )
+    if prod_shards_per_cluster:
+        prod_hub_matrix_jobs = shard_hub_matrix_jobs(
+            prod_hub_matrix_jobs, prod_shards_per_cluster, get_expected_durations()
+        )
     # Pretty print the jobs using rich
     pretty_print_matrix_jobs(
         staging_hub_matrix_jobs, prod_hub_matrix_jobs, support_matrix_jobs
@@ -4,46 +4,64 @@ cluster.yaml files
 """
 
 import functools
+import hashlib
 import json
 import os
 import shutil
 import subprocess
 import sys
 import tempfile
-from contextlib import ExitStack, contextmanager
+import time
+import traceback
+from contextlib import ExitStack
 from pathlib import Path
 
 import jsonschema
 import typer
-from ruamel.yaml import YAML
 
 from deployer.app import validate_app
 from deployer.infra_components.cluster import Cluster
+from deployer.utils import tracing
 from deployer.utils.file_acquisition import (
     HELM_CHARTS_DIR,
     REPO_ROOT_PATH,
+    load_config_file,
 )
-from deployer.utils.rendering import print_colour
-
-yaml = YAML(typ="safe", pure=True)
+from deployer.utils.helm import (
+    GENERATED_CHART_FILES,
+    hash_chart_dir,
+    update_chart_dependencies,
+)
+from deployer.utils.helm_values import validate_values
+from deployer.utils.parallel import run_in_parallel
+from deployer.utils.rendering import print_colour, print_timing_table
+from deployer.utils.schema import validate_with_schema, write_schema_json
 
 CUSTOM_HUB_CHART_PREFIX = "2i2c-custom-hub-chart"
+CLUSTER_SCHEMA_FILE = Path(__file__).parent / "cluster.schema.yaml"
+# Where the chart directories for hubs with a `chart_override` are created
+CUSTOM_HUB_CHARTS_CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    / "2i2c-deployer"
+    / "custom-hub-charts"
+)
+# How many of the most recently used custom chart directories to keep around
+MAX_CUSTOM_HUB_CHARTS = 10
 
 
-@functools.lru_cache
 def _generate_values_schema_json(helm_chart_dir):
     """
     This function reads the values.schema.yaml files part of our Helm charts and
     generates a values.schema.json that can allowing helm the CLI to perform
     validation of passed values before rendering templates or making changes in k8s.
-    """
-    values_schema_yaml = os.path.join(helm_chart_dir, "values.schema.yaml")
-    values_schema_json = os.path.join(helm_chart_dir, "values.schema.json")
 
-    with open(values_schema_yaml) as f:
-        schema = yaml.load(f)
-    with open(values_schema_json, "w") as f:
-        json.dump(schema, f)
+    The file is only rewritten when its contents change, so it can stay in place
+    while many hubs using the chart are validated and deployed.
+    """
+    write_schema_json(
+        os.path.join(helm_chart_dir, "values.schema.yaml"),
+        os.path.join(helm_chart_dir, "values.schema.json"),
+    )
 
 
 def cleanup_values_schema_json(helm_chart_dir):
@@ -56,195 +74,263 @@ def cleanup_values_schema_json(helm_chart_dir):
 def _prepare_support_helm_charts_dependencies_and_schema():
     support_dir = HELM_CHARTS_DIR.joinpath("support")
     _generate_values_schema_json(support_dir)
-    subprocess.check_call(["helm", "dep", "up", support_dir])
+    update_chart_dependencies(support_dir)
 
 
 @functools.lru_cache
 def _prepare_hub_helm_charts_dependencies_and_schema(hub_chart_dir, legacy_daskub):
     hub_chart_dir = Path(hub_chart_dir)
-    cleanup_values_schema_json(hub_chart_dir)
 
     if legacy_daskub:
+        # The daskhub chart has no schema of its own, as it passes its values
+        # through to the basehub chart
+        cleanup_values_schema_json(hub_chart_dir)
         if not hub_chart_dir.parent.name.startswith(
             CUSTOM_HUB_CHART_PREFIX
         ) and not hub_chart_dir.name.startswith(CUSTOM_HUB_CHART_PREFIX):
             _generate_values_schema_json(HELM_CHARTS_DIR / "basehub")
-            subprocess.check_call(["helm", "dep", "up", HELM_CHARTS_DIR / "basehub"])
+            update_chart_dependencies(HELM_CHARTS_DIR / "basehub")
         else:
             if hub_chart_dir.name == "daskhub":
                 basehub_dir = hub_chart_dir.parent / "basehub"
                 _generate_values_schema_json(basehub_dir)
-                subprocess.check_call(["helm", "dep", "up", basehub_dir])
+                update_chart_dependencies(basehub_dir)
     else:
         _generate_values_schema_json(hub_chart_dir)
 
-    subprocess.check_call(["helm", "dep", "up", hub_chart_dir])
+    update_chart_dependencies(hub_chart_dir)
 
 
-def validate_hub_config(
-    cluster_name,
-    hub_name,
-    helm_chart_dir: Path,
-    skip_refresh=False,
-    debug=False,
-):
+def _get_hub_values_files(hub, helm_chart_dir, jsonnet_stack):
     """
-    Validates the provided non-encrypted helm chart values files for each hub of
-    a specific cluster.
+    Return the values files `helm template` needs to validate a hub, with any
+    jsonnet files rendered into JSON files that stay around until `jsonnet_stack`
+    is closed.
+
+    Returns:
+        tuple: The path of the chart's rendered values.jsonnet file, and a list of
+            `(path, parsed_values, source_path)` tuples for the hub's non-secret
+            values files in the order they are passed to helm. `source_path` is
+            the jsonnet file a rendered file came from, and `path` otherwise.
     """
-    cluster = Cluster.from_name(cluster_name)
-    hub = next((h for h in cluster.hubs if h.spec["name"] == hub_name), None)
+    chart_values_file = jsonnet_stack.enter_context(
+        hub.render_jsonnet(helm_chart_dir / "values.jsonnet")
+    )
+
+    hub_values = []
+    for values_file in hub.spec["helm_chart_values_files"]:
+        # FIXME: The logic here for figuring out non secret files is not correct
+        if values_file.endswith(".jsonnet"):
+            rendered_file = jsonnet_stack.enter_context(
+                hub.render_jsonnet(hub.cluster.config_dir / values_file)
+            )
+            with open(rendered_file) as f:
+                hub_values.append(
+                    (
+                        rendered_file,
+                        json.load(f),
+                        hub.cluster.config_dir / values_file,
+                    )
+                )
+        elif "secret" not in os.path.basename(values_file):
+            values_file = hub.cluster.config_dir / values_file
+            hub_values.append((values_file, load_config_file(values_file), values_file))
+    return chart_values_file, hub_values
 
-    if not skip_refresh:
-        _prepare_hub_helm_charts_dependencies_and_schema(
-            helm_chart_dir, hub.legacy_daskhub
-        )
 
+def _check_hub_helm_template(hub, helm_chart_dir, chart_values_file, hub_values, debug):
+    """
+    Run `helm template` for a hub with the values files returned by
+    `_get_hub_values_files`.
+
+    Raises:
+        subprocess.CalledProcessError: if helm fails to render the chart with
+            the hub's values
+    """
     cmd = [
         "helm",
         "template",
         helm_chart_dir,
+        "--values",
+        chart_values_file,
     ]
     if debug:
         cmd.append("--debug")
 
-    with ExitStack() as jsonnet_stack:
-        # Add on rendered jsonnet values.yaml file for the chart
-        rendered_values_path = jsonnet_stack.enter_context(
-            hub.render_jsonnet(
-                helm_chart_dir / "values.jsonnet",
-            )
+    dask_gateway_enabled = False
+    for values_file, config, _ in hub_values:
+        cmd.append(f"--values={values_file}")
+        # Check if there's config that enables dask-gateway, with later values
+        # files taking precedence like they do in helm
+        dask_gateway_enabled = config.get("dask-gateway", {}).get(
+            "enabled", dask_gateway_enabled
         )
 
-        cmd += ["--values", rendered_values_path]
+    # Workaround the current requirement for dask-gateway 0.9.0 to have a
+    # JupyterHub api-token specified, for updates if this workaround can be
+    # removed, see https://github.com/dask/dask-gateway/issues/473.
+    if dask_gateway_enabled:
+        cmd.append("--set=dask-gateway.gateway.auth.jupyterhub.apiToken=dummy")
+    tracing.run(cmd, check=True, capture_output=True, text=True)
 
-        for values_file in hub.spec["helm_chart_values_files"]:
-            # FIXME: The logic here for figuring out non secret files is not correct
-            if values_file.endswith(".jsonnet"):
-                rendered_file = jsonnet_stack.enter_context(
-                    hub.render_jsonnet(
-                        cluster.config_dir / values_file,
-                    )
-                )
-                cmd.append(f"--values={rendered_file}")
-            elif "secret" not in os.path.basename(values_file):
-                values_file = cluster.config_dir / values_file
-                cmd.append(f"--values={values_file}")
-                config = yaml.load(values_file)
-                # Check if there's config that enables dask-gateway
-                dask_gateway_enabled = config.get("dask-gateway", {}).get(
-                    "enabled", False
-                )
 
-        # Workaround the current requirement for dask-gateway 0.9.0 to have a
-        # JupyterHub api-token specified, for updates if this workaround can be
-        # removed, see https://github.com/dask/dask-gateway/issues/473.
-        if dask_gateway_enabled:
-            cmd.append("--set=dask-gateway.gateway.auth.jupyterhub.apiToken=dummy")
+def _link_or_copy(src, dst):
+    """
+    Hardlink `src` to `dst`, falling back to copying when that isn't possible (for
+    example when they are on different filesystems).
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def _materialize_custom_chart_dir(chart_override_path, legacy_daskhub):
+    """
+    Return a directory in CUSTOM_HUB_CHARTS_CACHE_DIR holding the basehub chart with
+    its Chart.yaml replaced by `chart_override_path`, and the daskhub chart next to
+    it for legacy daskhubs.
+
+    The directory is named after a hash of everything that goes into it, so it is
+    created only once and then reused by every hub (and every run) using the same
+    chart override file. Files are hardlinked rather than copied where possible,
+    and files generated by `helm dep up` or by us are left out.
+    """
+    h = hashlib.sha256(Path(chart_override_path).read_bytes())
+    h.update(str(legacy_daskhub).encode())
+    hash_chart_dir(HELM_CHARTS_DIR / "basehub", h)
+    if legacy_daskhub:
+        hash_chart_dir(HELM_CHARTS_DIR / "daskhub", h)
+    custom_chart_dir = (
+        CUSTOM_HUB_CHARTS_CACHE_DIR / f"{CUSTOM_HUB_CHART_PREFIX}-{h.hexdigest()[:16]}"
+    )
+    if custom_chart_dir.is_dir():
+        # Mark it as recently used, so it isn't pruned
+        os.utime(custom_chart_dir)
+        return custom_chart_dir
+
+    # Populate a temporary directory and rename it into place, so a partially
+    # created directory is never used, even when several processes race to create it
+    CUSTOM_HUB_CHARTS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(
+        tempfile.mkdtemp(
+            prefix=f".{custom_chart_dir.name}-", dir=CUSTOM_HUB_CHARTS_CACHE_DIR
+        )
+    )
+    for chart in ["basehub", "daskhub"] if legacy_daskhub else ["basehub"]:
+        shutil.copytree(
+            HELM_CHARTS_DIR / chart,
+            tmp_dir / chart,
+            ignore=shutil.ignore_patterns(*GENERATED_CHART_FILES),
+            copy_function=_link_or_copy,
+        )
+    # Chart.yaml is not hardlinked, so the override file itself can't be modified
+    # through the custom chart directory
+    (tmp_dir / "basehub" / "Chart.yaml").unlink()
+    shutil.copyfile(chart_override_path, tmp_dir / "basehub" / "Chart.yaml")
+    try:
+        tmp_dir.rename(custom_chart_dir)
+    except OSError:
+        # Another process has created the same directory in the meantime
+        shutil.rmtree(tmp_dir)
+    _prune_custom_chart_dirs()
+    return custom_chart_dir
+
+
+def _prune_custom_chart_dirs():
+    """
+    Remove all but the `MAX_CUSTOM_HUB_CHARTS` most recently used directories in
+    CUSTOM_HUB_CHARTS_CACHE_DIR, as every change to the basehub chart or to a
+    chart override file creates a new one.
+    """
+
+    def last_used(chart_dir):
         try:
-            subprocess.check_output(cmd, text=True)
-        except subprocess.CalledProcessError as e:
-            print(e.stdout)
-            sys.exit(1)
+            return chart_dir.stat().st_mtime
+        except FileNotFoundError:
+            # Pruned by another process in the meantime
+            return 0
+
+    chart_dirs = sorted(
+        CUSTOM_HUB_CHARTS_CACHE_DIR.glob(f"{CUSTOM_HUB_CHART_PREFIX}-*"),
+        key=last_used,
+        reverse=True,
+    )
+    for chart_dir in chart_dirs[MAX_CUSTOM_HUB_CHARTS:]:
+        shutil.rmtree(chart_dir, ignore_errors=True)
+
+
+def get_hub_chart_override(hub):
+    """
+    Return the name and path of the `chart_override` file of a hub, or
+    `(None, None)` if the hub doesn't override its chart
+    """
+    chart_override = hub.spec.get("chart_override", None)
+    if chart_override and "/" in chart_override:
+        # It's probably a path relative to the repo root
+        chart_override_path = REPO_ROOT_PATH / chart_override
+        chart_override = chart_override.split("/")[-1]
+    else:
+        chart_override_path = (
+            hub.cluster.config_dir / chart_override if chart_override else None
+        )
+    return chart_override, chart_override_path
 
 
-@contextmanager
 def get_chart_dir(
     default_chart_dir, chart_override, chart_override_path, legacy_daskhub
 ):
     """
     Returns the default chart directory (basehub or daskhub)
-    or a temporary directory.
+    or a custom chart directory.
 
-    The temporary directory is holding a copy of the contents of the
-    helm-charts/basehub dir where Chart.yaml is overridden by whichever yaml
-    file was passed in the cluster's `cluster.yaml` file under `chart_override`
+    The custom chart directory holds the contents of the helm-charts/basehub dir
+    where Chart.yaml is overridden by whichever yaml file was passed in the
+    cluster's `cluster.yaml` file under `chart_override`. It is shared by all
+    hubs using the same override file, and kept around between runs so the
+    chart's dependencies don't need to be downloaded again.
     """
     chart_dir = default_chart_dir
-    try:
-        if chart_override:
-            default_basehub_chart_dir = HELM_CHARTS_DIR / "basehub"
-            temp_chart_dir = tempfile.TemporaryDirectory(prefix=CUSTOM_HUB_CHART_PREFIX)
-            temp_chart_dir_name = temp_chart_dir.name
-            if legacy_daskhub:
-                temp_chart_dir_name = temp_chart_dir.name + "/basehub"
-
-            # copy the basehub chart directory into the temporary location
-            shutil.copytree(
-                default_basehub_chart_dir, temp_chart_dir_name, dirs_exist_ok=True
-            )
-
-            # copy the chart override file into the temporary chart directory
-            shutil.copy(chart_override_path, temp_chart_dir_name)
-
-            # rename the override file so that it overrides "Chart.yaml"
-            default_chart_yaml = Path(temp_chart_dir_name) / "Chart.yaml"
-            os.rename(Path(temp_chart_dir_name) / chart_override, default_chart_yaml)
-
-            if legacy_daskhub:
-                # if this is a legacy daskhub, we need to copy the daskhub chart directory
-                # into the temporary location too
-                default_daskhub_chart_dir = HELM_CHARTS_DIR / "daskhub"
-                shutil.copytree(
-                    default_daskhub_chart_dir,
-                    temp_chart_dir.name + "/daskhub",
-                    dirs_exist_ok=True,
-                )
-                # the chart location is the temporary daskhub dir in this case
-                temp_chart_dir_name = temp_chart_dir.name + "/daskhub"
-
-            chart_dir = Path(temp_chart_dir_name)
-        yield chart_dir
-    finally:
-        if chart_override:
-            temp_chart_dir.cleanup()
+    if chart_override:
+        custom_chart_dir = _materialize_custom_chart_dir(
+            chart_override_path, legacy_daskhub
+        )
+        # for a legacy daskhub, the chart location is the daskhub dir, that refers
+        # to the custom basehub chart next to it
+        chart_dir = custom_chart_dir / ("daskhub" if legacy_daskhub else "basehub")
+    return chart_dir
 
 
-def validate_authenticator_config(
-    cluster_name,
-    hub_name,
-    helm_chart_dir,
-    skip_refresh=False,
-):
+def _check_authenticator_config(hub, hub_values):
     """
-    For each hub of a specific cluster it asserts that:
+    Assert that a hub's authenticator config, as set in its parsed non-secret
+    values files `hub_values`, is safe:
     - when the JupyterHub GitHubOAuthenticator is used, then allowed_users is not set
     - when the dummy authenticator is used, then admin_users is the empty list
-    """
-
-    cluster = Cluster.from_name(cluster_name)
-    hub = next((h for h in cluster.hubs if h.spec["name"] == hub_name), None)
-
-    if not skip_refresh:
-        _prepare_hub_helm_charts_dependencies_and_schema(
-            helm_chart_dir, hub.legacy_daskhub
-        )
 
+    Raises:
+        ValueError: if one of these conditions isn't met
+    """
     allowed_users = []
     admin_users = "Jargon-Chlorine7-Undergo"
-    for values_file_name in hub.spec["helm_chart_values_files"]:
-        if "secret" not in os.path.basename(values_file_name):
-            values_file = cluster.config_dir / values_file_name
-            # Load the hub extra config from its specific values files
-            config = yaml.load(values_file)
-            # Check if there's config that specifies an authenticator class
-            try:
-                # This special casing is needed for legacy daskhubs still
-                # using the daskhub chart
-                if hub.legacy_daskhub:
-                    config = config.get("basehub", {})
-                hub_config = (
-                    config.get("jupyterhub", {}).get("hub", {}).get("config", {})
+    for config in hub_values:
+        # Check if there's config that specifies an authenticator class
+        try:
+            # This special casing is needed for legacy daskhubs still
+            # using the daskhub chart
+            if hub.legacy_daskhub:
+                config = config.get("basehub", {})
+            hub_config = config.get("jupyterhub", {}).get("hub", {}).get("config", {})
+            allowed_users = hub_config.get("Authenticator", {}).get("allowed_users")
+            admin_users = hub_config.get("Authenticator", {}).get("admin_users")
+            org_based_github_auth = False
+            if hub_config.get("GitHubOAuthenticator", None):
+                org_based_github_auth = hub_config["GitHubOAuthenticator"].get(
+                    "allowed_organizations", False
                 )
-                allowed_users = hub_config.get("Authenticator", {}).get("allowed_users")
-                admin_users = hub_config.get("Authenticator", {}).get("admin_users")
-                org_based_github_auth = False
-                if hub_config.get("GitHubOAuthenticator", None):
-                    org_based_github_auth = hub_config["GitHubOAuthenticator"].get(
-                        "allowed_organizations", False
-                    )
-            except KeyError:
-                pass
+        except KeyError:
+            pass
     # If the authenticator class is github, then raise an error
     # if `Authenticator.allowed_users` is set
     if hub.authenticator == "github" and allowed_users and org_based_github_auth:
@@ -259,10 +345,183 @@ def validate_authenticator_config(
             """)
 
 
+def get_hub_chart_dir(hub):
+    """
+    Return the chart directory to use for `hub`, taking its `chart_override`
+    into account
+    """
+    chart_override, chart_override_path = get_hub_chart_override(hub)
+    return get_chart_dir(
+        HELM_CHARTS_DIR / hub.spec["helm_chart"],
+        chart_override,
+        chart_override_path,
+        hub.legacy_daskhub,
+    )
+
+
+def _check_hub_values_schema(hub, helm_chart_dir, chart_values_file, hub_values):
+    """
+    Validate the values files returned by `_get_hub_values_files` against the
+    schema of the hub's chart, without calling helm.
+
+    Returns:
+        list[str]: Every violation of the schema, with the file and line it is in
+    """
+    with open(chart_values_file) as f:
+        chart_values = json.load(f)
+    sources = [(helm_chart_dir / "values.jsonnet", chart_values)] + [
+        (source_file, config) for _, config, source_file in hub_values
+    ]
+
+    if hub.legacy_daskhub:
+        # The daskhub chart passes everything under the `basehub` key through
+        # to the basehub chart next to it, which has the schema
+        return validate_values(
+            helm_chart_dir.parent / "basehub",
+            [
+                (path, values.get("basehub", {}), ["basehub"])
+                for path, values in sources
+            ],
+        )
+    return validate_values(
+        helm_chart_dir, [(path, values, []) for path, values in sources]
+    )
+
+
+def validate_hub(hub, helm_chart_dir, debug=False, full=False):
+    """
+    Validate the non-encrypted values files and the authenticator config of `hub`.
+
+    The values are first checked against the chart's schema in this process, and
+    only if they are valid (or `full` is set) is `helm template` run, as that is
+    much slower and only reports the first problem it finds.
+
+    Expects the chart in `helm_chart_dir` to already be prepared with
+    `_prepare_hub_helm_charts_dependencies_and_schema`.
+
+    Raises:
+        ValueError: if the hub's config is not valid
+    """
+    with (
+        tracing.trace_attributes(
+            cluster=hub.cluster.spec["name"], hub=hub.spec["name"]
+        ),
+        ExitStack() as jsonnet_stack,
+    ):
+        chart_values_file, hub_values = _get_hub_values_files(
+            hub, helm_chart_dir, jsonnet_stack
+        )
+        _check_authenticator_config(hub, [config for _, config, _ in hub_values])
+
+        with tracing.span("validate values", tool="jsonschema"):
+            errors = _check_hub_values_schema(
+                hub, helm_chart_dir, chart_values_file, hub_values
+            )
+        if not errors or full:
+            try:
+                _check_hub_helm_template(
+                    hub, helm_chart_dir, chart_values_file, hub_values, debug
+                )
+            except subprocess.CalledProcessError as e:
+                errors.append(f"helm template failed:\n{e.stderr}")
+        if errors:
+            raise ValueError(
+                f"Invalid config for {hub.spec['name']}:\n" + "\n".join(errors)
+            )
+
+
+def _validate_hub_in_worker(cluster_name, hub_name, helm_chart_dir, debug, full):
+    """
+    Entrypoint for validating a hub from a worker process of `run_in_parallel`.
+
+    Clusters come from the registry, so each worker process only loads a cluster
+    once no matter how many of its hubs it validates.
+    """
+    hub = Cluster.registry().get(cluster_name).get_hub(hub_name)
+    print_colour(f"Validating hub and authenticator config for {hub_name}...")
+    validate_hub(hub, helm_chart_dir, debug, full)
+
+
+def validate_support(cluster, debug=False, full=False):
+    """
+    Validate the non-encrypted support chart values files of `cluster`.
+
+    Like for hubs, the values are first checked against the support chart's
+    schema in this process, and the support chart is only rendered with them if
+    they are valid (or `full` is set).
+
+    Expects the support chart to already be prepared with
+    `_prepare_support_helm_charts_dependencies_and_schema`.
+
+    Raises:
+        ValueError: if the support chart can't be rendered with the values
+    """
+    cluster_name = cluster.spec["name"]
+    if not cluster.support:
+        print_colour(f"No support defined for {cluster_name}. Nothing to validate!")
+        return
+
+    print_colour(f"Validating non-encrypted support values files for {cluster_name}...")
+
+    cmd = [
+        "helm",
+        "template",
+        str(HELM_CHARTS_DIR.joinpath("support")),
+    ]
+    if debug:
+        cmd.append("--debug")
+
+    sources = []
+    with (
+        tracing.trace_attributes(cluster=cluster_name),
+        ExitStack() as jsonnet_stack,
+    ):
+        for values_file in cluster.support["helm_chart_values_files"]:
+            if values_file.endswith(".jsonnet"):
+                rendered_file = jsonnet_stack.enter_context(
+                    cluster.render_jsonnet(
+                        cluster.config_dir / values_file,
+                    )
+                )
+                cmd.append(f"--values={rendered_file}")
+                with open(rendered_file) as f:
+                    sources.append((cluster.config_dir / values_file, json.load(f), []))
+            # FIXME: The logic here for figuring out non secret files is not correct
+            elif "secret" not in os.path.basename(values_file):
+                values_file = cluster.config_dir / values_file
+                cmd.append(f"--values={values_file}")
+                sources.append((values_file, load_config_file(values_file), []))
+
+        with tracing.span("validate values", tool="jsonschema"):
+            errors = validate_values(HELM_CHARTS_DIR / "support", sources)
+        if not errors or full:
+            try:
+                tracing.run(cmd, check=True, capture_output=True, text=True)
+            except subprocess.CalledProcessError as e:
+                errors.append(f"helm template failed:\n{e.stderr}")
+        if errors:
+            raise ValueError(
+                f"Invalid support config for {cluster_name}:\n" + "\n".join(errors)
+            )
+
+
+def _validate_support_in_worker(cluster_name, debug, full):
+    """
+    Entrypoint for validating a cluster's support chart values from a worker
+    process of `run_in_parallel`.
+    """
+    validate_support(Cluster.registry().get(cluster_name), debug, full)
+
+
 @validate_app.command()
 def support_config(
     cluster_name: str = typer.Argument(..., help="Name of cluster to operate on"),
     debug: bool = typer.Option(False, help="Enable verbose output"),
+    full: bool = typer.Option(
+        False,
+        "--full",
+        help="Also render the charts with helm when the values don't match their schema, to see all the errors helm reports",
+    ),
     skip_refresh: bool = typer.Option(
         False,
         help="Skip the helm dep update",
@@ -275,40 +534,26 @@ def support_config(
     if not skip_refresh:
         _prepare_support_helm_charts_dependencies_and_schema()
 
-    cluster = Cluster.from_name(cluster_name)
+    try:
+        validate_support(Cluster.from_name(cluster_name), debug, full)
+    except ValueError as e:
+        print_colour(str(e), "red")
+        sys.exit(1)
 
-    if cluster.support:
-        print_colour(
-            f"Validating non-encrypted support values files for {cluster_name}..."
-        )
 
-        cmd = [
-            "helm",
-            "template",
-            str(HELM_CHARTS_DIR.joinpath("support")),
-        ]
-        if debug:
-            cmd.append("--debug")
-
-        with ExitStack() as jsonnet_stack:
-            for values_file in cluster.support["helm_chart_values_files"]:
-                if values_file.endswith(".jsonnet"):
-                    rendered_file = jsonnet_stack.enter_context(
-                        cluster.render_jsonnet(
-                            cluster.config_dir / values_file,
-                        )
-                    )
-                    cmd.append(f"--values={rendered_file}")
-                # FIXME: The logic here for figuring out non secret files is not correct
-                elif "secret" not in os.path.basename(values_file):
-                    cmd.append(f"--values={cluster.config_dir / values_file}")
-            try:
-                subprocess.check_output(cmd, text=True)
-            except subprocess.CalledProcessError as e:
-                print(e.stdout)
-                sys.exit(1)
-    else:
-        print_colour(f"No support defined for {cluster_name}. Nothing to validate!")
+def validate_cluster(cluster):
+    """
+    Validate the cluster.yaml of `cluster` against its JSONSchema.
+
+    Raises:
+        ValueError: if the cluster.yaml file doesn't match the schema
+    """
+    try:
+        validate_with_schema(cluster.spec, CLUSTER_SCHEMA_FILE)
+    except jsonschema.ValidationError as e:
+        raise ValueError(
+            f"JSON schema validation error in cluster.yaml for {cluster.spec['name']}: {e.message}"
+        ) from None
 
 
 @validate_app.command()
@@ -318,21 +563,11 @@ def cluster_config(
     """
     Validates cluster.yaml configuration against a JSONSchema.
     """
-    cur_dir = Path(__file__).parent
-    cluster_schema_file = cur_dir.joinpath("cluster.schema.yaml")
-
-    cluster = Cluster.from_name(cluster_name)
-
-    with open(cluster_schema_file) as sf:
-        schema = yaml.load(sf)
-        try:
-            jsonschema.validate(cluster.spec, schema)
-        except jsonschema.ValidationError as e:
-            print_colour(
-                f"JSON schema validation error in cluster.yaml for {cluster_name}: {e.message}",
-                colour="red",
-            )
-            sys.exit(1)
+    try:
+        validate_cluster(Cluster.from_name(cluster_name))
+    except ValueError as e:
+        print_colour(str(e), colour="red")
+        sys.exit(1)
 
 
 @validate_app.command()
@@ -341,40 +576,242 @@ def all_hub_config(
     hub_name: str = typer.Argument(None, help="Name of hub to operate on"),
     skip_refresh: bool = typer.Option(False, help="Skip the helm dep update"),
     debug: bool = typer.Option(False, help="Enable verbose output"),
+    full: bool = typer.Option(
+        False,
+        "--full",
+        help="Also render the charts with helm when the values don't match their schema, to see all the errors helm reports",
+    ),
+    parallel: int = typer.Option(
+        1,
+        "--parallel",
+        min=1,
+        help="Number of hubs to validate at the same time",
+    ),
+    report_file: Path = typer.Option(
+        None,
+        "--report-file",
+        help="Write the result of validating each hub to this file, as JSON",
+    ),
 ):
     """
     Validates the provided non-encrypted helm chart values files and the
     authenticator configuration for each hub of a specific cluster.
+
+    All hubs are validated even if some of them fail, and the command only fails
+    at the end, so the report lists every hub that needs fixing.
     """
     cluster = Cluster.from_name(cluster_name)
     if hub_name:
-        hubs = [h for h in cluster.hubs if h.spec["name"] == hub_name]
+        hubs = [cluster.get_hub(hub_name)]
     else:
         hubs = cluster.hubs
-    for i, hub in enumerate(hubs):
-        default_chart_dir = HELM_CHARTS_DIR / hub.spec["helm_chart"]
-        chart_override = hub.spec.get("chart_override", None)
-        if chart_override and "/" in chart_override:
-            chart_override_path = REPO_ROOT_PATH / chart_override
-            chart_override = chart_override.split("/")[-1]
-        else:
-            chart_override_path = (
-                hub.cluster.config_dir / chart_override if chart_override else None
+
+    # Hubs share chart directories, so they are prepared once upfront rather
+    # than for every hub
+    hub_chart_dirs = {hub.spec["name"]: get_hub_chart_dir(hub) for hub in hubs}
+    chart_dirs = {(hub_chart_dirs[h.spec["name"]], h.legacy_daskhub) for h in hubs}
+    try:
+        if not skip_refresh:
+            for chart_dir, legacy_daskhub in sorted(chart_dirs):
+                _prepare_hub_helm_charts_dependencies_and_schema(
+                    chart_dir, legacy_daskhub
+                )
+
+        if parallel > 1 and len(hubs) > 1:
+            results = run_in_parallel(
+                [
+                    (
+                        h.spec["name"],
+                        _validate_hub_in_worker,
+                        (
+                            cluster_name,
+                            h.spec["name"],
+                            hub_chart_dirs[h.spec["name"]],
+                            debug,
+                            full,
+                        ),
+                    )
+                    for h in hubs
+                ],
+                parallel,
+                fail_fast=False,
             )
-        with get_chart_dir(
-            default_chart_dir, chart_override, chart_override_path, hub.legacy_daskhub
-        ) as chart_dir:
-            print_colour(
-                f"{i + 1} / {len(hubs)}: Validating hub and authenticator config for {hub.spec['name']}..."
+            print_timing_table(results, title=f"Hub validation on {cluster_name}")
+        else:
+            results = []
+            for i, hub in enumerate(hubs):
+                print_colour(
+                    f"{i + 1} / {len(hubs)}: Validating hub and authenticator config for {hub.spec['name']}..."
+                )
+                start_time = time.perf_counter()
+                error = None
+                try:
+                    validate_hub(hub, hub_chart_dirs[hub.spec["name"]], debug, full)
+                except Exception as e:
+                    # Like in the workers of the parallel path, any error only fails
+                    # this hub
+                    error = f"{type(e).__name__}: {e}"
+                    print_colour(error, "red")
+                    if debug:
+                        traceback.print_exc()
+                results.append(
+                    {
+                        "name": hub.spec["name"],
+                        "status": "failed" if error else "succeeded",
+                        "duration": time.perf_counter() - start_time,
+                        "error": error,
+                    }
+                )
+    finally:
+        for chart_dir, _ in chart_dirs:
+            cleanup_values_schema_json(chart_dir)
+
+    if report_file:
+        with open(report_file, "w") as f:
+            json.dump({"cluster": cluster_name, "hubs": results}, f, indent=2)
+
+    failed = [r["name"] for r in results if r["status"] == "failed"]
+    if failed:
+        print_colour(f"Invalid config for hubs: {', '.join(failed)}", "red")
+        sys.exit(1)
+
+
+@validate_app.command()
+def everything(
+    cluster_names: list[str] = typer.Argument(
+        None,
+        help="Names of clusters to validate. Omit to validate all clusters, or only what is listed in --jobs-file if that is given.",
+    ),
+    jobs_file: list[Path] = typer.Option(
+        None,
+        "--jobs-file",
+        help="JSON file with a list of jobs, like the support-jobs, staging-jobs and prod-jobs outputs of `deployer plan-upgrade`. Only the support charts and hubs listed in them are validated. Can be passed multiple times.",
+    ),
+    parallel: int = typer.Option(
+        os.cpu_count() or 1,
+        "--parallel",
+        min=1,
+        help="Number of support charts and hubs to validate at the same time",
+    ),
+    skip_refresh: bool = typer.Option(False, help="Skip the helm dep update"),
+    debug: bool = typer.Option(False, help="Enable verbose output"),
+    full: bool = typer.Option(
+        False,
+        "--full",
+        help="Also render the charts with helm when the values don't match their schema, to see all the errors helm reports",
+    ),
+    report_file: Path = typer.Option(
+        None,
+        "--report-file",
+        help="Write the result of each validation to this file, as JSON",
+    ),
+):
+    """
+    Validates the cluster.yaml, support chart values and hub config of many
+    clusters at once, on a pool of worker processes.
+    """
+    # Map the names of clusters to validate to whether their support chart
+    # should be validated, and which of their hubs (None for all of them)
+    targets = {}
+    for path in jobs_file or []:
+        with open(path) as f:
+            jobs = json.load(f)
+        for job in jobs:
+            target = targets.setdefault(
+                job["cluster_name"], {"support": False, "hubs": set()}
             )
-            validate_hub_config(
-                cluster_name,
-                hub.spec["name"],
-                helm_chart_dir=chart_dir,
-                skip_refresh=skip_refresh,
-                debug=debug,
+            # Prod jobs sharded with --prod-shards-per-cluster list several
+            # hubs under "hub_names"
+            if "hub_name" in job or "hub_names" in job:
+                if target["hubs"] is not None:
+                    target["hubs"].update(job.get("hub_names") or [job["hub_name"]])
+            else:
+                target["support"] = True
+    if cluster_names or not jobs_file:
+        for cluster_name in cluster_names or Cluster.registry().names:
+            targets[cluster_name] = {"support": True, "hubs": None}
+
+    results = []
+    tasks = []
+    chart_dirs = set()
+    for cluster_name, target in sorted(targets.items()):
+        cluster = Cluster.registry().get(cluster_name)
+
+        # This is quick, so there's no need to do it in a worker
+        start_time = time.perf_counter()
+        error = None
+        try:
+            validate_cluster(cluster)
+        except ValueError as e:
+            error = f"{type(e).__name__}: {e}"
+            print_colour(error, "red")
+        results.append(
+            {
+                "name": f"{cluster_name}/cluster.yaml",
+                "status": "failed" if error else "succeeded",
+                "duration": time.perf_counter() - start_time,
+                "error": error,
+            }
+        )
+
+        if target["support"] and cluster.support:
+            tasks.append(
+                (
+                    f"{cluster_name}/support",
+                    _validate_support_in_worker,
+                    (cluster_name, debug, full),
+                )
             )
-            validate_authenticator_config(
-                cluster_name, hub.spec["name"], chart_dir, skip_refresh
+
+        if target["hubs"] is None:
+            hubs = cluster.hubs
+        else:
+            hubs = [cluster.get_hub(hub_name) for hub_name in sorted(target["hubs"])]
+        for hub in hubs:
+            chart_dir = get_hub_chart_dir(hub)
+            chart_dirs.add((chart_dir, hub.legacy_daskhub))
+            tasks.append(
+                (
+                    f"{cluster_name}/{hub.spec['name']}",
+                    _validate_hub_in_worker,
+                    (cluster_name, hub.spec["name"], chart_dir, debug, full),
+                )
             )
-            cleanup_values_schema_json(chart_dir)
+
+    # Chart directories are shared between clusters, so they are prepared once
+    # here rather than in the workers
+    if not skip_refresh:
+        if any(func is _validate_support_in_worker for _, func, _ in tasks):
+            _prepare_support_helm_charts_dependencies_and_schema()
+        for chart_dir, legacy_daskhub in sorted(chart_dirs):
+            _prepare_hub_helm_charts_dependencies_and_schema(chart_dir, legacy_daskhub)
+
+    results += run_in_parallel(tasks, parallel, fail_fast=False)
+
+    for chart_dir, _ in chart_dirs:
+        cleanup_values_schema_json(chart_dir)
+
+    print_timing_table(results, title="Validation timings")
+
+    cluster_results = {}
+    for result in results:
+        cluster_name = result["name"].split("/")[0]
+        cluster_result = cluster_results.setdefault(
+            cluster_name,
+            {"name": cluster_name, "status": "succeeded", "duration": 0, "error": None},
+        )
+        cluster_result["duration"] += result["duration"] or 0
+        if result["status"] == "failed":
+            cluster_result["status"] = "failed"
+    print_timing_table(
+        list(cluster_results.values()), title="Total validation time per cluster"
+    )
+
+    if report_file:
+        with open(report_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failed = [r["name"] for r in results if r["status"] == "failed"]
+    if failed:
+        print_colour(f"Invalid config for: {', '.join(failed)}", "red")
+        sys.exit(1)
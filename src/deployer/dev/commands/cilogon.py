@@ -23,7 +23,6 @@ from pathlib import Path
 
 import requests
 import typer
-from ruamel.yaml import YAML
 from yarl import URL
 
 from deployer.dev.app import cilogon_client_app
@@ -35,8 +34,7 @@ from deployer.utils.file_acquisition import (
     remove_jupyterhub_hub_config_key_from_encrypted_file,
 )
 from deployer.utils.rendering import print_colour
-
-yaml = YAML(typ="safe")
+from deployer.utils.yaml_loader import load_yaml
 
 
 def build_request_headers(admin_id, admin_secret):
@@ -92,7 +90,7 @@ def persist_client_credentials_in_config_file(client, config_filename):
 def load_client_id_from_file(config_filename):
     with get_decrypted_file(config_filename) as decrypted_path:
         with open(decrypted_path) as f:
-            auth_config = yaml.load(f)
+            auth_config = load_yaml(f)
 
     daskhub_legacy_config = auth_config.get("basehub", None)
     try:
@@ -382,7 +380,7 @@ def get_2i2c_cilogon_admin_credentials():
     general_auth_config = "shared/deployer/enc-auth-providers-credentials.secret.yaml"
     with get_decrypted_file(general_auth_config) as decrypted_file_path:
         with open(decrypted_file_path) as f:
-            config = yaml.load(f)
+            config = load_yaml(f)
 
     return (
         config["cilogon_admin"]["client_id"],
@@ -567,7 +565,7 @@ def cleanup(
 
         with get_decrypted_file(config_filename) as decrypted_path:
             with open(decrypted_path) as f:
-                secret_config = yaml.load(f)
+                secret_config = load_yaml(f)
 
         if (
             "CILogonOAuthenticator"
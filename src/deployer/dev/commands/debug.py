@@ -9,14 +9,10 @@ from enum import Enum
 
 import escapism
 import typer
-from ruamel.yaml import YAML
 
 from deployer.dev.app import debug_app
 from deployer.infra_components.cluster import Cluster
 
-# Without `pure=True`, I get an exception about str / byte issues
-yaml = YAML(typ="safe", pure=True)
-
 
 class InfraComponents(Enum):
     """
@@ -7,16 +7,12 @@ import subprocess
 from pathlib import Path
 
 import typer
-from ruamel.yaml import YAML
 
 from deployer.app import app
 from deployer.commands.validate.config import cluster_config as validate_cluster_config
 from deployer.dev.app import DEVELOPMENT
 from deployer.infra_components.cluster import Cluster
 
-# Without `pure=True`, I get an exception about str / byte issues
-yaml = YAML(typ="safe", pure=True)
-
 
 def ensure_single_kubeconfig_context():
     kubeconfig_path = Path.home() / ".kube" / "config"
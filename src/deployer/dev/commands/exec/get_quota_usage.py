@@ -4,15 +4,11 @@ import subprocess
 import sys
 
 import typer
-from ruamel.yaml import YAML
 
 from deployer.commands.validate.config import cluster_config as validate_cluster_config
 from deployer.dev.app import exec_app
 from deployer.infra_components.cluster import Cluster
 
-# Without `pure=True`, I get an exception about str / byte issues
-yaml = YAML(typ="safe", pure=True)
-
 
 def get_nfs_pod_name(namespace: str):
     # Get full YAML spec of all nodes with this instance_type
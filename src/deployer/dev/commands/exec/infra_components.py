@@ -4,14 +4,12 @@ import subprocess
 import tempfile
 
 import typer
-from ruamel.yaml import YAML
 
 from deployer.dev.app import exec_app
 from deployer.infra_components.cluster import Cluster
+from deployer.utils.file_acquisition import load_config_file
 from deployer.utils.rendering import print_colour
 
-# Without `pure=True`, I get an exception about str / byte issues
-yaml = YAML(typ="safe", pure=True)
 # Define the numerical version of the ubuntu image
 # used by the helper pods created by this script
 # in one central place to update it more easily
@@ -61,8 +59,7 @@ def root_homes(
     server_ip = base_share_name = ""
     for values_file in hub.spec["helm_chart_values_files"]:
         if "secret" not in os.path.basename(values_file):
-            values_file = cluster.config_dir / values_file
-            config = yaml.load(values_file)
+            config = load_config_file(cluster.config_dir / values_file)
 
             if config.get("basehub", {}):
                 config = config["basehub"]
@@ -12,15 +12,11 @@ import tenacity
 import typer
 from rich.console import Console
 from rich.table import Table
-from ruamel.yaml import YAML
 from yarl import URL
 
 from deployer.dev.app import exec_app
 from deployer.infra_components.cluster import Cluster
 
-# Without `pure=True`, I get an exception about str / byte issues
-yaml = YAML(typ="safe", pure=True)
-
 
 @exec_app.command()
 def promql(
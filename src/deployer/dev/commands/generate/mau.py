@@ -1,11 +1,13 @@
 import calendar
 import csv
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Annotated, Optional
 
 import requests
 import typer
+from requests.adapters import HTTPAdapter
 from rich import progress
 from rich.live import Live
 from rich.table import Table
@@ -40,6 +42,82 @@ USERNAMES_TO_IGNORE = {
 }
 
 
+# Get all pods that start with jupyter-.*, and treat them as user servers.
+# We could join with kube_pod_labels for a more accurate version of this.
+# We can't use the username in the pod label because it is escaped, and we won't
+# get the full username for filtering.
+#
+# Evaluating the inner query every minute of a day tells us which minutes each
+# user had a server. Rather than fetching all those minutes with a range query and
+# counting them here, the subquery has prometheus count them, so we only get back
+# one number per user. Evaluated at 23:59:59, the minute aligned steps of the
+# subquery are 00:00:00 to 23:59:00, the same ones a range query from 00:00:00 to
+# 23:59:59 with a step of 1m evaluates.
+QUERY = """
+count_over_time(
+    (
+        max(
+            kube_pod_annotations{pod=~"jupyter-.*"}
+        )
+        by (annotation_hub_jupyter_org_username)
+    )[1d:1m]
+)
+"""
+
+
+def get_daily_activity(session, prometheus_url, prometheus_creds, day):
+    """
+    Return how many minutes each user had a server on `day`, a datetime of the
+    start of a day in UTC.
+    """
+    # The whole day, from 00:00:00 to 23:59:59
+    end_time = day + timedelta(days=1) - timedelta(seconds=1)
+    query_api = URL(f"{prometheus_url}/api/v1/query").with_query(
+        {"query": QUERY, "time": int(end_time.timestamp())}
+    )
+    resp = session.get(str(query_api), auth=prometheus_creds)
+    resp.raise_for_status()
+
+    return {
+        row["metric"]["annotation_hub_jupyter_org_username"]: int(
+            float(row["value"][1])
+        )
+        for row in resp.json()["data"]["result"]
+    }
+
+
+def get_cluster_activity(cluster, start_date, session, executor, on_day_done):
+    """
+    Return how many minutes each user had a server on `cluster` in the month
+    starting at `start_date`, fetching the activity of all days at the same time
+    on `executor`.
+    """
+    prometheus_url = cluster.get_external_prometheus_url()
+    prometheus_creds = cluster.get_cluster_prometheus_creds()
+    days_in_month = calendar.monthrange(start_date.year, start_date.month)[1]
+
+    futures = [
+        executor.submit(
+            get_daily_activity,
+            session,
+            prometheus_url,
+            prometheus_creds,
+            start_date + timedelta(days=i),
+        )
+        for i in range(days_in_month)
+    ]
+
+    # Users mapped to how many minutes their server was active this month
+    user_activity: dict[str, int] = {}
+    for future in as_completed(futures):
+        for username, minutes_active in future.result().items():
+            if username in USERNAMES_TO_IGNORE:
+                continue
+            user_activity[username] = user_activity.get(username, 0) + minutes_active
+        on_day_done()
+    return user_activity
+
+
 @generate_app.command()
 def mau(
     month: str = typer.Argument(help="Month to generate MAU data for"),
@@ -49,6 +127,9 @@ def mau(
     csv_file: Annotated[
         Path | None, typer.Option(help="Output data to csv file at this path")
     ] = None,
+    concurrency: int = typer.Option(
+        16, min=1, help="Number of prometheus queries to run at the same time"
+    ),
 ):
     """
     Generate MAU for all (or some) clusters for a given month
@@ -56,7 +137,15 @@ def mau(
     if cluster_name:
         clusters = [Cluster.from_name(cluster_name)]
     else:
-        clusters = Cluster.get_all()
+        clusters = list(Cluster.get_all())
+
+    time_parts = month.split("-", 2)
+
+    # Explicitly construct the datetime as UTC, so we get standardized MAU for all our clusters
+    start_date = datetime(
+        int(time_parts[0]), int(time_parts[1]), 1, tzinfo=timezone.utc
+    )
+    days_in_month = calendar.monthrange(start_date.year, start_date.month)[1]
 
     cluster_activity: dict[str, int] = {}
 
@@ -64,90 +153,55 @@ def mau(
     table.add_column("Cluster")
     table.add_column("MAU")
 
-    with Live(table) as live:
+    # One pool of connections, shared by all queries, so connections to each
+    # prometheus are reused across days
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    with (
+        Live(table) as live,
+        session,
+        ThreadPoolExecutor(max_workers=concurrency) as day_executor,
+        # Clusters mostly wait on the queries of their days, which are limited by
+        # `day_executor`
+        ThreadPoolExecutor(max_workers=concurrency) as cluster_executor,
+    ):
         progress_bar = progress.Progress(console=live.console)
         progress_bar.start()
         clusters_progress = progress_bar.add_task("Clusters", total=len(clusters))
-        dates_progress = progress_bar.add_task("Days")
-
-        for cluster in clusters:
+        dates_progress = progress_bar.add_task(
+            "Days", total=len(clusters) * days_in_month
+        )
+
+        futures = {
+            cluster_executor.submit(
+                get_cluster_activity,
+                cluster,
+                start_date,
+                session,
+                day_executor,
+                lambda: progress_bar.advance(dates_progress),
+            ): cluster
+            for cluster in clusters
+        }
+        for future in as_completed(futures):
+            cluster = futures[future]
+            user_activity = future.result()
+            cluster_activity[cluster.spec["name"]] = len(user_activity)
             progress_bar.update(
                 clusters_progress,
-                description=f"Processing {cluster.spec['name']}",
+                description=f"Processed {cluster.spec['name']}",
                 advance=1,
             )
-            promql_api = URL(
-                f"{cluster.get_external_prometheus_url()}/api/v1/query_range"
-            )
-
-            time_parts = month.split("-", 2)
-
-            # Explicitly construct the datetime as UTC, so we get standardized MAU for all our clusters
-            start_date = datetime(
-                int(time_parts[0]), int(time_parts[1]), 1, tzinfo=timezone.utc
-            )
-
-            # Get all pods that start with jupyter-.*, and treat them as user servers.
-            # We could join with kube_pod_labels for a more accurate version of this.
-            # We can't use the username in the pod label because it is escaped, and we won't
-            # get the full username for filtering.
-            query = """
-            max(
-                kube_pod_annotations{pod=~"jupyter-.*"}
-            )
-            by (annotation_hub_jupyter_org_username)
-            """
-
-            # Users mapped to how many minutes their server was active this month
-            user_activity: dict[str, int] = {}
-
-            days_in_month = calendar.monthrange(start_date.year, start_date.month)[1]
-            progress_bar.update(dates_progress, total=days_in_month)
-
-            prometheus_creds = cluster.get_cluster_prometheus_creds()
-            for i in range(days_in_month):
-                # Start time and End time are inclusive, so we want time from 00:00:00 to 23:59:59
-                start_time = start_date + timedelta(days=i)
-                end_time = start_time + timedelta(days=1) - timedelta(seconds=1)
-
-                progress_bar.update(
-                    dates_progress,
-                    completed=i,
-                    description=f"Processing {start_time.strftime('%Y-%m-%d')}",
-                )
-                params = {
-                    "query": query,
-                    "start": int(start_time.timestamp()),
-                    "end": int(end_time.timestamp()),
-                    "step": "1m",
-                }
-
-                query_api = promql_api.with_query(params)
-
-                resp = requests.get(str(query_api), auth=prometheus_creds)
-                resp.raise_for_status()
-
-                result = resp.json()["data"]["result"]
-                for row in result:
-                    username = row["metric"]["annotation_hub_jupyter_org_username"]
-
-                    if username in USERNAMES_TO_IGNORE:
-                        continue
-
-                    # Since "step" is 1m, each value that is present indicates this pod was present
-                    # for that minute. So the total number of values present indicates how long the
-                    # user was active.
-                    minutes_active = len(row["values"])
-                    user_activity[username] = (
-                        user_activity.get(username, 0) + minutes_active
-                    )
-            cluster_activity[cluster.spec["name"]] = len(user_activity)
-
             table.add_row(cluster.spec["name"], str(len(user_activity)))
 
     if csv_file:
         with open(csv_file, "w") as f:
             writer = csv.writer(f)
             writer.writerow(("cluster_name", "mau"))
-            for name, active_users in cluster_activity.items():
-                writer.writerow((name, str(active_users)))
+            # In the order of the clusters, rather than the order they finished in
+            for cluster in clusters:
+                name = cluster.spec["name"]
+                writer.writerow((name, str(cluster_activity[name])))
@@ -12,15 +12,12 @@ import json
 
 import requests
 import typer
-from ruamel.yaml import YAML
 
 from deployer.dev.app import grafana_app
 from deployer.infra_components.cluster import Cluster
 from deployer.utils.file_acquisition import get_all_cluster_yaml_files
 from deployer.utils.rendering import print_colour
 
-yaml = YAML(typ="safe")
-
 # Creates a new typer application, called "central"
 # and nest it as a sub-command under "grafana"
 
@@ -15,7 +15,6 @@ from base64 import b64encode
 
 import requests
 import typer
-from ruamel.yaml import YAML
 
 from deployer.dev.app import grafana_app
 from deployer.infra_components.cluster import Cluster
@@ -24,8 +23,7 @@ from deployer.utils.file_acquisition import (
     get_decrypted_file,
 )
 from deployer.utils.rendering import print_colour
-
-yaml = YAML(typ="safe")
+from deployer.utils.yaml_loader import load_yaml
 
 
 def get_grafana_admin_password():
@@ -42,7 +40,7 @@ def get_grafana_admin_password():
 
     with get_decrypted_file(grafana_credentials_filename) as decrypted_path:
         with open(decrypted_path) as f:
-            grafana_creds = yaml.load(f)
+            grafana_creds = load_yaml(f)
 
     return grafana_creds.get("grafana", {}).get("adminPassword", None)
 
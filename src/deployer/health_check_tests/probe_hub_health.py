@@ -0,0 +1,124 @@
+"""
+Quick health checks of hubs, that only make a few HTTP requests instead of
+starting a user server and running notebooks on it.
+
+Probing a hub checks that its JupyterHub API answers, that the token of the
+hub-health service is accepted, that the proxy has a route to the hub, and, for
+daskhubs, that the dask-gateway API answers. This takes well under a second per
+hub, so all hubs can be probed often, with the slow notebook checks only run when
+a probe fails.
+"""
+
+import asyncio
+import time
+
+import aiohttp
+import yarl
+
+
+class ProbeError(Exception):
+    pass
+
+
+async def _get_json(session, url, api_token=None):
+    headers = {"Authorization": f"token {api_token}"} if api_token else {}
+    async with session.get(url, headers=headers) as response:
+        if response.status != 200:
+            raise ProbeError(f"GET {url.path} returned {response.status}")
+        try:
+            data = await response.json(content_type=None)
+        except ValueError:
+            raise ProbeError(f"GET {url.path} didn't return JSON")
+    if not isinstance(data, dict):
+        raise ProbeError(f"GET {url.path} didn't return a JSON object")
+    return data
+
+
+async def _probe_hub_api(session, api_url):
+    info = await _get_json(session, api_url)
+    if "version" not in info:
+        raise ProbeError(f"GET {api_url.path} returned no JupyterHub version")
+
+
+async def _probe_self(session, api_url, api_token):
+    # A service token identifies as the service itself, not as a user
+    model = await _get_json(session, api_url / "user", api_token)
+    if model.get("name") != "hub-health":
+        raise ProbeError(
+            f"The hub-health token identified as {model.get('kind')} {model.get('name')}"
+        )
+
+
+async def _probe_proxy_routes(session, api_url, api_token):
+    routes = await _get_json(session, api_url / "proxy", api_token)
+    if "/" not in routes:
+        raise ProbeError("The proxy has no route to the hub")
+
+
+async def _probe_dask_gateway(session, hub_url):
+    health = await _get_json(session, hub_url / "services/dask-gateway/api/health")
+    if health.get("status") != "pass":
+        raise ProbeError(f"dask-gateway reported its health as {health}")
+
+
+async def probe_hub(session, hub_url, api_token, hub_type):
+    """
+    Probe the APIs of a hub, all at the same time.
+
+    Returns:
+        dict: Maps the name of each probe to its result, a dict with its "status"
+            ("passed" or "failed"), its "duration" in seconds, and the "error" it
+            failed with
+    """
+    hub_url = yarl.URL(hub_url)
+    api_url = hub_url / "hub/api"
+    probes = {
+        "hub_api": _probe_hub_api(session, api_url),
+        "self": _probe_self(session, api_url, api_token),
+        "proxy_routes": _probe_proxy_routes(session, api_url, api_token),
+    }
+    if hub_type == "daskhub":
+        probes["dask_gateway"] = _probe_dask_gateway(session, hub_url)
+
+    async def run_probe(probe):
+        start_time = time.perf_counter()
+        error = None
+        try:
+            await probe
+        except (ProbeError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = str(e) or type(e).__name__
+        return {
+            "status": "failed" if error else "passed",
+            "duration": round(time.perf_counter() - start_time, 3),
+            "error": error,
+        }
+
+    results = await asyncio.gather(*(run_probe(p) for p in probes.values()))
+    return dict(zip(probes, results))
+
+
+async def probe_hubs_concurrently(checks, concurrency, timeout_s):
+    """
+    Probe many hubs over a single pool of HTTP connections, with at most
+    `concurrency` hubs probed at the same time.
+
+    Args:
+        checks (list[dict]): One dict per hub with its "url", "type" and the
+            "token" of its hub-health service
+        timeout_s (float): Seconds before giving up on a single request
+
+    Returns:
+        list[dict]: For each check, in the same order, the results of its probes
+            as returned by `probe_hub`
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    timeout = aiohttp.ClientTimeout(total=timeout_s)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+
+        async def probe(check):
+            async with semaphore:
+                return await probe_hub(
+                    session, check["url"], check["token"], check["type"]
+                )
+
+        return await asyncio.gather(*(probe(check) for check in checks))
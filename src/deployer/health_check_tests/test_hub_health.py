@@ -1,81 +1,225 @@
+import asyncio
 import os
+import time
 import traceback
+from enum import Enum
 from pathlib import Path
 
-from jhub_client.execute import JupyterHubAPI, execute_notebook
+from jhub_client.api import JupyterHubAPI
+from jhub_client.utils import parse_notebook_cells
+from rich.console import Console
+from rich.table import Table
 
 from deployer.utils.rendering import print_colour
 
+USERNAME = "deployment-service-check"
+
+# The phases of running a test notebook we time: deleting the user and server left
+# behind by an earlier check, starting a server, starting a kernel on it, running the
+# notebook's cells, and stopping the server
+PHASES = ["cleanup", "spawn", "kernel_start", "execution", "teardown"]
+
+
+class NotebookMode(str, Enum):
+    """
+    How to run the test notebooks of a hub
+    """
+
+    # One after another, each on a freshly started server
+    SEQUENTIAL = "sequential"
+    # One after another, all on the same server
+    SHARED_SERVER = "shared-server"
+    # All at the same time, each on the server of its own user
+    CONCURRENT = "concurrent"
+
 
 def notebook_dir(hub_type):
     return (Path(__file__).parent).joinpath("test-notebooks", hub_type)
 
 
-async def check_hub_health(hub_url, test_notebook_path, service_api_token):
+async def _reset_user(hub, username):
     """
-    After each hub gets deployed, validate that it 'works'.
-
-    Automatically create a temporary user, start their server and run a test notebook, making
-    sure it runs to completion. Stop and delete the test server at the end. If any of these
-    steps fail, declare the hub as having failed the health check
+    Delete `username` and its server, if left behind by an earlier check.
     """
+    # Cleanup: if the server takes more than 90s to start, then because it's in a `spawn pending` state,
+    # it cannot be deleted. So we delete it in the next iteration, before starting a new one,
+    # so that we don't have more than one running.
+    user = await hub.get_user(username)
+    if user:
+        if user["server"] and not user["pending"]:
+            await hub.ensure_server_deleted(username, 60)
 
-    username = "deployment-service-check"
+        # If we don't delete the user too, than we won't be able to start a kernel for it.
+        # This is because we would have lost its api token from the previous run.
+        await hub.delete_user(username)
 
-    # Export the hub health check service as an env var so that jhub_client can read it.
-    orig_service_token = os.environ.get("JUPYTERHUB_API_TOKEN", None)
 
-    try:
-        os.environ["JUPYTERHUB_API_TOKEN"] = service_api_token
-
-        # Cleanup: if the server takes more than 90s to start, then because it's in a `spawn pending` state,
-        # it cannot be deleted. So we delete it in the next iteration, before starting a new one,
-        # so that we don't have more than one running.
-        hub = JupyterHubAPI(hub_url)
-        async with hub:
-            user = await hub.get_user(username)
-            if user:
-                if user["server"] and not user["pending"]:
-                    await hub.ensure_server_deleted(username, 60)
-
-                # If we don't delete the user too, than we won't be able to start a kernel for it.
-                # This is because we would have lost its api token from the previous run.
-                await hub.delete_user(username)
-
-        # Create a new user, start a server and execute a notebook
-        await execute_notebook(
-            hub_url,
-            test_notebook_path,
-            username=username,
-            server_creation_timeout=360,
-            kernel_execution_timeout=600,  # This doesn't do anything yet
-            create_user=True,
-            delete_user=False,  # To be able to delete its server in case of failure
-            stop_server=True,  # If the health check succeeds, this will delete the server
-            validate=False,  # Don't validate notebook outputs. We only care that it runs top-to-bottom without error.
+def _elapsed(start_time):
+    return round(time.perf_counter() - start_time, 1)
+
+
+async def _execute_notebook(jupyter, username, test_notebook_path):
+    """
+    Run all code cells of a notebook in a new kernel on the server `jupyter`
+
+    Returns:
+        tuple[float, float]: How long starting the kernel and running the cells
+            took, in seconds
+    """
+    cells = parse_notebook_cells(test_notebook_path)
+    start_time = time.perf_counter()
+    kernel_id, kernel = await jupyter.ensure_kernel()
+    async with kernel:
+        kernel_start_duration = _elapsed(start_time)
+        start_time = time.perf_counter()
+        for code, _ in cells:
+            # We don't validate notebook outputs, only that it runs top-to-bottom
+            await kernel.send_code(username, code, timeout=600)
+    await jupyter.delete_kernel(kernel_id)
+    return kernel_start_duration, _elapsed(start_time)
+
+
+async def check_hub_health(
+    hub_url, test_notebook_paths, service_api_token, username=USERNAME
+):
+    """
+    After each hub gets deployed, validate that it 'works'.
+
+    Automatically create a temporary user, start their server and run the test notebooks
+    on it one after another, making sure they run to completion. Stop the test server at
+    the end, whether the notebooks ran or not. If any of these steps fail, declare the
+    hub as having failed the health check.
+
+    The user is kept (so its server can be deleted in the next check if it got stuck
+    starting), unless `username` is not the default one, as checks running notebooks
+    concurrently use one user per notebook.
+
+    Returns:
+        list[dict]: For each notebook, its "notebook" name, the "username" it ran as,
+            and how long each of `PHASES` took, in seconds, as "<phase>_duration".
+            Cleaning up after earlier checks and starting the server are only
+            counted for the first notebook run on a server, and stopping the
+            server for the last one. They are None for the other notebooks.
+    """
+    timings = []
+    # A hub API client per check, so concurrent checks don't share a token
+    hub = JupyterHubAPI(hub_url, api_token=service_api_token)
+    async with hub:
+        start_time = time.perf_counter()
+        await _reset_user(hub, username)
+        cleanup_duration = _elapsed(start_time)
+
+        # Creating the user switches the client to a token of the new user
+        start_time = time.perf_counter()
+        jupyter = await hub.ensure_server(username, timeout=360, create_user=True)
+        spawn_duration = _elapsed(start_time)
+        try:
+            async with jupyter:
+                for test_notebook_path in test_notebook_paths:
+                    print_colour(
+                        f"Running {os.path.basename(test_notebook_path)} test notebook on {hub_url}...",
+                        "yellow",
+                    )
+                    kernel_start_duration, execution_duration = await _execute_notebook(
+                        jupyter, username, test_notebook_path
+                    )
+                    timings.append(
+                        {
+                            "notebook": os.path.basename(test_notebook_path),
+                            "username": username,
+                            "cleanup_duration": cleanup_duration,
+                            "spawn_duration": spawn_duration,
+                            "kernel_start_duration": kernel_start_duration,
+                            "execution_duration": execution_duration,
+                            "teardown_duration": None,
+                        }
+                    )
+                    cleanup_duration = spawn_duration = None
+        except BaseException:
+            # Stop the server of a failed check too, without an error doing so
+            # hiding why the check failed
+            try:
+                await hub.ensure_server_deleted(username, timeout=60)
+            except Exception as e:
+                print_colour(
+                    f"Failed to stop the server of {username} on {hub_url}: {e}", "red"
+                )
+            raise
+
+        start_time = time.perf_counter()
+        await hub.ensure_server_deleted(username, timeout=60)
+
+        if username != USERNAME:
+            await hub.delete_user(username)
+        if timings:
+            timings[-1]["teardown_duration"] = _elapsed(start_time)
+
+    return timings
+
+
+def print_notebook_timings(hub_url, timings):
+    """
+    Print a table of how long each phase of running each test notebook of a hub took
+    """
+    table = Table(title=f"Test notebooks on {hub_url}")
+    table.add_column("Notebook")
+    table.add_column("User")
+    for phase in PHASES:
+        table.add_column(phase.replace("_", " ").capitalize(), justify="right")
+    for timing in timings:
+        table.add_row(
+            timing["notebook"],
+            timing["username"],
+            *(
+                (
+                    "-"
+                    if timing[f"{phase}_duration"] is None
+                    else f"{timing[f'{phase}_duration']:0.1f}s"
+                )
+                for phase in PHASES
+            ),
         )
-    finally:
-        if orig_service_token:
-            os.environ["JUPYTERHUB_API_TOKEN"] = orig_service_token
-        else:
-            del os.environ["JUPYTERHUB_API_TOKEN"]
+    Console().print(table)
+
 
+async def test_hub_healthy(
+    hub_url, api_token, hub_type, verbose, notebook_mode=NotebookMode.SEQUENTIAL
+):
+    """
+    Run the test notebooks for `hub_type` against the hub at `hub_url`, in the way
+    `notebook_mode` describes.
 
-async def test_hub_healthy(hub_url, api_token, hub_type, verbose):
+    Returns:
+        list[dict]: Timings of each notebook, as returned by `check_hub_health`
+    """
     nb_dir = notebook_dir(hub_type)
+    test_notebook_paths = sorted(
+        os.path.join(root, name) for root, _, files in os.walk(nb_dir) for name in files
+    )
     try:
         print_colour(f"Starting hub {hub_url} health validation...", "yellow")
-        for root, _, files in os.walk(nb_dir, topdown=False):
-            for _, name in enumerate(files):
-                # We only want to run the "scale_dask_workers.ipynb" file if the
-                # check_dask_scaling variable is true. We continue in the loop if
-                # check_dask_scaling == False when we iterate over this file.
-                print_colour(f"Running {name} test notebook...", "yellow")
-
-                test_notebook_path = os.path.join(root, name)
-                await check_hub_health(hub_url, test_notebook_path, api_token)
+        if notebook_mode == NotebookMode.SHARED_SERVER:
+            timings = await check_hub_health(hub_url, test_notebook_paths, api_token)
+        elif notebook_mode == NotebookMode.CONCURRENT:
+            notebook_timings = await asyncio.gather(
+                *(
+                    check_hub_health(
+                        hub_url, [test_notebook_path], api_token, f"{USERNAME}-{i + 1}"
+                    )
+                    for i, test_notebook_path in enumerate(test_notebook_paths)
+                )
+            )
+            timings = [timing for t in notebook_timings for timing in t]
+        else:
+            timings = []
+            for test_notebook_path in test_notebook_paths:
+                timings += await check_hub_health(
+                    hub_url, [test_notebook_path], api_token
+                )
 
+        print_notebook_timings(hub_url, timings)
         print_colour(f"Hub {hub_url} is healthy!")
+        return timings
     except Exception as e:
         print_colour(
             f"Hub {hub_url} not healthy! Stopping further deployments. Exception was {e}.",
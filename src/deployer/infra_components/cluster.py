@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import copy
+import fnmatch
+import functools
 import json
 import os
 import subprocess
@@ -7,21 +10,32 @@ import tempfile
 from contextlib import ExitStack, contextmanager
 from pathlib import Path
 
-from ruamel.yaml import YAML
-
 from deployer.infra_components.hub import Hub
+from deployer.utils import tracing
+from deployer.utils.auth_sessions import (
+    get_session_key,
+    restore_session,
+    save_session,
+)
 from deployer.utils.env_vars_management import unset_env_vars
 from deployer.utils.file_acquisition import (
     CONFIG_CLUSTERS_PATH,
     HELM_CHARTS_DIR,
     get_decrypted_file,
     get_decrypted_files,
+    load_config_file,
+)
+from deployer.utils.helm import (
+    update_chart_dependencies,
+    wait_for_deployments_daemonsets,
 )
-from deployer.utils.helm import wait_for_deployments_daemonsets
 from deployer.utils.jsonnet import render_jsonnet
 from deployer.utils.rendering import print_colour
+from deployer.utils.yaml_loader import load_yaml
 
-yaml = YAML(typ="rt")
+# Maps the names of clusters we are currently authenticated against to the
+# KUBECONFIG used for them, so nested calls to `Cluster.auth` can be no-ops
+_active_auth_sessions = {}
 
 
 class Cluster:
@@ -30,15 +44,24 @@ class Cluster:
     """
 
     @classmethod
-    def get_all(cls):
+    def get_all(cls, provider=None, hub_type=None, name_glob=None) -> ClusterRegistry:
         """
-        Returns a list of all the clusters currently listed under config/clusters
+        Returns all the clusters currently listed under config/clusters, optionally
+        filtered by provider, by having a hub of the given type, or by name.
+
+        Clusters are only loaded when first accessed, see `ClusterRegistry`.
         """
-        return [
-            cls.from_name(d.name)
-            for d in CONFIG_CLUSTERS_PATH.iterdir()
-            if d.is_dir() and d.name != "templates"
-        ]
+        return cls.registry().filter(
+            provider=provider, hub_type=hub_type, name_glob=name_glob
+        )
+
+    @classmethod
+    @functools.cache
+    def registry(cls) -> ClusterRegistry:
+        """
+        Returns the registry of all clusters, shared for the whole run
+        """
+        return ClusterRegistry()
 
     @classmethod
     def from_name(cls, cluster_name: str) -> Cluster:
@@ -48,7 +71,7 @@ class Cluster:
             raise FileNotFoundError(f"No cluster named {cluster_name} found")
 
         with open(cluster_config_path) as f:
-            config = yaml.load(f)
+            config = load_yaml(f)
         return cls(config, cluster_config_path)
 
     def __init__(self, spec, config_path: Path):
@@ -57,26 +80,66 @@ class Cluster:
         self.config_dir = config_path.parent
         self.hubs = [Hub(self, hub_spec) for hub_spec in self.spec.get("hubs", [])]
         self.support = self.spec.get("support", {})
+        self._hubs_by_name = {hub.spec["name"]: hub for hub in self.hubs}
+
+    def get_hub(self, hub_name) -> Hub:
+        """
+        Return the hub named `hub_name` on this cluster
+        """
+        if hub_name not in self._hubs_by_name:
+            raise ValueError(f"No hub named {hub_name} found in {self.spec['name']}")
+        return self._hubs_by_name[hub_name]
 
     @contextmanager
     def auth(self, silent=False):
+        cluster_name = self.spec["name"]
+        with tracing.trace_attributes(cluster=cluster_name):
+            yield from self._auth(silent)
+
+    def _auth(self, silent):
+        cluster_name = self.spec["name"]
+        active_kubeconfig = _active_auth_sessions.get(cluster_name)
+        if active_kubeconfig and os.environ.get("KUBECONFIG") == active_kubeconfig:
+            # We're already inside an `auth()` for this cluster, reuse it
+            yield
+            return
+
         if self.spec["provider"] == "gcp":
-            yield from self.auth_gcp(silent)
+            auth_method = self.auth_gcp
         elif self.spec["provider"] == "aws":
-            yield from self.auth_aws(silent)
+            auth_method = self.auth_aws
         elif self.spec["provider"] == "azure":
-            yield from self.auth_azure(silent)
+            auth_method = self.auth_azure
         elif self.spec["provider"] == "kubeconfig":
-            yield from self.auth_kubeconfig(silent)
+            auth_method = self.auth_kubeconfig
         else:
             raise ValueError(f"Provider {self.spec['provider']} not supported")
 
+        with ExitStack() as auth_stack:
+            with tracing.span("auth", provider=self.spec["provider"]):
+                auth_stack.enter_context(contextmanager(auth_method)(silent))
+            _active_auth_sessions[cluster_name] = os.environ["KUBECONFIG"]
+            try:
+                yield
+            finally:
+                _active_auth_sessions.pop(cluster_name, None)
+
+    def _auth_session_key(self):
+        """
+        Return the key used to cache kubeconfigs for this cluster across auth calls
+        """
+        provider = self.spec["provider"]
+        config = self.spec[provider]
+        return get_session_key(
+            self.spec["name"], config, self.config_dir / config["key"]
+        )
+
     def deploy_support(self, cert_manager_version, debug, skip_crds, dry_run):
         if not skip_crds:
             cert_manager_url = "https://charts.jetstack.io"
 
             print_colour("Provisioning cert-manager...")
-            subprocess.check_call(
+            tracing.check_call(
                 [
                     "kubectl",
                     "apply",
@@ -84,7 +147,7 @@ class Cluster:
                     f"https://github.com/cert-manager/cert-manager/releases/download/{cert_manager_version}/cert-manager.crds.yaml",
                 ]
             )
-            subprocess.check_call(
+            tracing.check_call(
                 [
                     "helm",
                     "upgrade",
@@ -113,7 +176,7 @@ class Cluster:
                 # calico `Installation` object can be set up.
                 # I deeply loathe the operator *singleton* pattern.
                 tigera_operator_version = "v3.29.3"
-                subprocess.check_call(
+                tracing.check_call(
                     [
                         "kubectl",
                         "apply",
@@ -140,7 +203,7 @@ class Cluster:
                     }
                 }
                 patch_tolerations_json = json.dumps(patch_tolerations)
-                subprocess.check_call(
+                tracing.check_call(
                     [
                         "kubectl",
                         "--namespace",
@@ -157,7 +220,7 @@ class Cluster:
         print_colour("Provisioning support charts...")
 
         support_dir = HELM_CHARTS_DIR.joinpath("support")
-        subprocess.check_call(["helm", "dep", "up", support_dir])
+        update_chart_dependencies(support_dir)
 
         # contains both encrypted and unencrypted values files
         values_file_paths = [
@@ -197,7 +260,7 @@ class Cluster:
                 cmd.append("--dry-run")
 
             print_colour(f"Running {' '.join([str(c) for c in cmd])}")
-            subprocess.check_call(cmd)
+            tracing.check_call(cmd)
 
         wait_for_deployments_daemonsets("support")
         print_colour("Done!")
@@ -254,17 +317,22 @@ class Cluster:
 
             os.environ["KUBECONFIG"] = kubeconfig.name
 
-            subprocess.check_call(
-                [
-                    "aws",
-                    "eks",
-                    "update-kubeconfig",
-                    f"--name={cluster_name}",
-                    f"--region={region}",
-                ],
-                stdout=subprocess.DEVNULL if silent else None,
-                stderr=subprocess.DEVNULL if silent else None,
-            )
+            # The kubeconfig calls `aws eks get-token` with the credentials from
+            # the environment variables set above, so it can safely be reused
+            session_key = self._auth_session_key()
+            if not restore_session(session_key, kubeconfig.name):
+                tracing.check_call(
+                    [
+                        "aws",
+                        "eks",
+                        "update-kubeconfig",
+                        f"--name={cluster_name}",
+                        f"--region={region}",
+                    ],
+                    stdout=subprocess.DEVNULL if silent else None,
+                    stderr=subprocess.DEVNULL if silent else None,
+                )
+                save_session(session_key, kubeconfig.name)
 
             yield
 
@@ -293,8 +361,13 @@ class Cluster:
                 with open(decrypted_key_path) as f:
                     service_principal = json.load(f)
 
+            # Unlike for gcp and aws, we don't reuse cached kubeconfigs here. The
+            # kubeconfig of clusters using Azure AD calls kubelogin, which relies
+            # on the `az login` below rather than on credentials we set up
+            # ourselves, so a cached kubeconfig isn't usable on its own.
+
             # Login to Azure
-            subprocess.check_call(
+            tracing.check_call(
                 [
                     "az",
                     "login",
@@ -308,7 +381,7 @@ class Cluster:
             )
 
             # Set the Azure subscription
-            subprocess.check_call(
+            tracing.check_call(
                 [
                     "az",
                     "account",
@@ -320,7 +393,7 @@ class Cluster:
             )
 
             # Get cluster creds
-            subprocess.check_call(
+            tracing.check_call(
                 [
                     "az",
                     "ask",
@@ -353,20 +426,25 @@ class Cluster:
                 os.environ["KUBECONFIG"] = kubeconfig.name
                 os.environ["CLOUDSDK_AUTH_CREDENTIAL_FILE_OVERRIDE"] = decrypted_file
 
-                subprocess.check_call(
-                    [
-                        "gcloud",
-                        "container",
-                        "clusters",
-                        # --zone works with regions too
-                        f"--zone={location}",
-                        f"--project={project}",
-                        "get-credentials",
-                        cluster,
-                    ],
-                    stdout=subprocess.DEVNULL if silent else None,
-                    stderr=subprocess.DEVNULL if silent else None,
-                )
+                # The kubeconfig uses gke-gcloud-auth-plugin with the credentials
+                # file set above to fetch tokens, so it can safely be reused
+                session_key = self._auth_session_key()
+                if not restore_session(session_key, kubeconfig.name):
+                    tracing.check_call(
+                        [
+                            "gcloud",
+                            "container",
+                            "clusters",
+                            # --zone works with regions too
+                            f"--zone={location}",
+                            f"--project={project}",
+                            "get-credentials",
+                            cluster,
+                        ],
+                        stdout=subprocess.DEVNULL if silent else None,
+                        stderr=subprocess.DEVNULL if silent else None,
+                    )
+                    save_session(session_key, kubeconfig.name)
 
                 yield
         finally:
@@ -388,7 +466,7 @@ class Cluster:
         """
         config_file = self.config_dir / "support.values.yaml"
         with open(config_file) as f:
-            support_config = yaml.load(f)
+            support_config = load_yaml(f)
 
         grafana_tls_config = (
             support_config.get("grafana", {}).get("ingress", {}).get("tls", [])
@@ -410,7 +488,7 @@ class Cluster:
         # Read the secret grafana token file
         with get_decrypted_file(grafana_token_file) as decrypted_file_path:
             with open(decrypted_file_path) as f:
-                config = yaml.load(f)
+                config = load_yaml(f)
 
         if "grafana_token" not in config.keys():
             raise ValueError(
@@ -428,7 +506,7 @@ class Cluster:
 
         config_file = self.config_dir / "support.values.yaml"
         with open(config_file) as f:
-            support_config = yaml.load(f)
+            support_config = load_yaml(f)
 
         tls_config = (
             support_config.get("prometheus", {})
@@ -455,7 +533,7 @@ class Cluster:
 
         with get_decrypted_file(config_filename) as decrypted_path:
             with open(decrypted_path) as f:
-                support_config = yaml.load(f)
+                support_config = load_yaml(f)
 
         # Don't return the address if the prometheus instance wasn't securely exposed to the outside.
         auth = support_config.get("prometheusAuthSecret", {})
@@ -491,3 +569,78 @@ class Cluster:
             render_args["account_id"] = None
         with render_jsonnet(**render_args) as rendered_file:
             yield rendered_file
+
+
+class ClusterRegistry:
+    """
+    A lazily loaded index of the clusters under config/clusters.
+
+    Listing clusters only lists directories. A cluster's cluster.yaml is only
+    read when something about it (like its provider) is needed, and `Cluster`
+    objects are only built when a cluster is actually accessed. Both are then
+    reused for the rest of the run.
+    """
+
+    def __init__(self, clusters_path: Path = None, names=None, clusters=None):
+        self.clusters_path = clusters_path or CONFIG_CLUSTERS_PATH
+        if names is None:
+            names = sorted(
+                d.name
+                for d in self.clusters_path.iterdir()
+                if d.is_dir()
+                and d.name != "templates"
+                and (d / "cluster.yaml").exists()
+            )
+        self.names = names
+        # Shared between a registry and any filtered views of it
+        self._clusters = {} if clusters is None else clusters
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        for name in self.names:
+            yield self.get(name)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def get_spec(self, name):
+        """
+        Return the parsed cluster.yaml of the named cluster, without building a
+        `Cluster` for it. The returned data is shared, and must not be modified.
+        """
+        return load_config_file(self.clusters_path / name / "cluster.yaml")
+
+    def get(self, name) -> Cluster:
+        """
+        Return the `Cluster` object for the named cluster, building it if needed
+        """
+        if name not in self._clusters:
+            if name not in self.names:
+                raise FileNotFoundError(f"No cluster named {name} found")
+            self._clusters[name] = Cluster(
+                copy.deepcopy(self.get_spec(name)),
+                self.clusters_path / name / "cluster.yaml",
+            )
+        return self._clusters[name]
+
+    def filter(self, provider=None, hub_type=None, name_glob=None) -> ClusterRegistry:
+        """
+        Return a view of this registry with only the clusters matching all the
+        given filters.
+
+        Filtering by name doesn't read any files, filtering by provider reads
+        cluster.yaml files, and filtering by hub type (like "daskhub") also needs
+        to read the values files of hubs.
+        """
+        names = self.names
+        if name_glob:
+            names = [n for n in names if fnmatch.fnmatch(n, name_glob)]
+        if provider:
+            names = [n for n in names if self.get_spec(n)["provider"] == provider]
+        if hub_type:
+            names = [
+                n for n in names if any(h.type == hub_type for h in self.get(n).hubs)
+            ]
+        return ClusterRegistry(self.clusters_path, names, self._clusters)
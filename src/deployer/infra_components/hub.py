@@ -1,25 +1,23 @@
 from __future__ import annotations
 
+import functools
 import os
-import subprocess
 from contextlib import ExitStack, contextmanager
 from pathlib import Path
 from typing import TYPE_CHECKING
 
-from ruamel.yaml import YAML
-
 if TYPE_CHECKING:
     from deployer.infra_components.cluster import Cluster
 
+from deployer.utils import tracing
 from deployer.utils.file_acquisition import (
     get_decrypted_file,
     get_decrypted_files,
+    load_config_file,
 )
 from deployer.utils.helm import wait_for_deployments_daemonsets
 from deployer.utils.rendering import print_colour
-
-# Without `pure=True`, I get an exception about str / byte issues
-yaml = YAML(typ="safe", pure=True)
+from deployer.utils.yaml_loader import load_yaml
 
 
 class Hub:
@@ -31,72 +29,103 @@ class Hub:
         self.cluster = cluster
         self.spec = spec
 
-        self.type = "basehub"
-        self.legacy_daskhub = False
-        self.binderhub_ui = False
-        self.imagebuilding = False
-        self.authenticator = False
+    @property
+    def legacy_daskhub(self):
+        """
+        True if the hub is using the legacy daskhub helm chart
+        """
+        return self.spec["helm_chart"] == "daskhub"
+
+    @property
+    def type(self):
+        """
+        "daskhub" if the hub is set up for dask-gateway, "basehub" otherwise
+        """
+        return self._features["type"]
+
+    @property
+    def binderhub_ui(self):
+        return self._features["binderhub_ui"]
+
+    @property
+    def imagebuilding(self):
+        return self._features["imagebuilding"]
+
+    @property
+    def authenticator(self):
+        return self._features["authenticator"]
+
+    @functools.cached_property
+    def _features(self):
+        """
+        Detect characteristics of the hub from its non-secret values files.
+
+        This is only done on first access, as it requires reading all the values
+        files and many commands never need it.
+        """
+        features = {
+            "type": "basehub",
+            "binderhub_ui": False,
+            "imagebuilding": False,
+            "authenticator": False,
+        }
         dask_gateway = False
         daskhub_setup = False
         binderhub_ui = False
         binderhub_service = False
 
         # Check if the hub is using the legacy daskhub helm chart
-        if self.spec["helm_chart"] == "daskhub":
-            self.type = "daskhub"
-            self.legacy_daskhub = True
+        if self.legacy_daskhub:
+            features["type"] = "daskhub"
         # Go through the values files and check for other characteristics
         for values_file in self.spec["helm_chart_values_files"]:
             if "secret" not in values_file:
-                config_filename = self.cluster.config_dir / values_file
-                with open(config_filename) as f:
-                    config = yaml.load(f)
-                    # If its a legacy daskhub, the config will be nested under the "basehub" key
-                    if "daskhub" in self.type:
-                        config = config.get("basehub", {})
-                    else:
-                        if config.get("dask-gateway", {}).get("enabled", False):
-                            dask_gateway = True
-                        if (
-                            config.get("jupyterhub", {})
-                            .get("custom", {})
-                            .get("daskhubSetup", {})
-                            .get("enabled", False)
-                        ):
-                            daskhub_setup = True
+                config = load_config_file(self.cluster.config_dir / values_file)
+                # If its a legacy daskhub, the config will be nested under the "basehub" key
+                if "daskhub" in features["type"]:
+                    config = config.get("basehub", {})
+                else:
+                    if config.get("dask-gateway", {}).get("enabled", False):
+                        dask_gateway = True
                     if (
                         config.get("jupyterhub", {})
                         .get("custom", {})
-                        .get("binderhubUI", {})
+                        .get("daskhubSetup", {})
                         .get("enabled", False)
                     ):
-                        binderhub_ui = True
-                    if config.get("binderhub-service", {}).get("enabled", False):
-                        binderhub_service = True
-                    self.authenticator = (
-                        config.get("jupyterhub", {})
-                        .get("hub", {})
-                        .get("config", {})
-                        .get("JupyterHub", {})
-                        .get("authenticator_class", "")
-                    )
+                        daskhub_setup = True
+                if (
+                    config.get("jupyterhub", {})
+                    .get("custom", {})
+                    .get("binderhubUI", {})
+                    .get("enabled", False)
+                ):
+                    binderhub_ui = True
+                if config.get("binderhub-service", {}).get("enabled", False):
+                    binderhub_service = True
+                features["authenticator"] = (
+                    config.get("jupyterhub", {})
+                    .get("hub", {})
+                    .get("config", {})
+                    .get("JupyterHub", {})
+                    .get("authenticator_class", "")
+                )
         if dask_gateway and daskhub_setup:
-            self.type = "daskhub"
+            features["type"] = "daskhub"
         if binderhub_ui and binderhub_service:
-            self.binderhub_ui = True
+            features["binderhub_ui"] = True
         # If it just has the binderhub-service enabled, but not the binderhub-ui,
         # then we consider it an imagebuilding hub
         elif binderhub_service:
-            self.imagebuilding = True
+            features["imagebuilding"] = True
+        return features
 
-    def deploy(self, chart_dir, dask_gateway_version, debug, dry_run):
+    def _apply_domain_override(self):
         """
-        Deploy this hub
+        Support overriding domain configuration in the loaded cluster.yaml via
+        a cluster.yaml specified enc-<something>.secret.yaml file that only
+        includes the domain configuration of a typical cluster.yaml file.
         """
-        # Support overriding domain configuration in the loaded cluster.yaml via
-        # a cluster.yaml specified enc-<something>.secret.yaml file that only
-        # includes the domain configuration of a typical cluster.yaml file.
-        #
         # Check if this hub has an override file. If yes, apply override.
         #
         # FIXME: This could could be generalized so that the cluster.yaml would allow
@@ -111,16 +140,77 @@ class Hub:
                 self.cluster.config_dir / domain_override_file
             ) as decrypted_path:
                 with open(decrypted_path) as f:
-                    domain_override_config = yaml.load(f)
+                    domain_override_config = load_yaml(f)
 
             self.spec["domain"] = domain_override_config["domain"]
 
+    @contextmanager
+    def _helm_values_args(self, chart_dir):
+        """
+        Decrypt and render all values files of this hub, and yield the `--values`
+        arguments to pass them to helm with.
+        """
+        self._apply_domain_override()
+
+        with (
+            get_decrypted_files(
+                self.cluster.config_dir / p
+                for p in self.spec["helm_chart_values_files"]
+            ) as values_files,
+            ExitStack() as jsonnet_stack,
+        ):
+            # Add on rendered jsonnet values.yaml file for the chart
+            rendered_values_path = jsonnet_stack.enter_context(
+                self.render_jsonnet(
+                    chart_dir / "values.jsonnet",
+                )
+            )
+
+            args = ["--values", rendered_values_path]
+
+            # Add on the values files
+            for values_file in values_files:
+                _, ext = os.path.splitext(values_file)
+                if ext == ".jsonnet":
+                    rendered_path = jsonnet_stack.enter_context(
+                        self.render_jsonnet(Path(values_file))
+                    )
+                    args.append(f"--values={rendered_path}")
+                else:
+                    args.append(f"--values={values_file}")
+
+            yield args
+
+    def render_manifests(self, chart_dir):
+        """
+        Return the manifests `helm upgrade` would apply when deploying this hub.
+
+        The chart is rendered with `--dry-run=server`, so template functions that
+        look up existing objects in the cluster (like the ones generating secret
+        tokens in the jupyterhub chart) return what is already there. Expects to
+        be called from inside `cluster.auth()` of the hub's cluster.
+        """
+        with self._helm_values_args(chart_dir) as values_args:
+            cmd = [
+                "helm",
+                "template",
+                self.spec["name"],
+                chart_dir,
+                f"--namespace={self.spec['name']}",
+                "--dry-run=server",
+                *values_args,
+            ]
+            return tracing.check_output(cmd, text=True)
+
+    def deploy(self, chart_dir, dask_gateway_version, debug, dry_run):
+        """
+        Deploy this hub
+        """
         for values_file in self.spec["helm_chart_values_files"]:
             if "secret" not in os.path.basename(
                 values_file
             ) and not values_file.endswith(".jsonnet"):
-                values_file = self.cluster.config_dir / values_file
-                config = yaml.load(values_file)
+                config = load_config_file(self.cluster.config_dir / values_file)
                 # Check if there's config that enables dask-gateway
                 dask_gateway_enabled = config.get("dask-gateway", {}).get(
                     "enabled", False
@@ -136,16 +226,9 @@ class Hub:
             ]
 
             for manifest_url in manifest_urls:
-                subprocess.check_call(["kubectl", "apply", "-f", manifest_url])
-
-        with (
-            get_decrypted_files(
-                self.cluster.config_dir / p
-                for p in self.spec["helm_chart_values_files"]
-            ) as values_files,
-            ExitStack() as jsonnet_stack,
-        ):
+                tracing.check_call(["kubectl", "apply", "-f", manifest_url])
 
+        with self._helm_values_args(chart_dir) as values_args:
             cmd = [
                 "helm",
                 "upgrade",
@@ -154,38 +237,19 @@ class Hub:
                 f"--namespace={self.spec['name']}",
                 self.spec["name"],
                 chart_dir,
+                *values_args,
             ]
 
-            # Add on rendered jsonnet values.yaml file for the chart
-            rendered_values_path = jsonnet_stack.enter_context(
-                self.render_jsonnet(
-                    chart_dir / "values.jsonnet",
-                )
-            )
-
-            cmd += ["--values", rendered_values_path]
-
             if dry_run:
                 cmd.append("--dry-run")
 
             if debug:
                 cmd.append("--debug")
 
-            # Add on the values files
-            for values_file in values_files:
-                _, ext = os.path.splitext(values_file)
-                if ext == ".jsonnet":
-                    rendered_path = jsonnet_stack.enter_context(
-                        self.render_jsonnet(Path(values_file))
-                    )
-                    cmd.append(f"--values={rendered_path}")
-                else:
-                    cmd.append(f"--values={values_file}")
-
             # join method will fail on the PosixPath element if not transformed
             # into a string first
             print_colour(f"Running {' '.join([str(c) for c in cmd])}")
-            subprocess.check_call(cmd)
+            tracing.check_call(cmd)
 
         if not dry_run:
             wait_for_deployments_daemonsets(self.spec["name"])
@@ -0,0 +1,86 @@
+"""
+Functions for caching the kubeconfig files generated when authenticating with our
+clusters, so repeated authentication with the same cluster doesn't need to shell
+out to `gcloud` or `aws` every time.
+
+Only kubeconfigs that work on their own, once the credentials the auth method
+sets up every time (like the AWS keys in environment variables) are in place,
+can be cached. Azure kubeconfigs can rely on the state of `az login` instead, so
+they aren't cached.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+AUTH_SESSIONS_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    / "2i2c-deployer"
+    / "auth-sessions"
+)
+# How long (in seconds) a cached kubeconfig is reused before we authenticate
+# from scratch again. Kept well below the lifetime of the cloud provider tokens.
+AUTH_SESSION_TTL = int(os.environ.get("DEPLOYER_AUTH_SESSION_TTL", 45 * 60))
+
+
+def get_session_key(cluster_name, provider_config, key_path=None):
+    """
+    Return a key identifying an authentication session with a cluster.
+
+    The key changes whenever the auth config in cluster.yaml or the (encrypted)
+    credentials file changes, so stale sessions are never reused.
+    """
+    h = hashlib.sha256(
+        json.dumps(provider_config, sort_keys=True, default=str).encode()
+    )
+    if key_path is not None:
+        with open(key_path, "rb") as f:
+            h.update(f.read())
+    return f"{cluster_name}-{h.hexdigest()[:16]}"
+
+
+def restore_session(session_key, kubeconfig_path):
+    """
+    Copy a cached, unexpired kubeconfig for `session_key` to `kubeconfig_path`.
+
+    Returns True if a cached session was restored, False otherwise.
+    """
+    if os.environ.get("DEPLOYER_NO_AUTH_SESSIONS"):
+        return False
+
+    cached_path = AUTH_SESSIONS_DIR / session_key
+    try:
+        age = time.time() - cached_path.stat().st_mtime
+    except FileNotFoundError:
+        return False
+    if age > AUTH_SESSION_TTL:
+        cached_path.unlink(missing_ok=True)
+        return False
+
+    shutil.copyfile(cached_path, kubeconfig_path)
+    return True
+
+
+def save_session(session_key, kubeconfig_path):
+    """
+    Cache the kubeconfig at `kubeconfig_path` for `session_key`.
+
+    Kubeconfigs can contain credentials, so the cache directory and the files in
+    it are only accessible to the current user.
+    """
+    if os.environ.get("DEPLOYER_NO_AUTH_SESSIONS"):
+        return
+
+    AUTH_SESSIONS_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+    os.chmod(AUTH_SESSIONS_DIR, 0o700)
+
+    cached_path = AUTH_SESSIONS_DIR / session_key
+    tmp_path = cached_path.with_suffix(".tmp")
+    with open(kubeconfig_path, "rb") as src:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, cached_path)
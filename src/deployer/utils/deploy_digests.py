@@ -0,0 +1,119 @@
+"""
+Functions for keeping track of what was deployed to a hub, so deploying it again
+can be skipped when nothing it would change has changed.
+
+A deploy digest holds a hash of every Kubernetes resource in the manifests helm
+rendered for a hub, together with the revision of the helm release that the
+successful deploy created. When a hub is deployed incrementally, its manifests
+are rendered again and compared with the digest of its last deploy. If the
+hashes match and the release is still at the recorded revision (so nobody else
+has deployed it since), the `helm upgrade` and waiting for the rollout is
+skipped.
+
+Digests are kept as one small JSON file per hub in `DEPLOY_DIGESTS_DIR`, which
+can be persisted between CI jobs with a cache. A missing or stale digest only
+ever causes a hub to be deployed when it didn't need to be.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from deployer.utils.yaml_loader import load_all_yaml
+
+DEPLOY_DIGESTS_DIR = Path(
+    os.environ.get(
+        "DEPLOYER_DEPLOY_DIGESTS_DIR",
+        Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+        / "2i2c-deployer"
+        / "deploy-digests",
+    )
+)
+
+
+def get_manifests_digest(manifests, default_namespace):
+    """
+    Hash each resource in the output of `helm template`.
+
+    Resources are parsed and serialized again before being hashed, so the digest
+    doesn't depend on the order of keys or on formatting in the chart templates.
+
+    Args:
+        manifests (str): Rendered manifests, as YAML documents
+        default_namespace (str): Namespace of resources that don't set one
+
+    Returns:
+        dict: Maps "<kind>/<namespace>/<name>" of each resource to its sha256 hash
+    """
+    digest = {}
+    for resource in load_all_yaml(manifests):
+        metadata = resource.get("metadata", {})
+        key = "/".join(
+            [
+                resource.get("kind", ""),
+                metadata.get("namespace", default_namespace),
+                metadata.get("name", ""),
+            ]
+        )
+        digest[key] = hashlib.sha256(
+            json.dumps(resource, sort_keys=True, default=str).encode()
+        ).hexdigest()
+    return digest
+
+
+def describe_changes(previous, current):
+    """
+    Describe how the resources in two manifest digests differ.
+
+    Returns:
+        list[str]: One line per added, removed or changed resource
+    """
+    changes = []
+    for key in sorted(previous.keys() | current.keys()):
+        if key not in previous:
+            changes.append(f"added: {key}")
+        elif key not in current:
+            changes.append(f"removed: {key}")
+        elif previous[key] != current[key]:
+            changes.append(f"changed: {key}")
+    return changes
+
+
+def _get_digest_path(cluster_name, release_name):
+    return DEPLOY_DIGESTS_DIR / cluster_name / f"{release_name}.json"
+
+
+def load_deploy_digest(cluster_name, release_name):
+    """
+    Return the digest saved by the last incremental deploy of a release, or None.
+    """
+    try:
+        with open(_get_digest_path(cluster_name, release_name)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_deploy_digest(cluster_name, release_name, digest):
+    """
+    Save the digest of a successful deploy of a release, replacing any previous one
+    atomically.
+    """
+    path = _get_digest_path(cluster_name, release_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{release_name}-", suffix=".json"
+    )
+    with os.fdopen(fd, "w") as f:
+        json.dump(digest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def forget_deploy_digest(cluster_name, release_name):
+    """
+    Remove the saved digest of a release, so its next incremental deploy isn't
+    skipped.
+    """
+    _get_digest_path(cluster_name, release_name).unlink(missing_ok=True)
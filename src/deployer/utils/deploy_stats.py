@@ -0,0 +1,120 @@
+"""
+Functions for keeping track of how long deploying each hub takes, so work can be
+planned around how long it is expected to take.
+
+Durations of the last few successful deploys of each hub are kept in a small JSON
+file, `DEPLOY_STATS_FILE`, written by the deploy command.
+"""
+
+import json
+import os
+import statistics
+import tempfile
+from pathlib import Path
+
+DEPLOY_STATS_FILE = Path(
+    os.environ.get(
+        "DEPLOYER_DEPLOY_STATS_FILE",
+        Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+        / "2i2c-deployer"
+        / "deploy-stats.json",
+    )
+)
+
+# How many of the most recent durations to keep for each hub
+MAX_DURATIONS = 10
+
+# Expected duration of deploying a hub, in seconds, when we don't know of any
+# earlier deploys
+DEFAULT_DURATION = 300
+
+
+def load_deploy_stats():
+    """
+    Return the recorded deploy durations, as a dict mapping "<cluster>/<hub>" to
+    a list of durations in seconds, oldest first.
+    """
+    try:
+        with open(DEPLOY_STATS_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def record_deploy_durations(durations):
+    """
+    Add the durations of successful deploys to `DEPLOY_STATS_FILE`.
+
+    Args:
+        durations (dict): Maps (cluster name, hub name) tuples to how long
+            deploying the hub took, in seconds
+    """
+    if not durations:
+        return
+    _add_deploy_stats(
+        {
+            f"{cluster_name}/{hub_name}": [round(duration, 1)]
+            for (cluster_name, hub_name), duration in durations.items()
+        }
+    )
+
+
+def merge_deploy_stats(stats_files):
+    """
+    Add the durations recorded in other deploy stats files, like the ones written
+    by separate CI jobs, to `DEPLOY_STATS_FILE`.
+
+    Args:
+        stats_files (list[Path]): Files in the format of `DEPLOY_STATS_FILE`, with
+            durations that aren't in it yet
+    """
+    new_stats = {}
+    for path in stats_files:
+        with open(path) as f:
+            for key, durations in json.load(f).items():
+                new_stats.setdefault(key, []).extend(durations)
+    _add_deploy_stats(new_stats)
+
+
+def _add_deploy_stats(new_stats):
+    """
+    Append durations to the ones of each hub in `DEPLOY_STATS_FILE`, keeping the
+    last `MAX_DURATIONS` of them.
+    """
+    stats = load_deploy_stats()
+    for key, durations in new_stats.items():
+        stats[key] = (stats.get(key, []) + durations)[-MAX_DURATIONS:]
+
+    DEPLOY_STATS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=DEPLOY_STATS_FILE.parent, prefix=".deploy-stats-", suffix=".json"
+    )
+    with os.fdopen(fd, "w") as f:
+        json.dump(stats, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, DEPLOY_STATS_FILE)
+
+
+def get_expected_durations(stats=None):
+    """
+    Return a function estimating how long deploying a hub takes, in seconds.
+
+    The estimate is the median of the hub's recorded durations. Hubs without any
+    are expected to take as long as the median hub, or `DEFAULT_DURATION` if no
+    durations have been recorded at all.
+
+    Args:
+        stats (dict, optional): Recorded durations as returned by
+            `load_deploy_stats`, which is called when not given
+
+    Returns:
+        Callable[[str, str], float]: Takes a cluster name and a hub name
+    """
+    if stats is None:
+        stats = load_deploy_stats()
+    medians = {key: statistics.median(d) for key, d in stats.items() if d}
+    default = statistics.median(medians.values()) if medians else DEFAULT_DURATION
+
+    def get_expected_duration(cluster_name, hub_name):
+        return medians.get(f"{cluster_name}/{hub_name}", default)
+
+    return get_expected_duration
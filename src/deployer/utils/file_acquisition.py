@@ -3,9 +3,11 @@ Functions related to finding and reading files. Checking files exist, finding th
 absolute paths, decrypting and reading encrypted files when needed.
 """
 
+import atexit
+import hashlib
 import json
 import os
-import subprocess
+import sys
 import tempfile
 from contextlib import ExitStack, contextmanager
 from pathlib import Path
@@ -13,6 +15,9 @@ from pathlib import Path
 from ruamel.yaml import YAML
 from ruamel.yaml.scanner import ScannerError
 
+from deployer.utils import tracing
+from deployer.utils.yaml_loader import load_yaml
+
 yaml = YAML(typ="safe", pure=True)
 
 if "DEPLOYER_ROOT_PATH" in os.environ:
@@ -26,6 +31,35 @@ else:
 HELM_CHARTS_DIR = REPO_ROOT_PATH.joinpath("helm-charts")
 CONFIG_CLUSTERS_PATH = REPO_ROOT_PATH.joinpath("config/clusters")
 
+# Decrypted contents of sops encrypted files, keyed by (absolute path, sha256 of the
+# encrypted file), so we don't call `sops --decrypt` on the same file more than once
+# per run. Plaintext is only ever kept in memory here, and is written out to a 0600
+# temporary file (on tmpfs when available) only while a caller is using it.
+_decrypted_contents_cache = {}
+_decryption_stats = {"sops_calls": 0, "sops_calls_saved": 0}
+SECRETS_TMPDIR = "/dev/shm" if os.access("/dev/shm", os.W_OK) else None
+
+# Parsed contents of non-encrypted YAML config files, keyed by absolute path. Each
+# entry also records the mtime and size of the file when parsed, so edits to a file
+# during a run are picked up.
+_parsed_config_cache = {}
+
+
+@atexit.register
+def _clear_decrypted_contents_cache():
+    """
+    Drop all cached plaintext and report how many sops calls the cache saved
+    """
+    _decrypted_contents_cache.clear()
+    if _decryption_stats["sops_calls_saved"]:
+        # To stderr, as the stdout of some commands (like the JSON output of
+        # plan-upgrade) is read by other tools
+        print(
+            f"Decrypted {_decryption_stats['sops_calls']} secret files with sops, "
+            f"reused earlier decryptions {_decryption_stats['sops_calls_saved']} times",
+            file=sys.stderr,
+        )
+
 
 def _assert_file_exists(filepath):
     """Assert a filepath exists, raise an error if not. This function is to be used for
@@ -42,6 +76,41 @@ def _assert_file_exists(filepath):
         """)
 
 
+def load_config_file(filepath):
+    """
+    Return the parsed contents of a non-encrypted YAML config file, such as a hub's
+    helm chart values file.
+
+    Parsed contents are cached by path and modification time, so reading the same
+    file from many places in a run only parses it once. The returned data is shared
+    between all callers, so it must not be modified.
+
+    Args:
+        filepath (path object): Path to the YAML file to read
+
+    Returns:
+        The parsed contents of the file
+    """
+    filepath = os.path.abspath(filepath)
+    stat = os.stat(filepath)
+    cached = _parsed_config_cache.get(filepath)
+    if (
+        cached
+        and cached["mtime"] == stat.st_mtime_ns
+        and cached["size"] == stat.st_size
+    ):
+        return cached["content"]
+
+    with open(filepath) as f:
+        content = load_yaml(f)
+    _parsed_config_cache[filepath] = {
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "content": content,
+    }
+    return content
+
+
 def persist_config_in_encrypted_file(encrypted_file, new_config):
     """
     Write `config` to `encrypted_file` file.
@@ -49,20 +118,18 @@ def persist_config_in_encrypted_file(encrypted_file, new_config):
     If `encrypted_file` exits, then merge exiting config with `config` and write the merged config to file.
     """
     if Path(encrypted_file).is_file():
-        subprocess.check_call(["sops", "--decrypt", "--in-place", encrypted_file])
+        tracing.check_call(["sops", "--decrypt", "--in-place", encrypted_file])
         with open(encrypted_file, "r+") as f:
             config = yaml.load(f)
             config.update(new_config)
             f.seek(0)
             yaml.dump(config, f)
             f.truncate()
-        return subprocess.check_call(
-            ["sops", "--encrypt", "--in-place", encrypted_file]
-        )
+        return tracing.check_call(["sops", "--encrypt", "--in-place", encrypted_file])
 
     with open(encrypted_file, "a+") as f:
         yaml.dump(new_config, f)
-    return subprocess.check_call(["sops", "--encrypt", "--in-place", encrypted_file])
+    return tracing.check_call(["sops", "--encrypt", "--in-place", encrypted_file])
 
 
 def remove_jupyterhub_hub_config_key_from_encrypted_file(encrypted_file, key):
@@ -103,7 +170,7 @@ def remove_jupyterhub_hub_config_key_from_encrypted_file(encrypted_file, key):
             yaml.dump(remaining_config, f)
             f.truncate()
 
-        subprocess.check_call(["sops", "--encrypt", "--in-place", encrypted_file])
+        tracing.check_call(["sops", "--encrypt", "--in-place", encrypted_file])
         return
 
     # If the file only contained configuration for `key`, then we can safely delete it
@@ -118,7 +185,8 @@ def get_decrypted_file(original_filepath):
     sops key when we expect to, in case the decrypted contents have been leaked via
     version control. We expect to find the sops key in a file if the filename begins
     with "enc-" or contains the word "secret". If the file is not encrypted, we return
-    the original filepath.
+    the original filepath. Decrypted contents are cached in memory for the rest of
+    the run, so decrypting the same unchanged file again doesn't call sops.
 
     Args:
         original_filepath (path object): Absolute path to a file to perform checks on
@@ -146,7 +214,7 @@ def get_decrypted_file(original_filepath):
             if ext.endswith("json"):
                 loader_func = json.load
             else:
-                loader_func = yaml.load
+                loader_func = load_yaml
             try:
                 content = loader_func(f)
             except ScannerError:
@@ -161,11 +229,25 @@ def get_decrypted_file(original_filepath):
                 + "checked into version control and leaked!"
             )
 
-        # If file has a `sops` key, we assume it's sops encrypted
-        with tempfile.NamedTemporaryFile() as f:
-            subprocess.check_call(
-                ["sops", "--output", f.name, "--decrypt", original_filepath]
-            )
+        # If file has a `sops` key, we assume it's sops encrypted. We only decrypt
+        # it if we haven't already decrypted the exact same content in this run.
+        with open(original_filepath, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        cache_key = (os.path.abspath(original_filepath), content_hash)
+
+        # NamedTemporaryFile creates files only readable by the current user
+        with tempfile.NamedTemporaryFile(dir=SECRETS_TMPDIR) as f:
+            if cache_key in _decrypted_contents_cache:
+                _decryption_stats["sops_calls_saved"] += 1
+                f.write(_decrypted_contents_cache[cache_key])
+                f.flush()
+            else:
+                tracing.check_call(
+                    ["sops", "--output", f.name, "--decrypt", original_filepath]
+                )
+                _decryption_stats["sops_calls"] += 1
+                with open(f.name, "rb") as decrypted_file:
+                    _decrypted_contents_cache[cache_key] = decrypted_file.read()
             yield f.name
 
     else:
@@ -0,0 +1,149 @@
+"""
+Functions for keeping a history of hub health checks, so slow server spawns or
+kernel starts can be noticed long before they make a health check time out.
+
+Every health check run by the deployer is appended as one JSON object per line to
+a file per hub in `HEALTH_HISTORY_DIR`. Each record holds when the check ran, the
+revision of the hub's helm release at the time (so checks can be grouped by the
+deploy they checked), whether it passed, and how long each phase of running the
+test notebooks took. The history is local to the machine running the checks, it
+isn't persisted between CI runs.
+"""
+
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+
+from deployer.health_check_tests.test_hub_health import PHASES
+
+HEALTH_HISTORY_DIR = Path(
+    os.environ.get(
+        "DEPLOYER_HEALTH_HISTORY_DIR",
+        Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+        / "2i2c-deployer"
+        / "health-history",
+    )
+)
+
+# A phase of the health checks of a deploy is considered to have regressed when
+# its median duration grew by more than this factor, and by more than
+# `REGRESSION_MIN_SECONDS`, compared to the checks of the deploy before it
+REGRESSION_FACTOR = 1.5
+REGRESSION_MIN_SECONDS = 5
+
+
+def record_health_check(cluster_name, hub_name, result):
+    """
+    Append the result of a health check to the history of a hub.
+
+    Args:
+        result (dict): With the "status" of the check, its "duration", the
+            "revision" of the hub's helm release and the timings of its test
+            "notebooks", as returned by `test_hub_healthy`
+    """
+    path = HEALTH_HISTORY_DIR / cluster_name / f"{hub_name}.jsonl"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    record = {"timestamp": time.time(), "cluster": cluster_name, "hub": hub_name}
+    record.update(result)
+    # A single small write in append mode, so concurrent checks don't interleave
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def load_health_history(cluster_name=None, hub_name=None):
+    """
+    Return the recorded health checks, as a dict mapping (cluster name, hub name)
+    tuples to lists of records, oldest first.
+    """
+    cluster_glob = cluster_name or "*"
+    hub_glob = f"{hub_name}.jsonl" if hub_name else "*.jsonl"
+    history = {}
+    for path in sorted(HEALTH_HISTORY_DIR.glob(f"{cluster_glob}/{hub_glob}")):
+        records = []
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A line cut short by an interrupted check
+                    continue
+        history[(path.parent.name, path.stem)] = sorted(
+            records, key=lambda r: r["timestamp"]
+        )
+    return history
+
+
+def get_phase_durations(record):
+    """
+    Return how long each of `PHASES` took in a health check, summed over all its
+    test notebooks, and its total "duration"
+    """
+    durations = {"duration": record["duration"]}
+    for phase in PHASES:
+        durations[phase] = sum(
+            n[f"{phase}_duration"] or 0 for n in record.get("notebooks", [])
+        )
+    return durations
+
+
+def percentile(values, p):
+    """
+    Return the `p`th percentile of `values`, interpolating between data points
+    """
+    values = sorted(values)
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+
+def summarize_health_history(records, percentiles=(50, 90, 99)):
+    """
+    Summarize the health check history of a hub.
+
+    Returns:
+        dict: With the number of "checks" and "failures", the given
+            "percentiles" of the total duration and of each of `PHASES` over the
+            checks that passed, and a list of "regressions" describing phases whose
+            median duration in the checks of the latest deploy regressed compared
+            to the deploy before it
+    """
+    passed = [r for r in records if r["status"] == "passed"]
+    summary = {
+        "checks": len(records),
+        "failures": sum(r["status"] == "failed" for r in records),
+        "percentiles": {},
+        "regressions": [],
+    }
+    if not passed:
+        return summary
+
+    durations = [get_phase_durations(r) for r in passed]
+    for key in ["duration"] + PHASES:
+        summary["percentiles"][key] = {
+            p: percentile([d[key] for d in durations], p) for p in percentiles
+        }
+
+    # Group checks by the deploy they checked, in the order the deploys happened
+    per_revision = {}
+    for record, record_durations in zip(passed, durations):
+        per_revision.setdefault(record.get("revision"), []).append(record_durations)
+    if len(per_revision) < 2:
+        return summary
+
+    (previous_revision, previous), (latest_revision, latest) = list(
+        per_revision.items()
+    )[-2:]
+    for key in ["duration"] + PHASES:
+        previous_median = statistics.median(d[key] for d in previous)
+        latest_median = statistics.median(d[key] for d in latest)
+        if (
+            latest_median > previous_median * REGRESSION_FACTOR
+            and latest_median - previous_median > REGRESSION_MIN_SECONDS
+        ):
+            summary["regressions"].append(
+                f"{key}: median {previous_median:0.1f}s -> {latest_median:0.1f}s "
+                f"(revision {previous_revision} -> {latest_revision})"
+            )
+    return summary
@@ -1,38 +1,280 @@
-from subprocess import check_call, check_output
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from subprocess import check_output
 
+from . import tracing
 from .rendering import print_colour
+from .yaml_loader import load_yaml
+
+# Where the subcharts downloaded by `helm dep up` are kept, so they can be reused
+# across runs. In CI, this directory can be persisted between jobs with a cache.
+HELM_DEPENDENCIES_CACHE_DIR = Path(
+    os.environ.get(
+        "DEPLOYER_HELM_DEPENDENCIES_CACHE_DIR",
+        Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+        / "2i2c-deployer"
+        / "helm-dependencies",
+    )
+)
+
+# Files in a chart directory that are generated from other files in it, and so
+# don't need to be considered when determining if it has changed
+GENERATED_CHART_FILES = {"charts", "tmpcharts", "Chart.lock", "values.schema.json"}
+
+
+def get_rollout_pending_reason(obj):
+    """
+    Return why a deployment or daemonset isn't fully rolled out yet, or None if it is.
+
+    This mirrors the checks `kubectl rollout status` does for these kinds.
+
+    Args:
+        obj (dict): A Deployment or DaemonSet object as returned by the k8s API
+
+    Raises:
+        RuntimeError: if the rollout of a deployment has exceeded its progress deadline
+    """
+    spec = obj.get("spec", {})
+    status = obj.get("status", {})
+
+    if status.get("observedGeneration", 0) < obj["metadata"].get("generation", 0):
+        return "waiting for the rollout to be observed by its controller"
+
+    if obj["kind"] == "Deployment":
+        for condition in status.get("conditions", []):
+            if condition.get("reason") == "ProgressDeadlineExceeded":
+                raise RuntimeError(
+                    f"deployment/{obj['metadata']['name']} exceeded its progress deadline"
+                )
+        desired = spec.get("replicas", 1)
+        updated = status.get("updatedReplicas", 0)
+        if updated < desired:
+            return f"{updated} of {desired} new replicas have been updated"
+        if status.get("replicas", 0) > updated:
+            return (
+                f"{status['replicas'] - updated} old replicas are pending termination"
+            )
+        available = status.get("availableReplicas", 0)
+        if available < updated:
+            return f"{available} of {updated} updated replicas are available"
+        return None
+
+    if obj["kind"] == "DaemonSet":
+        if (
+            spec.get("updateStrategy", {}).get("type", "RollingUpdate")
+            != "RollingUpdate"
+        ):
+            # kubectl can't tell rollout status for other strategies either
+            return None
+        desired = status.get("desiredNumberScheduled", 0)
+        updated = status.get("updatedNumberScheduled", 0)
+        if updated < desired:
+            return f"{updated} of {desired} updated pods have been scheduled"
+        available = status.get("numberAvailable", 0)
+        if available < desired:
+            return f"{available} of {desired} updated pods are available"
+        return None
+
+    raise ValueError(f"Can not determine rollout status of a {obj['kind']}")
 
 
-def wait_for_deployments_daemonsets(name: str):
+def wait_for_deployments_daemonsets(name: str, timeout=600, poll_interval=5):
     """
     Wait for all deployments and daemonsets to be fully rolled out
+
+    Instead of waiting for each object in turn, we repeatedly list all of them
+    at once, so the total wait is as long as the slowest rollout. Whenever the
+    set of objects we are waiting for changes, we print what they are waiting on.
     """
-    print_colour(
-        f"Waiting for all deployments and daemonsets in {name} to be ready", "green"
-    )
-    deployments_and_daemonsets = (
-        check_output(
-            [
-                "kubectl",
-                "get",
-                f"--namespace={name}",
-                "--output=name",
-                "deployments,daemonsets",
-            ],
+    with tracing.span("wait for rollout", tool="kubectl", namespace=name):
+        print_colour(
+            f"Waiting for all deployments and daemonsets in {name} to be ready", "green"
         )
-        .strip()
-        .split()
+        deadline = time.monotonic() + timeout
+        last_pending = None
+        while True:
+            objects = json.loads(
+                check_output(
+                    [
+                        "kubectl",
+                        "get",
+                        f"--namespace={name}",
+                        "--output=json",
+                        "deployments,daemonsets",
+                    ],
+                )
+            )["items"]
+
+            pending = {}
+            for obj in objects:
+                reason = get_rollout_pending_reason(obj)
+                if reason:
+                    pending[f"{obj['kind'].lower()}/{obj['metadata']['name']}"] = reason
+
+            if not pending:
+                print_colour(
+                    f"All {len(objects)} deployments and daemonsets in {name} are ready"
+                )
+                return
+
+            if pending != last_pending:
+                for obj_name, reason in pending.items():
+                    print(f"Waiting for {obj_name}: {reason}", flush=True)
+                last_pending = pending
+
+            if time.monotonic() > deadline:
+                raise TimeoutError(
+                    f"Timed out after {timeout}s waiting for rollouts in {name}: "
+                    + ", ".join(f"{k} ({v})" for k, v in pending.items())
+                )
+            time.sleep(poll_interval)
+
+
+def hash_chart_dir(chart_dir, h):
+    """
+    Update hash `h` with the contents of the chart in `chart_dir`, ignoring files
+    generated by `helm dep up` or by us.
+    """
+    for path in sorted(chart_dir.rglob("*")):
+        rel_path = path.relative_to(chart_dir)
+        if rel_path.parts[0] in GENERATED_CHART_FILES or not path.is_file():
+            continue
+        h.update(str(rel_path).encode())
+        h.update(path.read_bytes())
+
+
+def get_chart_dependencies_key(chart_dir):
+    """
+    Return a key identifying the dependencies `helm dep up` would download for the
+    chart in `chart_dir`.
+
+    The key is based on the chart's Chart.yaml, as all our charts pin exact versions
+    of their dependencies there. Chart.lock files are written by `helm dep up` and
+    not committed, so they are treated as part of its output and cached alongside
+    the downloaded charts. For dependencies referring to local charts (like
+    daskhub's `file://../basehub`) the contents of those charts are included too,
+    as they get packaged into the dependent chart.
+    """
+    chart_dir = Path(chart_dir)
+    chart_yaml = chart_dir / "Chart.yaml"
+
+    h = hashlib.sha256(chart_yaml.read_bytes())
+    for dependency in load_yaml(chart_yaml).get("dependencies", []):
+        repository = dependency.get("repository", "")
+        if repository.startswith("file://"):
+            hash_chart_dir(
+                (chart_dir / repository.removeprefix("file://")).resolve(), h
+            )
+    return f"{chart_dir.name}-{h.hexdigest()[:16]}"
+
+
+def _dependencies_match(cached_dir, chart_dir):
+    """
+    Check if the downloaded dependencies in `chart_dir` are the same as the ones in
+    the cache entry at `cached_dir`.
+    """
+    cached_files = {p.name: p for p in cached_dir.iterdir()}
+    chart_files = {p.name: p for p in chart_dir.glob("charts/*.tgz")}
+    if (chart_dir / "Chart.lock").exists():
+        chart_files["Chart.lock"] = chart_dir / "Chart.lock"
+    if cached_files.keys() != chart_files.keys():
+        return False
+    return all(
+        cached_files[name].read_bytes() == chart_files[name].read_bytes()
+        for name in cached_files
     )
 
-    for d in deployments_and_daemonsets:
-        check_call(
+
+def update_chart_dependencies(chart_dir):
+    """
+    Make sure the dependencies of the chart in `chart_dir` are downloaded into its
+    `charts/` directory, like `helm dep up` does.
+
+    `helm dep up` is only called when there is no matching entry for the chart in
+    `HELM_DEPENDENCIES_CACHE_DIR`, after which its output is saved there. When there
+    is one, it is copied into the chart directory unless that already has the same
+    contents. Set `DEPLOYER_NO_HELM_DEPENDENCIES_CACHE` to always call `helm dep up`.
+
+    Args:
+        chart_dir (str | Path): Directory of the chart to update dependencies of
+    """
+    chart_dir = Path(chart_dir)
+    if os.environ.get("DEPLOYER_NO_HELM_DEPENDENCIES_CACHE"):
+        tracing.check_call(["helm", "dep", "up", chart_dir])
+        return
+
+    key = get_chart_dependencies_key(chart_dir)
+    cached_dir = HELM_DEPENDENCIES_CACHE_DIR / key
+
+    if cached_dir.is_dir():
+        if _dependencies_match(cached_dir, chart_dir):
+            print_colour(f"Dependencies of {chart_dir} are up to date", "green")
+            return
+        print_colour(f"Restoring cached dependencies of {chart_dir}", "green")
+        (chart_dir / "charts").mkdir(exist_ok=True)
+        for tgz in chart_dir.glob("charts/*.tgz"):
+            tgz.unlink()
+        for cached_file in cached_dir.iterdir():
+            if cached_file.name == "Chart.lock":
+                shutil.copyfile(cached_file, chart_dir / "Chart.lock")
+            else:
+                shutil.copyfile(cached_file, chart_dir / "charts" / cached_file.name)
+        return
+
+    tracing.check_call(["helm", "dep", "up", chart_dir])
+
+    # Populate a temporary directory and rename it into place, so a partially
+    # written entry is never used, even when several processes share the cache
+    HELM_DEPENDENCIES_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f".{key}-", dir=HELM_DEPENDENCIES_CACHE_DIR))
+    for tgz in chart_dir.glob("charts/*.tgz"):
+        shutil.copyfile(tgz, tmp_dir / tgz.name)
+    if (chart_dir / "Chart.lock").exists():
+        shutil.copyfile(chart_dir / "Chart.lock", tmp_dir / "Chart.lock")
+    try:
+        tmp_dir.rename(cached_dir)
+    except OSError:
+        # Another process has saved the same entry in the meantime
+        shutil.rmtree(tmp_dir)
+
+
+def get_release_revision(release_name, namespace):
+    """
+    Return the current revision of a helm release, or None if it isn't installed.
+
+    Every `helm upgrade` (or rollback) of a release increases its revision, whether
+    it is done by us or by anyone else.
+    """
+    try:
+        status = tracing.check_output(
             [
-                "kubectl",
-                "rollout",
+                "helm",
                 "status",
-                f"--namespace={name}",
-                "--timeout=10m",
-                "--watch",
-                d,
+                release_name,
+                f"--namespace={namespace}",
+                "--output=json",
             ],
+            stderr=subprocess.DEVNULL,
         )
+    except subprocess.CalledProcessError:
+        return None
+    return json.loads(status)["version"]
+
+
+def get_release_revisions():
+    """
+    Return the current revision of every helm release on the cluster, keyed by
+    (namespace, release name) tuples, with a single `helm list` call.
+    """
+    releases = json.loads(
+        tracing.check_output(
+            ["helm", "list", "--all-namespaces", "--output=json"], text=True
+        )
+    )
+    return {(r["namespace"], r["name"]): int(r["revision"]) for r in releases}
@@ -0,0 +1,188 @@
+"""
+Functions for checking the values we pass to our helm charts without calling helm,
+so invalid values can be reported quickly, and all at once.
+
+We mimic how helm combines the values of a chart with the values files passed to
+it, and validate the result against the chart's values.schema.yaml. As we don't
+look into the chart's dependencies, the schemas of those are not checked here.
+"""
+
+import functools
+import os
+import re
+from pathlib import Path
+
+from ruamel.yaml import YAML
+
+from deployer.utils.file_acquisition import REPO_ROOT_PATH, load_config_file
+from deployer.utils.schema import get_schema_validator
+
+# Only used to find line numbers of values that fail validation
+rt_yaml = YAML(typ="rt")
+
+
+def merge_values(base, override):
+    """
+    Return the result of merging `override` into `base` like helm does with values
+    files: maps are merged recursively, anything else in `override` replaces what
+    is in `base`, and keys set to null in `override` are removed.
+
+    Neither `base` nor `override` are modified.
+    """
+    merged = dict(base)
+    for key, value in override.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_values(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def get_chart_default_values(chart_dir):
+    """
+    Return the values helm starts out with for the chart in `chart_dir`, before
+    any values files are merged in.
+
+    Besides the chart's values.yaml, helm makes sure there is a `global` key and a
+    key for each dependency of the chart, holding the defaults of the dependency.
+    We don't look into the dependencies, so they are represented by empty maps.
+    """
+    chart_dir = Path(chart_dir)
+    values = load_config_file(chart_dir / "values.yaml") or {}
+    defaults = {"global": {}}
+    for dependency in load_config_file(chart_dir / "Chart.yaml").get(
+        "dependencies", []
+    ):
+        defaults[dependency.get("alias", dependency["name"])] = {}
+    return merge_values(defaults, values)
+
+
+@functools.lru_cache
+def _load_with_line_numbers(path):
+    with open(path) as f:
+        return rt_yaml.load(f)
+
+
+def _get_depth(values, path):
+    """
+    Return how many of the keys (or list indexes) in `path` can be followed in
+    `values`
+    """
+    depth = 0
+    for key in path:
+        if isinstance(values, dict) and key in values:
+            values = values[key]
+        elif isinstance(values, list) and isinstance(key, int) and key < len(values):
+            values = values[key]
+        else:
+            break
+        depth += 1
+    return depth
+
+
+def _get_line(path, keys):
+    """
+    Return the line number in the YAML file `path` of the value at `keys`, or of
+    the deepest of its parents that is in the file
+    """
+    node = _load_with_line_numbers(path)
+    line = None
+    for key in keys:
+        if isinstance(node, dict) and key in node:
+            line = node.lc.key(key)[0] + 1
+        elif isinstance(node, list) and isinstance(key, int) and key < len(node):
+            line = node.lc.item(key)[0] + 1
+        else:
+            break
+        node = node[key]
+    return line
+
+
+def locate_value(path, sources):
+    """
+    Find the values file in `sources` a value came from.
+
+    Args:
+        path (list): Keys and list indexes leading to the value in the merged values
+        sources (list[tuple]): `(file_path, values, key_prefix)` tuples as passed to
+            `validate_values`
+
+    Returns:
+        str: "<file>:<line>" of the value, or of its closest parent if no file
+            sets the value itself. The line is left out if it can't be determined.
+    """
+    best_depth = -1
+    best_source = None
+    # Later files take precedence, so they are checked first
+    for source in reversed(sources):
+        depth = _get_depth(source[1], path)
+        if depth > best_depth:
+            best_depth, best_source = depth, source
+        if depth == len(path):
+            break
+
+    file_path, _, key_prefix = best_source
+    location = os.path.relpath(file_path, REPO_ROOT_PATH)
+    if Path(file_path).suffix in (".yaml", ".yml"):
+        line = _get_line(file_path, list(key_prefix) + list(path[:best_depth]))
+        if line is not None:
+            location += f":{line}"
+    return location
+
+
+def validate_values(chart_dir, sources):
+    """
+    Validate the values helm would get when rendering the chart in `chart_dir` with
+    the given values files against the chart's values.schema.yaml.
+
+    Args:
+        chart_dir (Path): Directory of the chart with the schema to validate against
+        sources (list[tuple]): A `(file_path, values, key_prefix)` tuple for every
+            values file, in the order they are passed to helm. `file_path` is used
+            for reporting where invalid values come from, `values` holds the
+            parsed values for this chart, and `key_prefix` is the list of keys under
+            which these values are nested in the file (for example `["basehub"]`
+            for the values files of hubs using the daskhub chart).
+
+    Returns:
+        list[str]: A description of every violation of the schema, including the
+            file and line the offending value was set in
+    """
+    chart_dir = Path(chart_dir)
+    sources = [
+        (chart_dir / "values.yaml", get_chart_default_values(chart_dir), [])
+    ] + list(sources)
+
+    merged = {}
+    for _, values, _ in sources:
+        merged = merge_values(merged, values or {})
+
+    violations = []
+    validator = get_schema_validator(chart_dir / "values.schema.yaml")
+    for error in sorted(
+        validator.iter_errors(merged), key=lambda e: [str(p) for p in e.absolute_path]
+    ):
+        path = list(error.absolute_path)
+        location_path = path
+        if error.validator == "additionalProperties" and isinstance(
+            error.instance, dict
+        ):
+            # Point to the first unexpected key, rather than the map it is in
+            unexpected = [
+                key
+                for key in error.instance
+                if key not in error.schema.get("properties", {})
+                and not any(
+                    re.search(pattern, key)
+                    for pattern in error.schema.get("patternProperties", {})
+                )
+            ]
+            if unexpected:
+                location_path = path + unexpected[:1]
+        violations.append(
+            f"{locate_value(location_path, sources)}: "
+            f"{'.'.join(str(p) for p in path) or '<root>'}: {error.message}"
+        )
+    return violations
@@ -2,15 +2,36 @@
 Utility functions for rendering .jsonnet files into .json files
 """
 
+import hashlib
+import json
+import os
+import re
 import shlex
 import subprocess
 import sys
 from contextlib import contextmanager
 from pathlib import Path
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, mkstemp
 
+from ..utils import tracing
 from ..utils.rendering import print_colour
 
+try:
+    # Python bindings to go-jsonnet, letting us render without forking the
+    # jsonnet binary for every file. Optional, we fall back to the binary.
+    import _gojsonnet
+except ImportError:
+    _gojsonnet = None
+
+# Matches `import 'foo.libsonnet'`, `importstr "bar.txt"` and `importbin 'baz'`
+JSONNET_IMPORT_RE = re.compile(r"""\b(import(?:str|bin)?)\s*(['"])(.+?)\2""")
+
+# Rendered output of jsonnet files, keyed by the hash computed in
+# `_get_render_cache_key`. Set DEPLOYER_JSONNET_CACHE_DIR to also keep renders
+# of files in this repo on disk, so they can be reused across runs.
+_render_cache = {}
+JSONNET_CACHE_DIR = os.environ.get("DEPLOYER_JSONNET_CACHE_DIR")
+
 
 def validate_jsonnet_version():
     # Check to make sure we're using go-jsonnet, not c++-jsonnet
@@ -27,6 +48,79 @@ def validate_jsonnet_version():
         sys.exit(1)
 
 
+def resolve_jsonnet_import(importing_file, import_path, jpaths):
+    """
+    Return the path a jsonnet import resolves to, or None if it can't be found.
+
+    Like jsonnet, we first look relative to the directory of the importing file
+    (without resolving symlinks), and then in the `--jpath` directories, with the
+    last one given taking precedence.
+    """
+    for search_dir in [os.path.dirname(importing_file)] + list(reversed(jpaths)):
+        candidate = os.path.join(search_dir, import_path)
+        if os.path.isfile(candidate):
+            return os.path.normpath(candidate)
+    return None
+
+
+def find_jsonnet_imports(jsonnet_file, jpaths):
+    """
+    Return the set of all files imported, directly or transitively, by jsonnet_file.
+
+    Imports are found by scanning the source for `import`, `importstr` and
+    `importbin` statements, so imports with computed paths are not supported
+    (jsonnet doesn't support those either). Imports that can't be resolved are
+    skipped, jsonnet itself will fail on those when rendering.
+    """
+    imports = set()
+    to_scan = [os.path.abspath(jsonnet_file)]
+    while to_scan:
+        current = to_scan.pop()
+        with open(current) as f:
+            source = f.read()
+        for kind, _, import_path in JSONNET_IMPORT_RE.findall(source):
+            resolved = resolve_jsonnet_import(current, import_path, jpaths)
+            if resolved and resolved not in imports:
+                imports.add(resolved)
+                # importstr / importbin targets are not jsonnet themselves
+                if kind == "import":
+                    to_scan.append(resolved)
+    return imports
+
+
+def _hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _get_render_cache_key(jsonnet_file, jpaths, ext_vars):
+    """
+    Return a key that changes whenever the output of rendering jsonnet_file could.
+
+    The output depends on the path itself (via `std.thisFile`), the content of the
+    file and of everything it imports, and the ext-vars passed in.
+    """
+    files = [str(jsonnet_file)] + sorted(find_jsonnet_imports(jsonnet_file, jpaths))
+    key = {
+        "files": {f: _hash_file(f) for f in files},
+        "jpaths": jpaths,
+        "ext_vars": ext_vars,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _render(command, jsonnet_file, jpaths, ext_vars):
+    """
+    Render jsonnet_file, in-process if go-jsonnet bindings are available
+    """
+    with tracing.span("jsonnet", tool="jsonnet"):
+        if _gojsonnet is not None:
+            return _gojsonnet.evaluate_file(
+                str(jsonnet_file), jpathdir=jpaths, ext_vars=ext_vars
+            )
+        return subprocess.check_output(command, text=True)
+
+
 @contextmanager
 def render_jsonnet(
     jsonnet_file: Path,
@@ -47,32 +141,65 @@ def render_jsonnet(
         - hub_domain (optional)
 
     Be careful in adding more arguments, as that may cause right to replicate issues.
+
+    Rendered output is cached for the rest of the run, keyed by the content of
+    the file and all its imports and the ext-vars passed.
     """
-    command = [
-        "jsonnet",
-        "--jpath",
-        str(jsonnet_file.parent),
-        "--ext-str",
-        f"VARS_2I2C_CLUSTER_NAME={cluster_name}",
-    ]
+    jpaths = [str(jsonnet_file.parent)]
+    ext_vars = {"VARS_2I2C_CLUSTER_NAME": cluster_name}
     if hub_name is not None:
-        command += ["--ext-str", f"VARS_2I2C_HUB_NAME={hub_name}"]
+        ext_vars["VARS_2I2C_HUB_NAME"] = hub_name
     if hub_domain is not None:
-        command += ["--ext-str", f"VARS_2I2C_HUB_DOMAIN={hub_domain}"]
-    command += ["--ext-str", f"VARS_2I2C_PROVIDER={provider}"]
-    command += ["--ext-str", f"VARS_2I2C_ACCOUNT_ID={account_id}"]
+        ext_vars["VARS_2I2C_HUB_DOMAIN"] = hub_domain
+    ext_vars["VARS_2I2C_PROVIDER"] = provider
+    ext_vars["VARS_2I2C_ACCOUNT_ID"] = str(account_id)
+
+    command = ["jsonnet"]
+    for jpath in jpaths:
+        command += ["--jpath", jpath]
+    for name, value in ext_vars.items():
+        command += ["--ext-str", f"{name}={value}"]
     # Make the jsonnet file passed be an absolute path, but do not *resolve*
     # it - so symlinks are resolved by jsonnet rather than us. This is important
     # for daskhub compatibility.
-    command += [jsonnet_file.absolute()]
+    jsonnet_file = jsonnet_file.absolute()
+    command += [str(jsonnet_file)]
+
+    cache_key = _get_render_cache_key(jsonnet_file, jpaths, ext_vars)
+    # Only files from this repo are persisted, as they never contain secrets
+    # (encrypted jsonnet files are rendered from temporary decrypted copies)
+    persistent_cache_path = None
+    if JSONNET_CACHE_DIR and "secret" not in jsonnet_file.name:
+        from deployer.utils.file_acquisition import REPO_ROOT_PATH
+
+        if jsonnet_file.is_relative_to(REPO_ROOT_PATH.absolute()):
+            persistent_cache_path = Path(JSONNET_CACHE_DIR) / f"{cache_key}.json"
+
+    if cache_key not in _render_cache and persistent_cache_path:
+        if persistent_cache_path.exists():
+            _render_cache[cache_key] = persistent_cache_path.read_text()
 
-    print(f"Rendering jsonnet file {jsonnet_file} with the command: ", end="")
-    # We print it without the temporary filename so deployers can reuse the command
-    print_colour(shlex.join([str(s) for s in command]))
+    if cache_key in _render_cache:
+        print(f"Reusing earlier render of jsonnet file {jsonnet_file}")
+    else:
+        print(f"Rendering jsonnet file {jsonnet_file} with the command: ", end="")
+        # We print it without the output filename so deployers can reuse the command
+        print_colour(shlex.join(command))
+        _render_cache[cache_key] = _render(command, jsonnet_file, jpaths, ext_vars)
 
-    with NamedTemporaryFile(suffix=".json") as f:
-        command += ["--output-file", f.name]
+        if persistent_cache_path:
+            # Written to a temporary file first, so other processes rendering the
+            # same file at the same time never read a partially written render
+            persistent_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = mkstemp(
+                dir=persistent_cache_path.parent, prefix=".render-", suffix=".json"
+            )
+            with os.fdopen(fd, "w") as tmp_file:
+                tmp_file.write(_render_cache[cache_key])
+            os.replace(tmp_path, persistent_cache_path)
 
-        subprocess.check_call(command)
+    with NamedTemporaryFile(mode="w", suffix=".json") as f:
+        f.write(_render_cache[cache_key])
+        f.flush()
 
         yield f.name
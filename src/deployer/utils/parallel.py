@@ -0,0 +1,154 @@
+"""
+Utility functions for running independent pieces of deployer work (like deploying
+or validating hubs) concurrently in a bounded pool of worker processes.
+
+Each piece of work runs in its own process so the output of the tools it calls
+(helm, kubectl, jsonnet, etc) can be captured in a separate log file per item,
+instead of being interleaved on the terminal.
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from deployer.utils import tracing
+from deployer.utils.rendering import print_colour
+
+
+def _init_worker(environ):
+    """
+    Give a worker process the same environment variables as its parent had when
+    the pool was created.
+    """
+    os.environ.clear()
+    os.environ.update(environ)
+
+
+def _run_logged(log_path, func, args, trace_attributes=None):
+    """
+    Call `func(*args)` with this process' stdout and stderr pointing to `log_path`.
+
+    We redirect at the file descriptor level, so output from any subprocesses
+    called by `func` ends up in `log_path` too. Errors are captured and returned
+    rather than raised, as things like `sys.exit` calls would otherwise tear down
+    the worker process.
+
+    When `trace_attributes` is given, the parent process is tracing, so spans are
+    recorded here too (with those attributes) and returned to the parent.
+    """
+    if trace_attributes is not None:
+        tracing.start_tracing(trace_attributes)
+    start_time = time.perf_counter()
+    error = None
+    result = None
+    with open(log_path, "w") as log_file:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(log_file.fileno(), sys.stdout.fileno())
+        os.dup2(log_file.fileno(), sys.stderr.fileno())
+        try:
+            result = func(*args)
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+    return {
+        "duration": time.perf_counter() - start_time,
+        "error": error,
+        "result": result,
+        "spans": tracing.get_spans(),
+    }
+
+
+def run_in_parallel(tasks, max_workers, fail_fast=True):
+    """
+    Run `tasks` concurrently in at most `max_workers` worker processes.
+
+    The output of each task is collected in its own log file and printed as a
+    single block once that task completes. When `fail_fast` is set, no new tasks
+    are started once a task has failed, but tasks already running are allowed
+    to complete as interrupting things like `helm upgrade` is unsafe.
+
+    The workers get a copy of the current environment variables at the time
+    this function is called, so it can be used inside `Cluster.auth()`. Spans
+    recorded by the workers are added to the ones of this process when tracing.
+
+    Args:
+        tasks (list[tuple]): A list of `(name, func, args)` tuples. `func` must be
+            a picklable (module level) function and `args` a tuple of picklable
+            arguments to call it with.
+        max_workers (int): Maximum number of tasks to run at the same time
+        fail_fast (bool, optional): Stop starting new tasks after the first
+            failure. Defaults to True.
+
+    Returns:
+        list[dict]: One dictionary per task, in the order given in `tasks`, with
+            the keys "name", "status" ("succeeded", "failed" or "skipped"),
+            "duration" (seconds, None if skipped), "error" and "result" (the
+            return value of `func`, which must be picklable).
+    """
+    results = {
+        name: {
+            "name": name,
+            "status": "skipped",
+            "duration": None,
+            "error": None,
+            "result": None,
+        }
+        for name, _, _ in tasks
+    }
+
+    with (
+        tempfile.TemporaryDirectory(prefix="deployer-logs-") as log_dir,
+        ProcessPoolExecutor(
+            max_workers=max_workers,
+            # Worker processes are started fresh rather than forked, as forking
+            # doesn't play well with the threads started by libraries like
+            # gojsonnet, and makes jsonnet rendering hang in the workers
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(dict(os.environ),),
+        ) as executor,
+    ):
+        # We only submit a new task when a worker is free, rather than queueing
+        # them all upfront, so we can stop starting new tasks after a failure
+        trace_attributes = tracing.get_attributes() if tracing.is_tracing() else None
+        queued = list(enumerate(tasks))
+        pending = {}
+        failed = False
+        while queued or pending:
+            while queued and len(pending) < max_workers and not (failed and fail_fast):
+                i, (name, func, args) = queued.pop(0)
+                log_path = Path(log_dir) / f"{i}.log"
+                future = executor.submit(
+                    _run_logged, log_path, func, args, trace_attributes
+                )
+                pending[future] = (name, log_path)
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, log_path = pending.pop(future)
+                result = future.result()
+                tracing.add_spans(result.pop("spans"))
+                results[name].update(result)
+                results[name]["status"] = "failed" if result["error"] else "succeeded"
+
+                print_colour(f"----- Output for {name} -----", "yellow")
+                with open(log_path) as f:
+                    print(f.read(), flush=True)
+                if result["error"]:
+                    print_colour(f"{name} failed: {result['error']}", "red")
+                    failed = True
+                else:
+                    print_colour(f"{name} done in {result['duration']:0.1f}s")
+
+    return [results[name] for name, _, _ in tasks]
@@ -2,6 +2,8 @@ import os
 import subprocess
 
 from py_markdown_table.markdown_table import markdown_table
+from rich.console import Console
+from rich.table import Table
 
 
 def print_colour(msg: str, colour="green"):
@@ -36,6 +38,30 @@ def print_colour(msg: str, colour="green"):
         print(msg)
 
 
+def print_timing_table(results, title="Timing summary"):
+    """Print a table of how long each item of work took, slowest first
+
+    Args:
+        results (list[dict]): Dictionaries with the keys "name", "status" and
+            "duration" (in seconds, or None if the item never ran)
+        title (str, optional): Title to give the table
+    """
+    table = Table(title=title)
+    table.add_column("Name")
+    table.add_column("Status")
+    table.add_column("Duration", justify="right")
+
+    for result in sorted(results, key=lambda r: -(r["duration"] or 0)):
+        duration = result["duration"]
+        table.add_row(
+            result["name"],
+            result["status"],
+            "-" if duration is None else f"{duration:0.1f}s",
+        )
+
+    Console().print(table)
+
+
 def create_markdown_comment(support_matrix, staging_matrix, prod_matrix):
     """Convert a list of dictionaries into a Markdown formatted table for posting to
     GitHub as comments. This function will write the Markdown content to a file to allow
@@ -92,7 +118,9 @@ def create_markdown_comment(support_matrix, staging_matrix, prod_matrix):
             formatted_entry = {
                 column_converter["provider"]: entry["provider"],
                 column_converter["cluster_name"]: entry["cluster_name"],
-                column_converter["hub_name"]: entry["hub_name"],
+                column_converter["hub_name"]: ", ".join(
+                    entry.get("hub_names") or [entry["hub_name"]]
+                ),
                 column_converter["choice_reason"]: entry["choice_reason"],
             }
             formatted_staging_matrix.append(formatted_entry)
@@ -114,7 +142,9 @@ def create_markdown_comment(support_matrix, staging_matrix, prod_matrix):
             formatted_entry = {
                 column_converter["provider"]: entry["provider"],
                 column_converter["cluster_name"]: entry["cluster_name"],
-                column_converter["hub_name"]: entry["hub_name"],
+                column_converter["hub_name"]: ", ".join(
+                    entry.get("hub_names") or [entry["hub_name"]]
+                ),
                 column_converter["choice_reason"]: entry["choice_reason"],
             }
             formatted_prod_matrix.append(formatted_entry)
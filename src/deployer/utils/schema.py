@@ -0,0 +1,93 @@
+"""
+Functions for loading the JSON schemas we keep as YAML files (like
+cluster.schema.yaml and the values.schema.yaml files of our helm charts), and
+validating data against them.
+
+Parsing a schema and checking it is valid is much slower than validating data
+against it, so parsed schemas and their validators are cached for the whole run,
+keyed by a hash of the schema file's contents.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import jsonschema
+
+from deployer.utils.yaml_loader import load_yaml
+
+# Maps the sha256 hash of the contents of a schema file to the parsed schema and
+# a validator for it
+_schemas = {}
+
+
+def _load_schema(schema_file):
+    content = Path(schema_file).read_bytes()
+    key = hashlib.sha256(content).hexdigest()
+    if key not in _schemas:
+        schema = load_yaml(content.decode())
+        validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        _schemas[key] = (schema, validator_class(schema))
+    return _schemas[key]
+
+
+def get_schema(schema_file):
+    """
+    Return the parsed contents of the YAML file `schema_file`.
+
+    The returned schema is shared, and must not be modified.
+    """
+    return _load_schema(schema_file)[0]
+
+
+def get_schema_validator(schema_file):
+    """
+    Return a `jsonschema` validator for the schema in the YAML file `schema_file`.
+
+    The schema itself is only checked once, when it is first loaded.
+    """
+    return _load_schema(schema_file)[1]
+
+
+def validate_with_schema(instance, schema_file):
+    """
+    Validate `instance` against the schema in `schema_file`, like
+    `jsonschema.validate` does.
+
+    Raises:
+        jsonschema.ValidationError: the most relevant error, if `instance` is
+            not valid
+    """
+    error = jsonschema.exceptions.best_match(
+        get_schema_validator(schema_file).iter_errors(instance)
+    )
+    if error is not None:
+        raise error
+
+
+def write_schema_json(schema_file, json_file):
+    """
+    Write the schema in the YAML file `schema_file` to `json_file` as JSON, so
+    tools like helm can use it.
+
+    The file is replaced atomically, and left alone if it is already up to date,
+    so processes reading it never see a partially written file.
+    """
+    content = json.dumps(get_schema(schema_file))
+    try:
+        with open(json_file) as f:
+            if f.read() == content:
+                return
+    except FileNotFoundError:
+        pass
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(json_file), prefix=".values.schema-", suffix=".json"
+    )
+    with os.fdopen(fd, "w") as f:
+        f.write(content)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, json_file)
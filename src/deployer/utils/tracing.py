@@ -0,0 +1,225 @@
+"""
+Functions for recording where the time of a deployer run goes.
+
+Work worth timing, like every call to an external tool (helm, kubectl, sops,
+jsonnet, the cloud provider CLIs), is wrapped in a span. A span records its name,
+when it started, how long it took, whether it failed, and attributes describing
+it. Besides the attributes given to a span itself, it gets the ones set for the
+work it is part of with `trace_attributes` (for example the cluster and hub being
+deployed), and those of the spans it is nested in.
+
+Spans are only recorded once `start_tracing` has been called, which the
+`--trace-file` option of the deployer does. At the end of the run, the spans are
+written to the trace file and summarised in a table. Spans recorded in worker
+processes started by `deployer.utils.parallel.run_in_parallel` are sent back to
+the parent process, so they end up in the same trace.
+"""
+
+import contextvars
+import json
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from rich.console import Console
+from rich.table import Table
+
+# Recorded spans, or None when tracing is off
+_spans = None
+
+_attributes = contextvars.ContextVar("trace_attributes", default={})
+
+
+def start_tracing(attributes=None):
+    """
+    Start recording spans, discarding any recorded earlier.
+
+    Args:
+        attributes (dict, optional): Attributes to give every span, used to carry
+            the attributes set in a parent process over to a worker process
+    """
+    global _spans
+    _spans = []
+    if attributes:
+        _attributes.set(attributes)
+
+
+def is_tracing():
+    return _spans is not None
+
+
+def get_attributes():
+    """
+    Return the attributes spans started now would get
+    """
+    return dict(_attributes.get())
+
+
+def get_spans():
+    """
+    Return the spans recorded so far, in the order they ended
+    """
+    return list(_spans or [])
+
+
+def add_spans(spans):
+    """
+    Add spans recorded elsewhere, like in a worker process, to the recorded spans
+    """
+    if _spans is not None:
+        _spans.extend(spans)
+
+
+@contextmanager
+def trace_attributes(**attributes):
+    """
+    Give every span started inside this context manager `attributes`
+    """
+    token = _attributes.set({**_attributes.get(), **attributes})
+    try:
+        yield
+    finally:
+        _attributes.reset(token)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Record how long the code inside this context manager takes as a span.
+
+    Args:
+        name (str): What is being done, like "helm upgrade"
+        **attributes: Describe the span further, like the `tool` being called
+    """
+    with trace_attributes(**attributes):
+        if _spans is None:
+            yield
+            return
+
+        span_attributes = get_attributes()
+        start = time.time()
+        start_counter = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            _spans.append(
+                {
+                    "name": name,
+                    "start": start,
+                    "duration": time.perf_counter() - start_counter,
+                    "status": status,
+                    "attributes": span_attributes,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                }
+            )
+
+
+def _get_span_name(cmd):
+    """
+    Name a span for running `cmd` after the tool and its subcommand, like
+    "helm upgrade" or "kubectl apply", so calls doing the same thing on different
+    hubs are grouped together. Other arguments are left out, as they can contain
+    secrets.
+    """
+    name = os.path.basename(str(cmd[0]))
+    if len(cmd) > 1:
+        arg = str(cmd[1])
+        if not (arg.startswith("-") or "/" in arg or "=" in arg or "." in arg):
+            name += f" {arg}"
+    return name
+
+
+def check_call(cmd, **kwargs):
+    """
+    `subprocess.check_call`, recorded as a span named after the command
+    """
+    with span(_get_span_name(cmd), tool=os.path.basename(str(cmd[0]))):
+        return subprocess.check_call(cmd, **kwargs)
+
+
+def check_output(cmd, **kwargs):
+    """
+    `subprocess.check_output`, recorded as a span named after the command
+    """
+    with span(_get_span_name(cmd), tool=os.path.basename(str(cmd[0]))):
+        return subprocess.check_output(cmd, **kwargs)
+
+
+def run(cmd, **kwargs):
+    """
+    `subprocess.run`, recorded as a span named after the command
+    """
+    with span(_get_span_name(cmd), tool=os.path.basename(str(cmd[0]))):
+        return subprocess.run(cmd, **kwargs)
+
+
+def write_trace(trace_file, spans):
+    """
+    Write `spans` to `trace_file`.
+
+    Files ending in .json get the Chrome trace event format, which can be opened
+    with https://ui.perfetto.dev or chrome://tracing. Other files get one JSON
+    object per line for each span.
+    """
+    trace_file = Path(trace_file)
+    with open(trace_file, "w") as f:
+        if trace_file.suffix == ".json":
+            events = [
+                {
+                    "name": s["name"],
+                    "cat": s["attributes"].get("tool", "deployer"),
+                    "ph": "X",
+                    "ts": s["start"] * 1e6,
+                    "dur": s["duration"] * 1e6,
+                    "pid": s["pid"],
+                    "tid": s["tid"],
+                    "args": {**s["attributes"], "status": s["status"]},
+                }
+                for s in spans
+            ]
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        else:
+            for s in spans:
+                f.write(json.dumps(s) + "\n")
+
+
+def print_trace_summary(spans, title="Trace summary"):
+    """
+    Print a table of how many spans of each name there were and how long they
+    took, longest total duration first.
+    """
+    summary = {}
+    for s in spans:
+        entry = summary.setdefault(
+            s["name"], {"count": 0, "errors": 0, "total": 0, "max": 0}
+        )
+        entry["count"] += 1
+        entry["errors"] += s["status"] == "error"
+        entry["total"] += s["duration"]
+        entry["max"] = max(entry["max"], s["duration"])
+
+    table = Table(title=title)
+    table.add_column("Name")
+    table.add_column("Count", justify="right")
+    table.add_column("Errors", justify="right")
+    table.add_column("Total", justify="right")
+    table.add_column("Max", justify="right")
+
+    for name, entry in sorted(summary.items(), key=lambda item: -item[1]["total"]):
+        table.add_row(
+            name,
+            str(entry["count"]),
+            str(entry["errors"]),
+            f"{entry['total']:0.2f}s",
+            f"{entry['max']:0.2f}s",
+        )
+
+    Console().print(table)
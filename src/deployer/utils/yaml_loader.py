@@ -0,0 +1,74 @@
+"""
+A shared loader for the (many, and sometimes large) YAML files we only read.
+
+Parsing YAML with the pure Python implementation in ruamel.yaml is a large part of
+the time spent by commands that walk all our cluster and hub config, so we use
+the libyaml based C loader (from the `ruamel.yaml.clib` package) when it is
+available. The pure Python loader is kept as a fallback, both for when the C
+extension isn't installed and for documents the C loader rejects.
+
+Code that writes YAML back to disk and needs to preserve comments and formatting
+should keep using its own round-trip `YAML(typ="rt")` instance instead.
+"""
+
+import os
+
+from ruamel.yaml import YAML
+
+try:
+    import _ruamel_yaml  # noqa: F401
+
+    HAS_LIBYAML = True
+except ImportError:
+    HAS_LIBYAML = False
+
+# Without `pure=True`, ruamel.yaml uses the C loader from `_ruamel_yaml` when it
+# can be imported, and silently falls back to the pure Python one otherwise.
+_fast_yaml = YAML(typ="safe")
+_pure_yaml = YAML(typ="safe", pure=True)
+
+
+def load_yaml(source):
+    """
+    Parse a YAML document with the fastest loader available.
+
+    Args:
+        source (str | os.PathLike | file-like): The path of a file to load, an
+            open file object or a string with YAML content, as accepted by
+            `YAML.load`
+
+    Returns:
+        The parsed document, made of plain python dicts, lists and scalars
+    """
+    if isinstance(source, os.PathLike):
+        with open(source) as f:
+            content = f.read()
+    elif hasattr(source, "read"):
+        content = source.read()
+    else:
+        content = source
+
+    if not HAS_LIBYAML:
+        return _pure_yaml.load(content)
+    try:
+        return _fast_yaml.load(content)
+    except Exception:
+        # libyaml is stricter than the pure python parser in a few edge cases,
+        # so give the pure python loader a chance before giving up
+        return _pure_yaml.load(content)
+
+
+def load_all_yaml(content):
+    """
+    Parse a string with a stream of YAML documents (like the output of `helm
+    template`) with the fastest loader available.
+
+    Returns:
+        list: The parsed documents, leaving out empty ones
+    """
+    if HAS_LIBYAML:
+        try:
+            return [doc for doc in _fast_yaml.load_all(content) if doc is not None]
+        except Exception:
+            pass
+    return [doc for doc in _pure_yaml.load_all(content) if doc is not None]
@@ -0,0 +1,134 @@
+import contextlib
+import os
+import stat
+import time
+from pathlib import Path
+
+import pytest
+
+from deployer.infra_components import cluster as cluster_module
+from deployer.infra_components.cluster import Cluster
+from deployer.utils import auth_sessions
+
+
+@pytest.fixture
+def sessions_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(auth_sessions, "AUTH_SESSIONS_DIR", tmp_path / "sessions")
+    monkeypatch.delenv("DEPLOYER_NO_AUTH_SESSIONS", raising=False)
+    return tmp_path / "sessions"
+
+
+def test_session_key_changes_with_config_and_key(tmp_path):
+    key = tmp_path / "enc-deployer-credentials.secret.json"
+    key.write_text("one")
+    config = {"project": "p", "cluster": "c", "key": key.name}
+
+    session_key = auth_sessions.get_session_key("cluster1", config, key)
+    assert session_key.startswith("cluster1-")
+    assert auth_sessions.get_session_key("cluster1", dict(config), key) == session_key
+    assert (
+        auth_sessions.get_session_key("cluster1", {**config, "cluster": "d"}, key)
+        != session_key
+    )
+    key.write_text("two")
+    assert auth_sessions.get_session_key("cluster1", config, key) != session_key
+
+
+def test_save_and_restore_session(tmp_path, sessions_dir):
+    kubeconfig = tmp_path / "kubeconfig"
+    kubeconfig.write_text("apiVersion: v1\n")
+    restored = tmp_path / "restored"
+
+    assert not auth_sessions.restore_session("cluster1-abc", restored)
+    auth_sessions.save_session("cluster1-abc", kubeconfig)
+
+    # Kubeconfigs can hold credentials, so only we can read them
+    assert stat.S_IMODE(os.stat(sessions_dir).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(sessions_dir / "cluster1-abc").st_mode) == 0o600
+
+    assert auth_sessions.restore_session("cluster1-abc", restored)
+    assert restored.read_text() == "apiVersion: v1\n"
+
+
+def test_expired_session_is_not_restored(tmp_path, sessions_dir, monkeypatch):
+    kubeconfig = tmp_path / "kubeconfig"
+    kubeconfig.write_text("apiVersion: v1\n")
+    auth_sessions.save_session("cluster1-abc", kubeconfig)
+
+    expired = time.time() - auth_sessions.AUTH_SESSION_TTL - 1
+    os.utime(sessions_dir / "cluster1-abc", (expired, expired))
+    assert not auth_sessions.restore_session("cluster1-abc", tmp_path / "restored")
+    assert not (sessions_dir / "cluster1-abc").exists()
+
+    auth_sessions.save_session("cluster1-abc", kubeconfig)
+    monkeypatch.setenv("DEPLOYER_NO_AUTH_SESSIONS", "1")
+    assert not auth_sessions.restore_session("cluster1-abc", tmp_path / "restored")
+
+
+def test_nested_auth_is_a_noop(tmp_path, monkeypatch):
+    monkeypatch.setattr(cluster_module, "_active_auth_sessions", {})
+    monkeypatch.delenv("KUBECONFIG", raising=False)
+    calls = []
+
+    def fake_auth_kubeconfig(self, silent):
+        calls.append(self.spec["name"])
+        previous = os.environ.get("KUBECONFIG")
+        os.environ["KUBECONFIG"] = str(tmp_path / f"{self.spec['name']}.kubeconfig")
+        try:
+            yield
+        finally:
+            if previous is None:
+                del os.environ["KUBECONFIG"]
+            else:
+                os.environ["KUBECONFIG"] = previous
+
+    monkeypatch.setattr(Cluster, "auth_kubeconfig", fake_auth_kubeconfig)
+    cluster1 = Cluster({"name": "cluster1", "provider": "kubeconfig"}, Path("x"))
+    cluster2 = Cluster({"name": "cluster2", "provider": "kubeconfig"}, Path("x"))
+
+    with cluster1.auth():
+        with cluster1.auth():
+            assert os.environ["KUBECONFIG"].endswith("cluster1.kubeconfig")
+        # Only the outermost auth of a cluster undoes it
+        assert os.environ["KUBECONFIG"].endswith("cluster1.kubeconfig")
+        with cluster2.auth():
+            assert os.environ["KUBECONFIG"].endswith("cluster2.kubeconfig")
+    assert calls == ["cluster1", "cluster2"]
+
+    with cluster1.auth():
+        pass
+    assert calls == ["cluster1", "cluster2", "cluster1"]
+
+
+def test_azure_always_logs_in(tmp_path, monkeypatch):
+    key = tmp_path / "enc-deployer-credentials.secret.json"
+    key.write_text(
+        '{"service_principal_id": "id", "service_principal_password": "pw",'
+        ' "tenant_id": "t", "subscription_id": "s"}'
+    )
+    monkeypatch.setattr(cluster_module, "_active_auth_sessions", {})
+    monkeypatch.setattr(
+        cluster_module, "get_decrypted_file", lambda path: contextlib.nullcontext(path)
+    )
+    # Even with a cached kubeconfig around, it isn't used
+    monkeypatch.setattr(cluster_module, "restore_session", lambda *args: True)
+    calls = []
+    monkeypatch.setattr(
+        cluster_module.tracing, "check_call", lambda cmd, **kwargs: calls.append(cmd)
+    )
+    cluster = Cluster(
+        {
+            "name": "cluster1",
+            "provider": "azure",
+            "azure": {"key": key.name, "cluster": "c", "resource_group": "rg"},
+        },
+        tmp_path / "cluster.yaml",
+    )
+
+    with cluster.auth():
+        pass
+    assert [cmd[:3] for cmd in calls] == [
+        ["az", "login", "--service-principal"],
+        ["az", "account", "set"],
+        ["az", "ask", "get-credentials"],
+    ]
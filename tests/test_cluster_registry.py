@@ -0,0 +1,83 @@
+import pytest
+
+from deployer.infra_components import cluster as cluster_module
+from deployer.infra_components.cluster import ClusterRegistry
+
+
+@pytest.fixture
+def clusters_path(tmp_path):
+    for name, provider, dask_gateway in [
+        ("aws-dask", "aws", True),
+        ("gcp-base", "gcp", False),
+        ("gcp-dask", "gcp", True),
+    ]:
+        cluster_dir = tmp_path / name
+        cluster_dir.mkdir()
+        (cluster_dir / "cluster.yaml").write_text(
+            f"name: {name}\n"
+            f"provider: {provider}\n"
+            "hubs:\n"
+            "- name: hub1\n"
+            "  helm_chart: basehub\n"
+            "  helm_chart_values_files:\n"
+            "  - hub1.values.yaml\n"
+        )
+        enabled = str(dask_gateway).lower()
+        (cluster_dir / "hub1.values.yaml").write_text(
+            f"dask-gateway:\n  enabled: {enabled}\n"
+            f"jupyterhub:\n  custom:\n    daskhubSetup:\n      enabled: {enabled}\n"
+        )
+    # Neither templates nor directories without a cluster.yaml are clusters
+    (tmp_path / "templates").mkdir()
+    (tmp_path / "templates" / "cluster.yaml").write_text("name: template\n")
+    (tmp_path / "not-a-cluster").mkdir()
+    return tmp_path
+
+
+def test_registry_lists_clusters_lazily(clusters_path, monkeypatch):
+    loaded = []
+    load_config_file = cluster_module.load_config_file
+    monkeypatch.setattr(
+        cluster_module,
+        "load_config_file",
+        lambda path: loaded.append(path.parent.name) or load_config_file(path),
+    )
+    registry = ClusterRegistry(clusters_path)
+
+    assert registry.names == ["aws-dask", "gcp-base", "gcp-dask"]
+    assert len(registry) == 3
+    assert "gcp-base" in registry
+    assert "templates" not in registry
+    assert registry.filter(name_glob="gcp-*").names == ["gcp-base", "gcp-dask"]
+    # Nothing was read, and no Cluster objects were built
+    assert loaded == []
+    assert registry._clusters == {}
+
+    cluster = registry.get("gcp-base")
+    assert cluster.spec["provider"] == "gcp"
+    assert registry.get("gcp-base") is cluster
+    assert loaded == ["gcp-base"]
+    assert [c.spec["name"] for c in registry] == registry.names
+
+
+def test_registry_filter(clusters_path):
+    registry = ClusterRegistry(clusters_path)
+
+    assert registry.filter(provider="gcp").names == ["gcp-base", "gcp-dask"]
+    assert registry.filter(hub_type="daskhub").names == ["aws-dask", "gcp-dask"]
+    assert registry.filter(provider="gcp", hub_type="daskhub").names == ["gcp-dask"]
+    assert registry.filter(provider="gcp", name_glob="*-base").names == ["gcp-base"]
+    assert registry.filter(provider="azure").names == []
+
+    # Filtered views share the clusters already built
+    filtered = registry.filter(provider="aws")
+    assert filtered.get("aws-dask") is registry.get("aws-dask")
+
+
+def test_registry_get_unknown_cluster(clusters_path):
+    registry = ClusterRegistry(clusters_path)
+    with pytest.raises(FileNotFoundError, match="No cluster named missing found"):
+        registry.get("missing")
+    # Clusters filtered out of a view can't be got from it
+    with pytest.raises(FileNotFoundError):
+        registry.filter(provider="aws").get("gcp-base")
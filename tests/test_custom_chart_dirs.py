@@ -0,0 +1,60 @@
+import importlib
+import os
+
+import pytest
+
+validate_config = importlib.import_module("deployer.commands.validate.config")
+
+
+@pytest.fixture
+def charts(tmp_path, monkeypatch):
+    basehub = tmp_path / "helm-charts" / "basehub"
+    (basehub / "charts").mkdir(parents=True)
+    (basehub / "Chart.yaml").write_text("name: basehub\n")
+    (basehub / "values.yaml").write_text("a: 1\n")
+    # Generated by `helm dep up`, so left out of custom chart directories
+    (basehub / "charts" / "jupyterhub.tgz").write_text("")
+    monkeypatch.setattr(validate_config, "HELM_CHARTS_DIR", tmp_path / "helm-charts")
+    monkeypatch.setattr(
+        validate_config, "CUSTOM_HUB_CHARTS_CACHE_DIR", tmp_path / "cache"
+    )
+    monkeypatch.setattr(validate_config, "MAX_CUSTOM_HUB_CHARTS", 2)
+    return tmp_path
+
+
+def _get_chart_dir(charts, chart_override):
+    override_path = charts / chart_override
+    if not override_path.exists():
+        override_path.write_text(f"name: basehub\ndescription: {chart_override}\n")
+    return validate_config.get_chart_dir(
+        charts / "helm-charts" / "basehub", chart_override, override_path, False
+    )
+
+
+def test_get_chart_dir(charts):
+    default_dir = charts / "helm-charts" / "basehub"
+    assert validate_config.get_chart_dir(default_dir, None, None, False) == default_dir
+
+    chart_dir = _get_chart_dir(charts, "chart.yaml")
+    assert chart_dir.name == "basehub"
+    assert chart_dir.parent.parent == charts / "cache"
+    assert (chart_dir / "Chart.yaml").read_text().endswith("chart.yaml\n")
+    assert (chart_dir / "values.yaml").read_text() == "a: 1\n"
+    assert not (chart_dir / "charts").exists()
+    # Hubs using the same override file share the directory
+    assert _get_chart_dir(charts, "chart.yaml") == chart_dir
+
+
+def test_old_custom_chart_dirs_are_pruned(charts):
+    first = _get_chart_dir(charts, "first.yaml").parent
+    second = _get_chart_dir(charts, "second.yaml").parent
+    os.utime(first, (0, 0))
+    os.utime(second, (1, 1))
+    # Using a directory again marks it as recently used
+    assert _get_chart_dir(charts, "first.yaml").parent == first
+
+    third = _get_chart_dir(charts, "third.yaml").parent
+    assert sorted(p.name for p in (charts / "cache").iterdir()) == sorted(
+        [first.name, third.name]
+    )
+    assert not second.exists()
@@ -0,0 +1,151 @@
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from deployer.commands.plan_upgrade import dependency_index
+from deployer.commands.plan_upgrade.decision import generate_hub_matrix_jobs
+from deployer.commands.plan_upgrade.dependency_index import (
+    build_dependency_index,
+    find_dependents,
+    get_dependency_index,
+)
+
+root_path = Path(__file__).parent.parent
+
+
+@pytest.fixture
+def test_clusters():
+    with mock.patch(
+        "deployer.utils.file_acquisition.CONFIG_CLUSTERS_PATH",
+        root_path / "tests/test-clusters",
+    ):
+        yield
+
+
+def test_find_dependents(test_clusters):
+    index = build_dependency_index()
+    assert list(index["clusters"]) == ["cluster1", "cluster2", "cluster3"]
+
+    affected = find_dependents(
+        index,
+        [
+            "tests/test-clusters/cluster1/hub1.values.yaml",
+            root_path / "tests/test-clusters/cluster1/support.values.yaml",
+            "tests/test-clusters/cluster3/cluster.yaml",
+            "docs/index.md",
+        ],
+    )
+    assert affected == {
+        "cluster1": {
+            "cluster": [],
+            "support": ["tests/test-clusters/cluster1/support.values.yaml"],
+            "support_imports": [],
+            "terraform": [],
+            "eksctl": [],
+            "hubs": {"hub1": ["tests/test-clusters/cluster1/hub1.values.yaml"]},
+            "hub_imports": {},
+        },
+        "cluster3": {
+            "cluster": ["tests/test-clusters/cluster3/cluster.yaml"],
+            "support": [],
+            "support_imports": [],
+            "terraform": [],
+            "eksctl": [],
+            "hubs": {},
+            "hub_imports": {},
+        },
+    }
+
+
+def test_jsonnet_imports_are_tracked(tmp_path):
+    cluster_dir = tmp_path / "clusters" / "cluster1"
+    cluster_dir.mkdir(parents=True)
+    (cluster_dir / "cluster.yaml").write_text(
+        "name: cluster1\n"
+        "provider: gcp\n"
+        "hubs:\n"
+        "- name: staging\n"
+        "  helm_chart_values_files: [staging.values.jsonnet]\n"
+        "- name: prod\n"
+        "  helm_chart_values_files: [prod.values.yaml]\n"
+    )
+    (cluster_dir / "staging.values.jsonnet").write_text(
+        "local common = import '../lib/common.libsonnet';\ncommon"
+    )
+    (cluster_dir / "prod.values.yaml").write_text("{}")
+    (tmp_path / "clusters" / "lib").mkdir()
+    (tmp_path / "clusters" / "lib" / "common.libsonnet").write_text(
+        "{ nodeSelector: importstr 'node-selector.txt' }"
+    )
+    (tmp_path / "clusters" / "lib" / "node-selector.txt").write_text("pool")
+
+    with mock.patch(
+        "deployer.utils.file_acquisition.CONFIG_CLUSTERS_PATH", tmp_path / "clusters"
+    ):
+        index = build_dependency_index()
+
+    # A change to a transitively imported file only affects the hub importing it
+    changed_file = tmp_path / "clusters" / "lib" / "node-selector.txt"
+    affected = find_dependents(index, [changed_file])
+    assert list(affected) == ["cluster1"]
+    assert affected["cluster1"]["hubs"] == {}
+    assert list(affected["cluster1"]["hub_imports"]) == ["staging"]
+
+    staging_jobs, prod_jobs = generate_hub_matrix_jobs(
+        cluster_dir / "cluster.yaml",
+        index["clusters"]["cluster1"]["config"],
+        {"cluster_name": "cluster1", "provider": "gcp", "choice_reason": ""},
+        {changed_file},
+        modified_imports=affected["cluster1"]["hub_imports"],
+    )
+    assert staging_jobs == [
+        {
+            "cluster_name": "cluster1",
+            "provider": "gcp",
+            "hub_name": "staging",
+            "choice_reason": "Following files imported by helm chart values files "
+            "were modified: node-selector.txt",
+        }
+    ]
+    assert prod_jobs == []
+
+
+def test_dependency_index_is_cached_by_tree(test_clusters, tmp_path, monkeypatch):
+    monkeypatch.setattr(dependency_index, "DEPENDENCY_INDEX_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(dependency_index, "_get_tree_key", lambda: "tree")
+
+    index = get_dependency_index()
+    assert (tmp_path / "tree.json").exists()
+    with mock.patch.object(
+        dependency_index, "build_dependency_index"
+    ) as build_dependency_index:
+        assert get_dependency_index() == index
+        build_dependency_index.assert_not_called()
+
+
+def test_cached_index_follows_chart_imports(test_clusters, tmp_path, monkeypatch):
+    monkeypatch.setattr(dependency_index, "DEPENDENCY_INDEX_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(dependency_index, "_get_tree_key", lambda: "tree")
+    charts_dir = tmp_path / "helm-charts"
+    (charts_dir / "basehub").mkdir(parents=True)
+    (tmp_path / "old.libsonnet").write_text("{}")
+    (tmp_path / "new.libsonnet").write_text("{}")
+    values_file = charts_dir / "basehub" / "values.jsonnet"
+    values_file.write_text("import '../../old.libsonnet'")
+    monkeypatch.setattr(
+        dependency_index.file_acquisition, "HELM_CHARTS_DIR", charts_dir
+    )
+
+    index = get_dependency_index()
+    assert index["chart_imports"] == {
+        dependency_index._relpath(tmp_path / "old.libsonnet"): ["basehub"]
+    }
+
+    # Importing another file, outside of the trees the cache is keyed by,
+    # rebuilds the index
+    values_file.write_text("import '../../new.libsonnet'")
+    index = get_dependency_index()
+    assert index["chart_imports"] == {
+        dependency_index._relpath(tmp_path / "new.libsonnet"): ["basehub"]
+    }
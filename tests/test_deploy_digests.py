@@ -0,0 +1,57 @@
+from deployer.utils import deploy_digests
+from deployer.utils.deploy_digests import describe_changes, get_manifests_digest
+
+MANIFESTS = """\
+---
+# Source: basehub/templates/configmap.yaml
+apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: config
+data:
+  a: "1"
+  b: "2"
+---
+apiVersion: v1
+kind: Service
+metadata:
+  name: proxy-public
+  namespace: kube-system
+spec:
+  type: LoadBalancer
+"""
+
+
+def test_manifests_digest_ignores_formatting():
+    digest = get_manifests_digest(MANIFESTS, "staging")
+    assert list(digest) == [
+        "ConfigMap/staging/config",
+        "Service/kube-system/proxy-public",
+    ]
+
+    reformatted = MANIFESTS.replace('  a: "1"\n  b: "2"\n', "  b: '2'\n  a: '1'\n")
+    assert get_manifests_digest(reformatted, "staging") == digest
+
+    changed = MANIFESTS.replace("LoadBalancer", "ClusterIP")
+    assert describe_changes(digest, get_manifests_digest(changed, "staging")) == [
+        "changed: Service/kube-system/proxy-public"
+    ]
+    assert describe_changes(digest, {"Secret/staging/hub": "x"}) == [
+        "removed: ConfigMap/staging/config",
+        "added: Secret/staging/hub",
+        "removed: Service/kube-system/proxy-public",
+    ]
+
+
+def test_deploy_digests_are_saved_per_release(tmp_path, monkeypatch):
+    monkeypatch.setattr(deploy_digests, "DEPLOY_DIGESTS_DIR", tmp_path)
+    digest = {"revision": 3, "resources": {"ConfigMap/staging/config": "abc"}}
+
+    assert deploy_digests.load_deploy_digest("2i2c", "staging") is None
+    deploy_digests.save_deploy_digest("2i2c", "staging", digest)
+    assert deploy_digests.load_deploy_digest("2i2c", "staging") == digest
+    assert deploy_digests.load_deploy_digest("2i2c", "prod") is None
+
+    deploy_digests.forget_deploy_digest("2i2c", "staging")
+    deploy_digests.forget_deploy_digest("2i2c", "staging")
+    assert deploy_digests.load_deploy_digest("2i2c", "staging") is None
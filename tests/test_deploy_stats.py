@@ -0,0 +1,31 @@
+import json
+
+from deployer.utils import deploy_stats
+
+
+def test_merge_deploy_stats(tmp_path, monkeypatch):
+    monkeypatch.setattr(deploy_stats, "DEPLOY_STATS_FILE", tmp_path / "stats.json")
+    monkeypatch.setattr(deploy_stats, "MAX_DURATIONS", 3)
+    deploy_stats.record_deploy_durations(
+        {("cluster1", "hub1"): 100.04, ("cluster1", "hub2"): 50}
+    )
+
+    # Written by two CI jobs, each only knowing about its own deploys
+    job_files = []
+    for i, stats in enumerate(
+        [
+            {"cluster1/hub1": [110, 120]},
+            {"cluster1/hub1": [130], "cluster2/hub1": [10]},
+        ]
+    ):
+        job_file = tmp_path / f"job{i}.json"
+        job_file.write_text(json.dumps(stats))
+        job_files.append(job_file)
+    deploy_stats.merge_deploy_stats(job_files)
+
+    assert deploy_stats.load_deploy_stats() == {
+        # Only the last MAX_DURATIONS durations are kept
+        "cluster1/hub1": [110, 120, 130],
+        "cluster1/hub2": [50],
+        "cluster2/hub1": [10],
+    }
@@ -0,0 +1,56 @@
+import os
+import stat
+import subprocess
+
+import pytest
+
+from deployer.utils import file_acquisition
+
+
+@pytest.fixture
+def sops_calls(monkeypatch):
+    """
+    Replace sops with a fake that "decrypts" a file by writing its first line
+    """
+    monkeypatch.setattr(file_acquisition, "_decrypted_contents_cache", {})
+    monkeypatch.setattr(
+        file_acquisition, "_decryption_stats", {"sops_calls": 0, "sops_calls_saved": 0}
+    )
+    calls = []
+
+    def fake_check_call(cmd, **kwargs):
+        assert cmd[0] == "sops"
+        calls.append(cmd)
+        output, encrypted_file = cmd[2], cmd[-1]
+        with open(encrypted_file) as src, open(output, "w") as dst:
+            dst.write(src.readline())
+
+    monkeypatch.setattr(subprocess, "check_call", fake_check_call)
+    return calls
+
+
+def test_decrypted_contents_are_cached(tmp_path, sops_calls):
+    secret = tmp_path / "enc-hub.secret.values.yaml"
+    secret.write_text("password: one\nsops: {}\n")
+
+    for _ in range(3):
+        with file_acquisition.get_decrypted_file(secret) as decrypted_path:
+            assert open(decrypted_path).read() == "password: one\n"
+            assert stat.S_IMODE(os.stat(decrypted_path).st_mode) == 0o600
+    assert len(sops_calls) == 1
+    # The temporary file with the plaintext is gone once we are done with it
+    assert not os.path.exists(decrypted_path)
+
+    # Changing the encrypted file decrypts it again
+    secret.write_text("password: two\nsops: {}\n")
+    with file_acquisition.get_decrypted_file(secret) as decrypted_path:
+        assert open(decrypted_path).read() == "password: two\n"
+    assert len(sops_calls) == 2
+
+
+def test_files_without_secret_in_name_are_not_decrypted(tmp_path, sops_calls):
+    values = tmp_path / "values.yaml"
+    values.write_text("a: 1\n")
+    with file_acquisition.get_decrypted_file(values) as path:
+        assert path == values
+    assert sops_calls == []
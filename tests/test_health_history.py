@@ -0,0 +1,58 @@
+from deployer.utils import health_history
+
+
+def _record(revision, spawn_duration, status="passed"):
+    return {
+        "timestamp": 0,
+        "status": status,
+        "duration": spawn_duration + 20,
+        "revision": revision,
+        "notebooks": [
+            {
+                "notebook": "check.ipynb",
+                "cleanup_duration": 1,
+                "spawn_duration": spawn_duration,
+                "kernel_start_duration": 2,
+                "execution_duration": 15,
+                "teardown_duration": 2,
+            }
+        ],
+    }
+
+
+def test_record_and_load_health_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(health_history, "HEALTH_HISTORY_DIR", tmp_path)
+    health_history.record_health_check("cluster1", "hub1", _record(1, 10))
+    health_history.record_health_check("cluster1", "hub2", _record(1, 10))
+    health_history.record_health_check("cluster1", "hub1", _record(2, 30))
+
+    history = health_history.load_health_history("cluster1", "hub1")
+    assert list(history) == [("cluster1", "hub1")]
+    assert [r["revision"] for r in history[("cluster1", "hub1")]] == [1, 2]
+    assert len(health_history.load_health_history()) == 2
+
+
+def test_summarize_health_history():
+    records = (
+        [_record(1, 10) for _ in range(3)]
+        + [_record(1, 10, status="failed")]
+        + [_record(2, 12), _record(2, 40), _record(2, 45)]
+    )
+    summary = health_history.summarize_health_history(records, percentiles=(50,))
+
+    assert summary["checks"] == 7
+    assert summary["failures"] == 1
+    assert summary["percentiles"]["spawn"] == {50: 11}
+    assert summary["percentiles"]["execution"] == {50: 15}
+    # The median spawn of revision 2 is 40s, up from 10s for revision 1
+    assert summary["regressions"] == [
+        "duration: median 30.0s -> 60.0s (revision 1 -> 2)",
+        "spawn: median 10.0s -> 40.0s (revision 1 -> 2)",
+    ]
+
+
+def test_summarize_health_history_without_regressions():
+    records = [_record(1, 10), _record(2, 11), _record(2, 13)]
+    summary = health_history.summarize_health_history(records)
+    assert summary["regressions"] == []
+    assert health_history.summarize_health_history([])["percentiles"] == {}
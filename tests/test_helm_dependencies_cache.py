@@ -0,0 +1,83 @@
+from unittest import mock
+
+import pytest
+
+from deployer.utils import helm
+
+
+@pytest.fixture
+def charts(tmp_path, monkeypatch):
+    monkeypatch.setattr(helm, "HELM_DEPENDENCIES_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.delenv("DEPLOYER_NO_HELM_DEPENDENCIES_CACHE", raising=False)
+
+    basehub = tmp_path / "basehub"
+    basehub.mkdir()
+    (basehub / "Chart.yaml").write_text(
+        "name: basehub\n"
+        "dependencies:\n"
+        "  - name: jupyterhub\n"
+        "    version: 4.3.3\n"
+        "    repository: https://jupyterhub.github.io/helm-chart/\n"
+    )
+    (basehub / "values.yaml").write_text("a: 1\n")
+    daskhub = tmp_path / "daskhub"
+    daskhub.mkdir()
+    (daskhub / "Chart.yaml").write_text(
+        "name: daskhub\n"
+        "dependencies:\n"
+        "  - name: basehub\n"
+        "    repository: file://../basehub\n"
+    )
+    return basehub, daskhub
+
+
+def fake_helm_dep_up():
+    """
+    Return a stand-in for `subprocess.check_call` that writes the files
+    `helm dep up` would
+    """
+
+    def check_call(cmd):
+        chart_dir = cmd[-1]
+        (chart_dir / "charts").mkdir(exist_ok=True)
+        (chart_dir / "charts" / "dependency.tgz").write_text(str(chart_dir))
+        (chart_dir / "Chart.lock").write_text("generated: now\n")
+
+    return mock.patch(
+        "deployer.utils.helm.subprocess.check_call", side_effect=check_call
+    )
+
+
+def test_update_chart_dependencies_uses_cache(charts):
+    basehub, _ = charts
+    with fake_helm_dep_up() as check_call:
+        helm.update_chart_dependencies(basehub)
+        helm.update_chart_dependencies(basehub)
+        assert check_call.call_count == 1
+
+        # A fresh checkout gets the dependencies from the cache
+        (basehub / "charts" / "dependency.tgz").unlink()
+        (basehub / "Chart.lock").unlink()
+        helm.update_chart_dependencies(basehub)
+        assert check_call.call_count == 1
+        assert (basehub / "charts" / "dependency.tgz").read_text() == str(basehub)
+        assert (basehub / "Chart.lock").exists()
+
+        # Changing Chart.yaml invalidates the cache
+        with open(basehub / "Chart.yaml", "a") as f:
+            f.write("version: 0.2.0\n")
+        helm.update_chart_dependencies(basehub)
+        assert check_call.call_count == 2
+
+
+def test_chart_dependencies_key_includes_local_charts(charts):
+    basehub, daskhub = charts
+    key = helm.get_chart_dependencies_key(daskhub)
+
+    # Files generated by `helm dep up` in basehub don't change the key
+    with fake_helm_dep_up():
+        helm.update_chart_dependencies(basehub)
+    assert helm.get_chart_dependencies_key(daskhub) == key
+
+    (basehub / "values.yaml").write_text("a: 2\n")
+    assert helm.get_chart_dependencies_key(daskhub) != key
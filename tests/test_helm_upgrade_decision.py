@@ -10,7 +10,10 @@ from deployer.commands.plan_upgrade.decision import (
     filter_out_staging_hubs,
     generate_hub_matrix_jobs,
     generate_support_matrix_jobs,
+    get_modified_chart_files,
+    shard_hub_matrix_jobs,
 )
+from deployer.utils.deploy_stats import get_expected_durations
 from deployer.utils.file_acquisition import get_all_cluster_yaml_files
 
 yaml = YAML(typ="safe", pure=True)
@@ -351,10 +354,44 @@ def test_discover_modified_common_files_hub_helm_charts():
         daskhub_upgrade_all_hubs,
     ) = discover_modified_common_files(input_path_daskhub)
 
+    # Hub charts only affect the hubs using them, see get_modified_chart_files
     assert not basehub_upgrade_all_clusters
-    assert basehub_upgrade_all_hubs
+    assert not basehub_upgrade_all_hubs
     assert not daskhub_upgrade_all_clusters
-    assert daskhub_upgrade_all_hubs
+    assert not daskhub_upgrade_all_hubs
+
+
+def test_get_modified_chart_files():
+    cluster_file = root_path.joinpath("tests/test-clusters/cluster1/cluster.yaml")
+    modified_charts = {
+        "basehub": ["helm-charts/basehub/Chart.yaml"],
+        "daskhub": ["helm-charts/daskhub/values.yaml"],
+    }
+    basehub = {"name": "hub1", "helm_chart": "basehub"}
+    daskhub = {"name": "hub2", "helm_chart": "daskhub"}
+    custom_hub = {
+        "name": "hub3",
+        "helm_chart": "basehub",
+        "chart_override": "hub3-chart.yaml",
+    }
+
+    assert get_modified_chart_files(cluster_file, basehub, modified_charts, set()) == [
+        "helm-charts/basehub/Chart.yaml"
+    ]
+    assert get_modified_chart_files(cluster_file, daskhub, modified_charts, set()) == [
+        "helm-charts/basehub/Chart.yaml",
+        "helm-charts/daskhub/values.yaml",
+    ]
+    # Hubs with a chart_override don't use the basehub Chart.yaml file
+    assert (
+        get_modified_chart_files(cluster_file, custom_hub, modified_charts, set()) == []
+    )
+    assert get_modified_chart_files(
+        cluster_file,
+        custom_hub,
+        modified_charts,
+        {cluster_file.parent / "hub3-chart.yaml"},
+    ) == ["tests/test-clusters/cluster1/hub3-chart.yaml"]
 
 
 def test_discover_modified_common_files_support_helm_chart():
@@ -561,3 +598,58 @@ def test_assign_staging_jobs_for_missing_clusters_is_missing_many_staging():
     print(result_staging_jobs)
 
     case.assertCountEqual(result_staging_jobs, expected_staging_jobs)
+
+
+def test_shard_hub_matrix_jobs():
+    input_prod_jobs = [
+        {
+            "provider": "gcp",
+            "cluster_name": "cluster1",
+            "hub_name": hub_name,
+            "choice_reason": "Core infrastructure has been modified",
+        }
+        for hub_name in ["hub1", "hub2", "hub3", "hub4"]
+    ] + [
+        {
+            "provider": "aws",
+            "cluster_name": "cluster2",
+            "hub_name": "hub1",
+            "choice_reason": "Following helm chart values files were modified: prod.values.yaml",
+        }
+    ]
+    # hub4 has no recorded durations, so is expected to take as long as the
+    # median hub
+    stats = {
+        "cluster1/hub1": [900, 880, 920],
+        "cluster1/hub2": [300],
+        "cluster1/hub3": [200, 400],
+        "cluster2/hub1": [100],
+    }
+
+    result_prod_jobs = shard_hub_matrix_jobs(
+        input_prod_jobs, 2, get_expected_durations(stats)
+    )
+
+    assert result_prod_jobs == [
+        {
+            "provider": "gcp",
+            "cluster_name": "cluster1",
+            "hub_names": ["hub1"],
+            "choice_reason": "Core infrastructure has been modified",
+            "expected_duration": 900,
+        },
+        {
+            "provider": "gcp",
+            "cluster_name": "cluster1",
+            "hub_names": ["hub2", "hub3", "hub4"],
+            "choice_reason": "Core infrastructure has been modified",
+            "expected_duration": 900,
+        },
+        {
+            "provider": "aws",
+            "cluster_name": "cluster2",
+            "hub_names": ["hub1"],
+            "choice_reason": "Following helm chart values files were modified: prod.values.yaml",
+            "expected_duration": 100,
+        },
+    ]
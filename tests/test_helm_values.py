@@ -0,0 +1,56 @@
+from deployer.utils.helm_values import merge_values, validate_values
+from deployer.utils.yaml_loader import load_yaml
+
+
+def test_merge_values():
+    base = {"a": {"b": 1, "c": [1, 2]}, "d": True}
+    override = {"a": {"c": [3], "e": "x"}, "d": None}
+    assert merge_values(base, override) == {"a": {"b": 1, "c": [3], "e": "x"}}
+    # Neither input is modified
+    assert base == {"a": {"b": 1, "c": [1, 2]}, "d": True}
+
+
+def test_validate_values_reports_all_violations_with_location(tmp_path):
+    chart_dir = tmp_path / "basehub"
+    chart_dir.mkdir()
+    (chart_dir / "Chart.yaml").write_text(
+        "name: basehub\ndependencies:\n  - name: jupyterhub\n"
+    )
+    (chart_dir / "values.yaml").write_text("nfs:\n  enabled: false\n")
+    (chart_dir / "values.schema.yaml").write_text("""
+type: object
+additionalProperties: false
+required: [global, jupyterhub, nfs]
+properties:
+  global:
+    type: object
+  jupyterhub:
+    type: object
+  nfs:
+    type: object
+    additionalProperties: false
+    properties:
+      enabled:
+        type: boolean
+      pv:
+        type: object
+""")
+    values_file = tmp_path / "hub.values.yaml"
+    values_file.write_text("""\
+nfs:
+  enabled: true
+  pv: yes-please
+typo: 1
+""")
+
+    violations = validate_values(
+        chart_dir, [(values_file, load_yaml(values_file.read_text()), [])]
+    )
+    assert len(violations) == 2
+    assert violations[0].endswith(
+        "hub.values.yaml:4: <root>: Additional properties are not allowed "
+        "('typo' was unexpected)"
+    )
+    assert violations[1].endswith(
+        "hub.values.yaml:3: nfs.pv: 'yes-please' is not of type 'object'"
+    )
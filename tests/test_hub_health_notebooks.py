@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from deployer.health_check_tests import test_hub_health as hub_health
+from deployer.health_check_tests.test_hub_health import USERNAME, NotebookMode
+
+
+class FakeKernel:
+    def __init__(self, hub):
+        self.hub = hub
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def send_code(self, username, code, timeout=None):
+        if code == "fail":
+            raise ValueError("the notebook failed")
+        self.hub.calls.append(("send_code", username, code))
+
+
+class FakeJupyter:
+    def __init__(self, hub):
+        self.hub = hub
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def ensure_kernel(self):
+        return "kernel", FakeKernel(self.hub)
+
+    async def delete_kernel(self, kernel_id):
+        pass
+
+
+class FakeHubAPI:
+    """
+    Records the calls made to the JupyterHub API by all checks
+    """
+
+    calls = []
+    fail_server_deletion = False
+
+    def __init__(self, hub_url, api_token):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def get_user(self, username):
+        return None
+
+    async def ensure_server(self, username, timeout, create_user):
+        self.calls.append(("ensure_server", username))
+        return FakeJupyter(self)
+
+    async def ensure_server_deleted(self, username, timeout):
+        self.calls.append(("ensure_server_deleted", username))
+        if self.fail_server_deletion:
+            raise TimeoutError("the server didn't stop")
+
+    async def delete_user(self, username):
+        self.calls.append(("delete_user", username))
+
+
+@pytest.fixture
+def fake_hub(tmp_path, monkeypatch):
+    for name in ["a.ipynb", "b.ipynb"]:
+        (tmp_path / name).write_text(name)
+    FakeHubAPI.calls = []
+    FakeHubAPI.fail_server_deletion = False
+    monkeypatch.setattr(hub_health, "JupyterHubAPI", FakeHubAPI)
+    monkeypatch.setattr(hub_health, "notebook_dir", lambda hub_type: tmp_path)
+    # The code of a "notebook" is the contents of its file
+    monkeypatch.setattr(
+        hub_health,
+        "parse_notebook_cells",
+        lambda path: [(open(path).read(), None)],
+    )
+    return FakeHubAPI
+
+
+def _check(notebook_mode):
+    return asyncio.run(
+        hub_health.test_hub_healthy(
+            "https://hub.example.org", "token", "basehub", False, notebook_mode
+        )
+    )
+
+
+def test_shared_server(fake_hub):
+    timings = _check(NotebookMode.SHARED_SERVER)
+
+    assert fake_hub.calls == [
+        ("ensure_server", USERNAME),
+        ("send_code", USERNAME, "a.ipynb"),
+        ("send_code", USERNAME, "b.ipynb"),
+        ("ensure_server_deleted", USERNAME),
+    ]
+    assert [t["notebook"] for t in timings] == ["a.ipynb", "b.ipynb"]
+    # Starting and stopping the server is only counted once
+    assert timings[0]["spawn_duration"] is not None
+    assert timings[1]["spawn_duration"] is None
+    assert timings[0]["teardown_duration"] is None
+    assert timings[1]["teardown_duration"] is not None
+
+
+def test_concurrent(fake_hub):
+    timings = _check(NotebookMode.CONCURRENT)
+
+    assert [(t["notebook"], t["username"]) for t in timings] == [
+        ("a.ipynb", f"{USERNAME}-1"),
+        ("b.ipynb", f"{USERNAME}-2"),
+    ]
+    for username, notebook in [(f"{USERNAME}-1", "a"), (f"{USERNAME}-2", "b")]:
+        calls = [call for call in fake_hub.calls if call[1] == username]
+        assert calls == [
+            ("ensure_server", username),
+            ("send_code", username, f"{notebook}.ipynb"),
+            ("ensure_server_deleted", username),
+            # The users of concurrent checks aren't kept around
+            ("delete_user", username),
+        ]
+
+
+def test_failed_check_stops_server(fake_hub, tmp_path):
+    (tmp_path / "a.ipynb").write_text("fail")
+    fake_hub.fail_server_deletion = True
+
+    # The error of the notebook isn't hidden by the one stopping the server
+    with pytest.raises(ValueError, match="the notebook failed"):
+        _check(NotebookMode.SHARED_SERVER)
+    assert fake_hub.calls == [
+        ("ensure_server", USERNAME),
+        ("ensure_server_deleted", USERNAME),
+    ]
@@ -0,0 +1,91 @@
+import importlib
+
+import pytest
+
+from deployer.utils import deploy_digests
+
+deployer = importlib.import_module("deployer.commands.deployer")
+
+MANIFESTS = """
+kind: Deployment
+metadata:
+  name: hub
+spec:
+  replicas: 1
+"""
+
+
+class FakeHub:
+    def __init__(self):
+        self.spec = {"name": "hub1", "helm_chart": "basehub"}
+        self.legacy_daskhub = False
+        self.manifests = MANIFESTS
+        self.deploys = 0
+        # Every helm upgrade creates a new revision
+        self.revision = 1
+
+    def render_manifests(self, chart_dir):
+        return self.manifests
+
+    def deploy(self, chart_dir, dask_gateway_version, debug, dry_run):
+        self.deploys += 1
+        self.revision += 1
+
+
+@pytest.fixture
+def hub(tmp_path, monkeypatch):
+    hub = FakeHub()
+    monkeypatch.setattr(deploy_digests, "DEPLOY_DIGESTS_DIR", tmp_path)
+    monkeypatch.setattr(deployer, "get_hub_chart_override", lambda hub: (None, None))
+    monkeypatch.setattr(deployer, "get_chart_dir", lambda *args: tmp_path)
+    monkeypatch.setattr(
+        deployer, "determine_dask_gateway_version", lambda chart_dir: "2024.1.0"
+    )
+    monkeypatch.setattr(deployer, "validate_hub", lambda hub, chart_dir: None)
+    monkeypatch.setattr(deployer, "cleanup_values_schema_json", lambda d: None)
+    monkeypatch.setattr(
+        deployer, "get_release_revision", lambda name, namespace: hub.revision
+    )
+    return hub
+
+
+def _deploy(hub, incremental=True):
+    return deployer.deploy_hub(
+        "cluster1", hub, False, False, skip_refresh=True, incremental=incremental
+    )
+
+
+def test_unchanged_hub_is_skipped(hub):
+    # Nothing recorded yet
+    assert _deploy(hub)
+    assert hub.deploys == 1
+    assert deploy_digests.load_deploy_digest("cluster1", "hub1")["revision"] == 2
+
+    assert not _deploy(hub)
+    assert hub.deploys == 1
+
+
+def test_changed_manifests_are_deployed(hub):
+    _deploy(hub)
+    hub.manifests = MANIFESTS.replace("replicas: 1", "replicas: 2")
+    assert _deploy(hub)
+    assert hub.deploys == 2
+    # And the new manifests are recorded
+    assert not _deploy(hub)
+    assert hub.deploys == 2
+
+
+def test_release_deployed_by_others_is_deployed(hub):
+    _deploy(hub)
+    # Someone ran helm upgrade (or rollback) without us
+    hub.revision += 1
+    assert _deploy(hub)
+    assert hub.deploys == 2
+
+
+def test_non_incremental_deploy_forgets_digest(hub):
+    _deploy(hub)
+    assert _deploy(hub, incremental=False)
+    assert deploy_digests.load_deploy_digest("cluster1", "hub1") is None
+    assert _deploy(hub)
+    assert hub.deploys == 3
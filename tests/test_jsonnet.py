@@ -0,0 +1,90 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from deployer.utils import file_acquisition, jsonnet
+
+
+@pytest.fixture
+def jsonnet_files(tmp_path):
+    lib = tmp_path / "lib"
+    lib.mkdir()
+    (tmp_path / "hub.jsonnet").write_text(
+        "local common = import 'common.libsonnet';\n"
+        'local banner = importstr "banner.txt";\n'
+        "common + { banner: banner }\n"
+    )
+    # Found through the jpath rather than next to hub.jsonnet
+    (lib / "common.libsonnet").write_text("(import 'nested.libsonnet') + { a: 1 }\n")
+    (lib / "nested.libsonnet").write_text("{ b: 2 }\n")
+    # The targets of importstr aren't jsonnet, so imports in them are ignored
+    (tmp_path / "banner.txt").write_text("import 'missing.libsonnet'\n")
+    return tmp_path
+
+
+def test_find_jsonnet_imports(jsonnet_files):
+    imports = jsonnet.find_jsonnet_imports(
+        jsonnet_files / "hub.jsonnet", [str(jsonnet_files / "lib")]
+    )
+    assert imports == {
+        str(jsonnet_files / "lib" / "common.libsonnet"),
+        str(jsonnet_files / "lib" / "nested.libsonnet"),
+        str(jsonnet_files / "banner.txt"),
+    }
+
+
+def test_render_cache_key(jsonnet_files):
+    hub = jsonnet_files / "hub.jsonnet"
+    jpaths = [str(jsonnet_files / "lib")]
+    ext_vars = {"VARS_2I2C_CLUSTER_NAME": "cluster1"}
+    key = jsonnet._get_render_cache_key(hub, jpaths, ext_vars)
+
+    assert jsonnet._get_render_cache_key(hub, jpaths, dict(ext_vars)) == key
+    assert (
+        jsonnet._get_render_cache_key(
+            hub, jpaths, {"VARS_2I2C_CLUSTER_NAME": "cluster2"}
+        )
+        != key
+    )
+    # Changing a file imported by an import changes the key
+    (jsonnet_files / "lib" / "nested.libsonnet").write_text("{ b: 3 }\n")
+    new_key = jsonnet._get_render_cache_key(hub, jpaths, ext_vars)
+    assert new_key != key
+    (jsonnet_files / "banner.txt").write_text("hello\n")
+    assert jsonnet._get_render_cache_key(hub, jpaths, ext_vars) != new_key
+
+
+def test_renders_are_cached(jsonnet_files, monkeypatch):
+    monkeypatch.setattr(jsonnet, "_render_cache", {})
+    monkeypatch.setattr(jsonnet, "JSONNET_CACHE_DIR", str(jsonnet_files / "cache"))
+    monkeypatch.setattr(file_acquisition, "REPO_ROOT_PATH", jsonnet_files)
+    renders = []
+
+    def fake_render(command, jsonnet_file, jpaths, ext_vars):
+        renders.append(jsonnet_file)
+        return '{"rendered": %d}' % len(renders)
+
+    monkeypatch.setattr(jsonnet, "_render", fake_render)
+
+    def render():
+        # Files in the same directory as the jsonnet file are on the jpath
+        with jsonnet.render_jsonnet(
+            Path(jsonnet_files / "lib" / "common.libsonnet"), "cluster1", "gcp", None
+        ) as rendered_path:
+            return open(rendered_path).read()
+
+    assert render() == '{"rendered": 1}'
+    assert render() == '{"rendered": 1}'
+    assert len(renders) == 1
+
+    # A new run reuses the render persisted on disk
+    monkeypatch.setattr(jsonnet, "_render_cache", {})
+    assert render() == '{"rendered": 1}'
+    assert len(renders) == 1
+    assert os.listdir(jsonnet_files / "cache") == [
+        f"{next(iter(jsonnet._render_cache))}.json"
+    ]
+
+    (jsonnet_files / "lib" / "nested.libsonnet").write_text("{ b: 3 }\n")
+    assert render() == '{"rendered": 2}'
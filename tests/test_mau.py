@@ -0,0 +1,75 @@
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+# The package of the dev commands imports dependencies only needed by other
+# commands, so load the module on its own
+spec = importlib.util.spec_from_file_location(
+    "mau",
+    Path(__file__).parent.parent / "src/deployer/dev/commands/generate/mau.py",
+)
+mau = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mau)
+
+
+class FakeSession:
+    """
+    Answers instant queries with the minutes each user was active on the day the
+    query is evaluated on
+    """
+
+    def __init__(self, activity):
+        self.activity = activity
+        self.queries = []
+
+    def get(self, url, auth):
+        query = parse_qs(urlparse(url).query)
+        self.queries.append(query)
+        day = datetime.fromtimestamp(int(query["time"][0]), tz=timezone.utc).day
+        result = [
+            {
+                "metric": {"annotation_hub_jupyter_org_username": username},
+                "value": [int(query["time"][0]), str(minutes)],
+            }
+            for username, minutes in self.activity.get(day, {}).items()
+        ]
+        return SimpleNamespace(
+            raise_for_status=lambda: None,
+            json=lambda: {"status": "success", "data": {"result": result}},
+        )
+
+
+def test_get_cluster_activity():
+    session = FakeSession(
+        {
+            1: {"user1": 10, "user2": 5, "deployment-service-check": 3},
+            2: {"user1": 20, "yuvipanda": 100},
+            28: {"user3": 1},
+        }
+    )
+    cluster = SimpleNamespace(
+        get_external_prometheus_url=lambda: "https://prometheus.example.org",
+        get_cluster_prometheus_creds=lambda: ("user", "password"),
+    )
+    days_done = []
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        activity = mau.get_cluster_activity(
+            cluster,
+            datetime(2025, 2, 1, tzinfo=timezone.utc),
+            session,
+            executor,
+            lambda: days_done.append(True),
+        )
+
+    assert activity == {"user1": 30, "user2": 5, "user3": 1}
+    # One query per day of February, each evaluated at the end of its day
+    assert len(days_done) == len(session.queries) == 28
+    times = sorted(int(q["time"][0]) for q in session.queries)
+    assert datetime.fromtimestamp(times[0], tz=timezone.utc) == datetime(
+        2025, 2, 1, tzinfo=timezone.utc
+    ) + timedelta(days=1, seconds=-1)
+    assert session.queries[0]["query"] == [mau.QUERY]
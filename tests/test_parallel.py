@@ -0,0 +1,84 @@
+import importlib
+import subprocess
+import sys
+from types import SimpleNamespace
+
+from deployer.utils.parallel import run_in_parallel
+
+
+def _succeed(value):
+    print(f"working on {value}")
+    # Output of subprocesses ends up in the log of the task too
+    subprocess.check_call([sys.executable, "-c", f"print('subprocess of {value}')"])
+    return value * 2
+
+
+def _fail(value):
+    print(f"failing on {value}")
+    raise ValueError(f"bad value {value}")
+
+
+def test_run_in_parallel_logs_each_task(capfd):
+    results = run_in_parallel(
+        [("a", _succeed, (1,)), ("b", _succeed, (2,))], max_workers=2
+    )
+
+    assert [(r["name"], r["status"], r["result"]) for r in results] == [
+        ("a", "succeeded", 2),
+        ("b", "succeeded", 4),
+    ]
+    out = capfd.readouterr().out
+    for name, value in [("a", 1), ("b", 2)]:
+        # The output of a task is printed as one block, after its header
+        block = out.split(f"----- Output for {name} -----")[1]
+        assert block.index(f"working on {value}") < block.index(
+            f"subprocess of {value}"
+        )
+
+
+def test_run_in_parallel_fail_fast():
+    tasks = [("a", _fail, (1,)), ("b", _succeed, (2,)), ("c", _succeed, (3,))]
+
+    results = run_in_parallel(tasks, max_workers=1)
+    assert [r["status"] for r in results] == ["failed", "skipped", "skipped"]
+    assert results[0]["error"] == "ValueError: bad value 1"
+    assert results[1]["duration"] is None
+
+    results = run_in_parallel(tasks, max_workers=1, fail_fast=False)
+    assert [r["status"] for r in results] == ["failed", "succeeded", "succeeded"]
+
+
+def test_prod_hubs_skipped_after_staging_failure(monkeypatch):
+    deployer = importlib.import_module("deployer.commands.deployer")
+    batches = []
+
+    def fake_run_in_parallel(tasks, max_workers):
+        batches.append([name for name, _, _ in tasks])
+        return [
+            {
+                "name": name,
+                "status": "failed" if name == "staging" else "succeeded",
+                "duration": 1,
+                "error": None,
+                "result": True,
+            }
+            for name, _, _ in tasks
+        ]
+
+    monkeypatch.setattr(deployer, "run_in_parallel", fake_run_in_parallel)
+    monkeypatch.setattr(deployer, "get_hub_chart_dir", lambda hub: "basehub")
+    monkeypatch.setattr(deployer, "cleanup_values_schema_json", lambda chart_dir: None)
+    hubs = [
+        SimpleNamespace(spec={"name": name}, legacy_daskhub=False)
+        for name in ["staging", "prod1", "prod2"]
+    ]
+
+    results = deployer.deploy_hubs_in_parallel(
+        "cluster1", hubs, 2, False, False, skip_refresh=True
+    )
+    assert batches == [["staging"]]
+    assert [(r["name"], r["status"]) for r in results] == [
+        ("staging", "failed"),
+        ("prod1", "skipped"),
+        ("prod2", "skipped"),
+    ]
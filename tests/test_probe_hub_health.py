@@ -0,0 +1,83 @@
+import asyncio
+
+from aiohttp import web
+
+from deployer.health_check_tests.probe_hub_health import probe_hubs_concurrently
+
+
+def _make_hub_app(routes):
+    async def hub_api(request):
+        return web.json_response({"version": "5.2.1"})
+
+    async def user(request):
+        if request.headers.get("Authorization") != "token secret":
+            return web.json_response({}, status=403)
+        return web.json_response({"kind": "service", "name": "hub-health"})
+
+    async def proxy(request):
+        return web.json_response(routes)
+
+    async def gateway_health(request):
+        if not routes:
+            # Like an HTML error page from an ingress
+            return web.Response(text="<html>Bad gateway</html>")
+        return web.json_response({"status": "pass"})
+
+    app = web.Application()
+    app.router.add_get("/hub/api", hub_api)
+    app.router.add_get("/hub/api/user", user)
+    app.router.add_get("/hub/api/proxy", proxy)
+    app.router.add_get("/services/dask-gateway/api/health", gateway_health)
+    return app
+
+
+async def _probe(checks):
+    runner = web.AppRunner(_make_hub_app({"/": {"target": "http://hub:8081"}}))
+    broken_runner = web.AppRunner(_make_hub_app({}))
+    await runner.setup()
+    await broken_runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    broken_site = web.TCPSite(broken_runner, "127.0.0.1", 0)
+    await site.start()
+    await broken_site.start()
+    urls = {
+        "healthy": f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}",
+        "broken": f"http://127.0.0.1:{broken_site._server.sockets[0].getsockname()[1]}",
+    }
+    try:
+        return await probe_hubs_concurrently(
+            [{**c, "url": urls[c["url"]]} for c in checks], concurrency=2, timeout_s=5
+        )
+    finally:
+        await runner.cleanup()
+        await broken_runner.cleanup()
+
+
+def test_probe_hubs_concurrently():
+    results = asyncio.run(
+        _probe(
+            [
+                {"url": "healthy", "type": "daskhub", "token": "secret"},
+                {"url": "healthy", "type": "basehub", "token": "wrong"},
+                {"url": "broken", "type": "daskhub", "token": "secret"},
+            ]
+        )
+    )
+
+    assert {name: p["status"] for name, p in results[0].items()} == {
+        "hub_api": "passed",
+        "self": "passed",
+        "proxy_routes": "passed",
+        "dask_gateway": "passed",
+    }
+    assert results[1]["self"]["status"] == "failed"
+    assert results[1]["self"]["error"] == "GET /hub/api/user returned 403"
+    assert "dask_gateway" not in results[1]
+    assert results[2]["proxy_routes"] == {
+        "status": "failed",
+        "duration": results[2]["proxy_routes"]["duration"],
+        "error": "The proxy has no route to the hub",
+    }
+    assert results[2]["dask_gateway"]["error"] == (
+        "GET /services/dask-gateway/api/health didn't return JSON"
+    )
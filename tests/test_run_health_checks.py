@@ -0,0 +1,208 @@
+import asyncio
+import base64
+import importlib
+import json
+import subprocess
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from deployer.health_check_tests.test_hub_health import NotebookMode
+
+deployer = importlib.import_module("deployer.commands.deployer")
+
+
+def _secret(namespace, token):
+    data = {}
+    if token:
+        data["hub.services.hub-health.apiToken"] = base64.b64encode(
+            token.encode()
+        ).decode()
+    return {"metadata": {"namespace": namespace, "name": "hub"}, "data": data}
+
+
+class FakeCluster:
+    # The cluster kubectl talks to
+    current = None
+
+    def __init__(self, name, hubs, secrets):
+        self.name = name
+        self.hubs = [
+            SimpleNamespace(
+                spec={"name": hub_name, "domain": f"{hub_name}.{name}.example.org"},
+                type="basehub",
+                binderhub_ui=hub_name == "binder",
+                authenticator="null" if hub_name == "binder" else "github",
+            )
+            for hub_name in hubs
+        ]
+        self.secrets = secrets
+        self.auths = 0
+        self.auth_error = None
+
+    def get_hub(self, hub_name):
+        return next(hub for hub in self.hubs if hub.spec["name"] == hub_name)
+
+    @contextmanager
+    def auth(self):
+        self.auths += 1
+        if self.auth_error:
+            raise self.auth_error
+        FakeCluster.current = self
+        try:
+            yield
+        finally:
+            FakeCluster.current = None
+
+
+@pytest.fixture
+def clusters(monkeypatch):
+    clusters = {
+        "cluster1": FakeCluster(
+            "cluster1",
+            ["staging", "prod", "binder", "no-token"],
+            [
+                _secret("staging", "staging-token"),
+                _secret("prod", "prod-token"),
+                _secret("no-token", None),
+            ],
+        ),
+        "cluster2": FakeCluster("cluster2", ["hub1"], [_secret("hub1", "token1")]),
+    }
+
+    def fake_check_output(cmd, **kwargs):
+        assert cmd[:3] == ["kubectl", "get", "secrets"]
+        return json.dumps({"items": FakeCluster.current.secrets})
+
+    def fake_run_in_parallel(tasks, max_workers, fail_fast):
+        # Run the tasks one after another in this process, so they see the fakes
+        results = []
+        for name, func, args in tasks:
+            result = {"name": name, "status": "succeeded", "error": None}
+            try:
+                result["result"] = func(*args)
+            except Exception as e:
+                result.update(
+                    status="failed", error=f"{type(e).__name__}: {e}", result=None
+                )
+            results.append(result)
+        return results
+
+    registry = SimpleNamespace(names=list(clusters), get=clusters.__getitem__)
+    monkeypatch.setattr(deployer.Cluster, "get_all", lambda: registry)
+    monkeypatch.setattr(deployer.Cluster, "registry", lambda: registry)
+    monkeypatch.setattr(deployer, "run_in_parallel", fake_run_in_parallel)
+    monkeypatch.setattr(deployer.tracing, "check_output", fake_check_output)
+    monkeypatch.setattr(
+        deployer, "get_release_revisions", lambda: {("prod", "prod"): 3}
+    )
+    monkeypatch.setattr(deployer, "record_health_check", lambda *args: None)
+    return clusters
+
+
+def test_get_hub_health_api_tokens(clusters):
+    with clusters["cluster1"].auth():
+        tokens = deployer.get_hub_health_api_tokens()
+    assert tokens == {"staging": "staging-token", "prod": "prod-token"}
+
+
+def test_get_health_check_targets(clusters):
+    checks, results = deployer.get_health_check_targets(
+        ["cluster1", "cluster1/prod", "cluster2/hub1"]
+    )
+
+    assert [(c["cluster"], c["hub"], c["token"]) for c in checks] == [
+        ("cluster1", "staging", "staging-token"),
+        ("cluster1", "prod", "prod-token"),
+        ("cluster2", "hub1", "token1"),
+    ]
+    assert checks[1]["url"] == "https://prod.cluster1.example.org"
+    assert checks[1]["revision"] == 3
+    assert [(r["hub"], r["status"]) for r in results] == [
+        ("binder", "skipped"),
+        ("no-token", "failed"),
+    ]
+    # Each cluster is only authenticated with once
+    assert [c.auths for c in clusters.values()] == [1, 1]
+
+
+def test_get_health_check_targets_without_revisions(clusters, monkeypatch):
+    def fail():
+        raise subprocess.CalledProcessError(1, ["helm", "list"])
+
+    monkeypatch.setattr(deployer, "get_release_revisions", fail)
+    checks, _ = deployer.get_health_check_targets(["cluster2"])
+    assert [(c["hub"], c["revision"]) for c in checks] == [("hub1", None)]
+
+
+def test_get_health_check_targets_failed_auth(clusters):
+    clusters["cluster1"].auth_error = subprocess.CalledProcessError(1, ["gcloud"])
+    checks, results = deployer.get_health_check_targets([])
+
+    # The hubs of other clusters are still checked
+    assert [(c["cluster"], c["hub"]) for c in checks] == [("cluster2", "hub1")]
+    assert [(r["hub"], r["status"]) for r in results] == [
+        ("staging", "failed"),
+        ("prod", "failed"),
+        ("binder", "skipped"),
+        ("no-token", "failed"),
+    ]
+    assert results[0]["error"].startswith(
+        "Failed to read the hub-health service tokens of the cluster: CalledProcessError"
+    )
+
+
+def test_run_health_checks(clusters, monkeypatch, tmp_path):
+    async def fake_test_hub_healthy(hub_url, token, hub_type, verbose, notebook_mode):
+        if token == "prod-token":
+            raise ValueError("the server never started")
+        return [{"notebook": "check.ipynb"}]
+
+    monkeypatch.setattr(deployer, "test_hub_healthy", fake_test_hub_healthy)
+    output = tmp_path / "summary.json"
+
+    with pytest.raises(SystemExit) as e:
+        deployer.run_health_checks(
+            hubs=["cluster1", "cluster2"],
+            concurrency=2,
+            attempts=2,
+            attempt_timeout_s=5,
+            output=output,
+            verbose=False,
+            notebook_mode=NotebookMode.SEQUENTIAL,
+        )
+    assert e.value.code == 1
+
+    summary = json.loads(output.read_text())
+    assert (summary["passed"], summary["failed"], summary["skipped"]) == (2, 2, 1)
+    results = {r["hub"]: r for r in summary["hubs"]}
+    assert results["staging"]["notebooks"] == [{"notebook": "check.ipynb"}]
+    assert results["prod"]["error"] == (
+        "All 2 attempts failed, the last one with: ValueError: the server never started"
+    )
+
+
+def test_health_attempts_retries(monkeypatch):
+    calls = []
+
+    async def fake_test_hub_healthy(hub_url, token, hub_type, verbose, notebook_mode):
+        calls.append(hub_url)
+        if len(calls) == 1:
+            await asyncio.sleep(1)
+        return []
+
+    monkeypatch.setattr(deployer, "test_hub_healthy", fake_test_hub_healthy)
+    assert (
+        asyncio.run(
+            deployer.test_health_attempts("url", "token", "basehub", 2, 0.1, False)
+        )
+        == []
+    )
+    assert len(calls) == 2
+
+    calls.clear()
+    with pytest.raises(RuntimeError, match="the last one with: Timed out after 0.1s"):
+        asyncio.run(
+            deployer.test_health_attempts("url", "token", "basehub", 1, 0.1, False)
+        )
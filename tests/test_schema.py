@@ -0,0 +1,57 @@
+import os
+
+import jsonschema
+import pytest
+
+from deployer.utils.schema import (
+    get_schema_validator,
+    validate_with_schema,
+    write_schema_json,
+)
+
+SCHEMA = """
+type: object
+additionalProperties: false
+properties:
+  name:
+    type: string
+"""
+
+
+@pytest.fixture
+def schema_file(tmp_path):
+    path = tmp_path / "values.schema.yaml"
+    path.write_text(SCHEMA)
+    return path
+
+
+def test_validators_are_cached_by_content(schema_file, tmp_path):
+    other_schema_file = tmp_path / "other.schema.yaml"
+    other_schema_file.write_text(SCHEMA)
+    assert get_schema_validator(schema_file) is get_schema_validator(other_schema_file)
+
+    schema_file.write_text(SCHEMA + "required: [name]\n")
+    assert get_schema_validator(schema_file) is not get_schema_validator(
+        other_schema_file
+    )
+
+
+def test_validate_with_schema(schema_file):
+    validate_with_schema({"name": "staging"}, schema_file)
+    with pytest.raises(jsonschema.ValidationError, match="is not of type 'string'"):
+        validate_with_schema({"name": 1}, schema_file)
+
+
+def test_write_schema_json_only_writes_changes(schema_file, tmp_path):
+    json_file = tmp_path / "values.schema.json"
+    write_schema_json(schema_file, json_file)
+    assert '"additionalProperties": false' in json_file.read_text()
+
+    os.utime(json_file, ns=(0, 0))
+    write_schema_json(schema_file, json_file)
+    assert json_file.stat().st_mtime_ns == 0
+
+    schema_file.write_text(SCHEMA + "required: [name]\n")
+    write_schema_json(schema_file, json_file)
+    assert '"required": ["name"]' in json_file.read_text()
+    assert list(tmp_path.glob(".values.schema-*")) == []
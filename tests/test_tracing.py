@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from deployer.utils import tracing
+
+
+def test_spans_are_recorded_with_attributes(tmp_path, monkeypatch):
+    # Stop tracing again once the test is done
+    monkeypatch.setattr(tracing, "_spans", None)
+    tracing.start_tracing()
+    with tracing.trace_attributes(cluster="cluster1"):
+        with tracing.span("deploy", hub="hub1"):
+            tracing.check_call(["true", "--flag"])
+        with pytest.raises(ValueError):
+            with tracing.span("broken"):
+                raise ValueError()
+    spans = tracing.get_spans()
+
+    assert [(s["name"], s["status"], s["attributes"]) for s in spans] == [
+        ("true", "ok", {"cluster": "cluster1", "hub": "hub1", "tool": "true"}),
+        ("deploy", "ok", {"cluster": "cluster1", "hub": "hub1"}),
+        ("broken", "error", {"cluster": "cluster1"}),
+    ]
+
+    tracing.write_trace(tmp_path / "trace.jsonl", spans)
+    lines = (tmp_path / "trace.jsonl").read_text().splitlines()
+    assert [json.loads(line) for line in lines] == spans
+
+    tracing.write_trace(tmp_path / "trace.json", spans)
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert [(e["name"], e["cat"], e["ph"]) for e in events] == [
+        ("true", "true", "X"),
+        ("deploy", "deployer", "X"),
+        ("broken", "deployer", "X"),
+    ]
+    assert events[1]["dur"] >= events[0]["dur"]
+
+
+def test_get_span_name():
+    assert tracing._get_span_name(["helm", "upgrade", "--install", "hub"]) == (
+        "helm upgrade"
+    )
+    assert tracing._get_span_name(["sops", "--decrypt", "secret.yaml"]) == "sops"
+    assert tracing._get_span_name(["/usr/bin/kubectl", "apply", "-f", "x"]) == (
+        "kubectl apply"
+    )
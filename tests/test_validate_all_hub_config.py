@@ -0,0 +1,89 @@
+import importlib
+import json
+import subprocess
+
+import pytest
+
+from deployer.infra_components.cluster import ClusterRegistry
+
+config = importlib.import_module("deployer.commands.validate.config")
+
+
+def test_all_hub_config_reports_every_failed_hub(tmp_path, monkeypatch):
+    (tmp_path / "cluster1").mkdir()
+    (tmp_path / "cluster1" / "cluster.yaml").write_text(
+        "name: cluster1\n"
+        "provider: gcp\n"
+        "hubs:\n"
+        + "".join(
+            f"- name: {name}\n  helm_chart: basehub\n"
+            for name in ["staging", "broken-render", "invalid", "prod"]
+        )
+    )
+    registry = ClusterRegistry(tmp_path)
+    cleaned_up = []
+
+    def fake_validate_hub(hub, helm_chart_dir, debug, full):
+        if hub.spec["name"] == "broken-render":
+            raise subprocess.CalledProcessError(1, ["jsonnet"])
+        if hub.spec["name"] == "invalid":
+            raise ValueError("values don't match the schema")
+
+    monkeypatch.setattr(config.Cluster, "from_name", registry.get)
+    monkeypatch.setattr(config, "get_hub_chart_dir", lambda hub: "basehub")
+    monkeypatch.setattr(config, "validate_hub", fake_validate_hub)
+    monkeypatch.setattr(config, "cleanup_values_schema_json", cleaned_up.append)
+    report_file = tmp_path / "report.json"
+
+    with pytest.raises(SystemExit) as e:
+        config.all_hub_config(
+            cluster_name="cluster1",
+            hub_name=None,
+            skip_refresh=True,
+            debug=False,
+            full=False,
+            parallel=1,
+            report_file=report_file,
+        )
+    assert e.value.code == 1
+
+    report = json.loads(report_file.read_text())
+    assert [(r["name"], r["status"]) for r in report["hubs"]] == [
+        ("staging", "succeeded"),
+        ("broken-render", "failed"),
+        ("invalid", "failed"),
+        ("prod", "succeeded"),
+    ]
+    assert report["hubs"][1]["error"].startswith("CalledProcessError: ")
+    assert cleaned_up == ["basehub"]
+
+
+def test_all_hub_config_cleans_up_on_errors(tmp_path, monkeypatch):
+    (tmp_path / "cluster1").mkdir()
+    (tmp_path / "cluster1" / "cluster.yaml").write_text(
+        "name: cluster1\nprovider: gcp\nhubs:\n- name: hub1\n  helm_chart: basehub\n"
+    )
+    registry = ClusterRegistry(tmp_path)
+    cleaned_up = []
+
+    def fail_to_prepare(chart_dir, legacy_daskhub):
+        raise subprocess.CalledProcessError(1, ["helm", "dep", "up"])
+
+    monkeypatch.setattr(config.Cluster, "from_name", registry.get)
+    monkeypatch.setattr(config, "get_hub_chart_dir", lambda hub: "basehub")
+    monkeypatch.setattr(
+        config, "_prepare_hub_helm_charts_dependencies_and_schema", fail_to_prepare
+    )
+    monkeypatch.setattr(config, "cleanup_values_schema_json", cleaned_up.append)
+
+    with pytest.raises(subprocess.CalledProcessError):
+        config.all_hub_config(
+            cluster_name="cluster1",
+            hub_name=None,
+            skip_refresh=False,
+            debug=False,
+            full=False,
+            parallel=1,
+            report_file=None,
+        )
+    assert cleaned_up == ["basehub"]
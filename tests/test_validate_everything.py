@@ -0,0 +1,180 @@
+import importlib
+import json
+
+import pytest
+
+from deployer.commands.plan_upgrade.decision import shard_hub_matrix_jobs
+from deployer.infra_components.cluster import ClusterRegistry
+from deployer.utils.deploy_stats import get_expected_durations
+
+config = importlib.import_module("deployer.commands.validate.config")
+
+
+class FakeValidation:
+    """
+    Runs the validation tasks of `everything` by recording them, failing the
+    ones named in `failing`
+    """
+
+    def __init__(self):
+        self.tasks = []
+        self.failing = set()
+        self.invalid_clusters = set()
+
+    def run_in_parallel(self, tasks, max_workers, fail_fast):
+        self.tasks.extend((name, func) for name, func, _ in tasks)
+        return [
+            {
+                "name": name,
+                "status": "failed" if name in self.failing else "succeeded",
+                "duration": 1,
+                "error": "ValueError: invalid" if name in self.failing else None,
+            }
+            for name, _, _ in tasks
+        ]
+
+    def validate_cluster(self, cluster):
+        if cluster.spec["name"] in self.invalid_clusters:
+            raise ValueError("cluster.yaml is invalid")
+
+    @property
+    def names(self):
+        return [name for name, _ in self.tasks]
+
+
+@pytest.fixture
+def validation(tmp_path, monkeypatch):
+    clusters_path = tmp_path / "clusters"
+    for cluster_name, hub_names in [
+        ("cluster1", ["staging", "hub1", "hub2", "hub3", "unchanged"]),
+        ("cluster2", ["staging", "prod"]),
+    ]:
+        (clusters_path / cluster_name).mkdir(parents=True)
+        (clusters_path / cluster_name / "cluster.yaml").write_text(
+            f"name: {cluster_name}\n"
+            "provider: gcp\n"
+            "support:\n"
+            "  helm_chart_values_files:\n"
+            "  - support.values.yaml\n"
+            "hubs:\n"
+            + "".join(f"- name: {name}\n  helm_chart: basehub\n" for name in hub_names)
+        )
+    registry = ClusterRegistry(clusters_path)
+    validation = FakeValidation()
+
+    monkeypatch.setattr(config.Cluster, "registry", lambda: registry)
+    monkeypatch.setattr(config, "validate_cluster", validation.validate_cluster)
+    monkeypatch.setattr(config, "get_hub_chart_dir", lambda hub: "basehub")
+    monkeypatch.setattr(config, "cleanup_values_schema_json", lambda chart_dir: None)
+    monkeypatch.setattr(config, "run_in_parallel", validation.run_in_parallel)
+    return validation
+
+
+def _everything(cluster_names=None, jobs_file=None, report_file=None):
+    config.everything(
+        cluster_names=cluster_names,
+        jobs_file=jobs_file,
+        parallel=1,
+        skip_refresh=True,
+        debug=False,
+        full=False,
+        report_file=report_file,
+    )
+
+
+def _write_jobs(tmp_path, name, jobs):
+    jobs_file = tmp_path / f"{name}-jobs.json"
+    jobs_file.write_text(
+        json.dumps(
+            [
+                {
+                    "provider": "gcp",
+                    "choice_reason": "Core infrastructure has been modified",
+                    **job,
+                }
+                for job in jobs
+            ]
+        )
+    )
+    return jobs_file
+
+
+def test_everything_validates_clusters(validation):
+    _everything(cluster_names=["cluster2"])
+
+    assert validation.tasks == [
+        ("cluster2/support", config._validate_support_in_worker),
+        ("cluster2/staging", config._validate_hub_in_worker),
+        ("cluster2/prod", config._validate_hub_in_worker),
+    ]
+
+
+def test_everything_validates_jobs(validation, tmp_path):
+    jobs_files = [
+        # Support jobs have no hub
+        _write_jobs(tmp_path, "support", [{"cluster_name": "cluster2"}]),
+        _write_jobs(
+            tmp_path,
+            "staging",
+            [{"cluster_name": "cluster1", "hub_name": "staging"}],
+        ),
+    ]
+    _everything(jobs_file=jobs_files)
+
+    assert validation.tasks == [
+        ("cluster1/staging", config._validate_hub_in_worker),
+        ("cluster2/support", config._validate_support_in_worker),
+    ]
+
+
+def test_everything_validates_sharded_jobs(validation, tmp_path):
+    prod_jobs = shard_hub_matrix_jobs(
+        [
+            {
+                "provider": "gcp",
+                "cluster_name": "cluster1",
+                "hub_name": hub_name,
+                "choice_reason": "Core infrastructure has been modified",
+            }
+            for hub_name in ["hub1", "hub2", "hub3"]
+        ],
+        2,
+        get_expected_durations({}),
+    )
+    jobs_files = [
+        _write_jobs(
+            tmp_path,
+            "staging",
+            [{"cluster_name": "cluster1", "hub_name": "staging"}],
+        ),
+        _write_jobs(tmp_path, "prod", prod_jobs),
+    ]
+    _everything(jobs_file=jobs_files)
+
+    assert validation.names == [
+        "cluster1/hub1",
+        "cluster1/hub2",
+        "cluster1/hub3",
+        "cluster1/staging",
+    ]
+
+
+def test_everything_reports_failures(validation, tmp_path):
+    validation.failing = {"cluster1/hub2"}
+    validation.invalid_clusters = {"cluster2"}
+    report_file = tmp_path / "report.json"
+
+    with pytest.raises(SystemExit) as e:
+        _everything(report_file=report_file)
+    assert e.value.code == 1
+
+    report = {r["name"]: r for r in json.loads(report_file.read_text())}
+    assert report["cluster1/hub2"]["status"] == "failed"
+    assert report["cluster1/hub2"]["error"] == "ValueError: invalid"
+    assert report["cluster2/cluster.yaml"]["status"] == "failed"
+    assert report["cluster2/cluster.yaml"]["error"] == (
+        "ValueError: cluster.yaml is invalid"
+    )
+    # The other validations still ran
+    assert report["cluster1/hub1"]["status"] == "succeeded"
+    assert report["cluster2/prod"]["status"] == "succeeded"
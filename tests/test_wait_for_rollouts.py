@@ -0,0 +1,93 @@
+import json
+from unittest import mock
+
+import pytest
+
+from deployer.utils.helm import (
+    get_rollout_pending_reason,
+    wait_for_deployments_daemonsets,
+)
+
+
+def deployment(name, replicas=1, updated=1, available=1, total=None, generation=1):
+    return {
+        "kind": "Deployment",
+        "metadata": {"name": name, "generation": generation},
+        "spec": {"replicas": replicas},
+        "status": {
+            "observedGeneration": 1,
+            "replicas": updated if total is None else total,
+            "updatedReplicas": updated,
+            "availableReplicas": available,
+        },
+    }
+
+
+def daemonset(name, desired=3, updated=3, available=3):
+    return {
+        "kind": "DaemonSet",
+        "metadata": {"name": name, "generation": 1},
+        "spec": {"updateStrategy": {"type": "RollingUpdate"}},
+        "status": {
+            "observedGeneration": 1,
+            "desiredNumberScheduled": desired,
+            "updatedNumberScheduled": updated,
+            "numberAvailable": available,
+        },
+    }
+
+
+def fake_kubectl(*responses):
+    """
+    Return a stand-in for `check_output` that returns each of `responses` as the
+    list of objects from successive `kubectl get` calls
+    """
+    outputs = [json.dumps({"items": items}).encode() for items in responses]
+    return mock.patch("deployer.utils.helm.check_output", side_effect=outputs)
+
+
+def test_get_rollout_pending_reason_ready():
+    assert get_rollout_pending_reason(deployment("hub")) is None
+    assert get_rollout_pending_reason(daemonset("continuous-image-puller")) is None
+
+
+def test_get_rollout_pending_reason_not_ready():
+    assert get_rollout_pending_reason(deployment("hub", generation=2))
+    assert get_rollout_pending_reason(deployment("hub", updated=0))
+    assert get_rollout_pending_reason(deployment("hub", total=2))
+    assert get_rollout_pending_reason(deployment("hub", available=0))
+    assert get_rollout_pending_reason(daemonset("puller", updated=1))
+    assert get_rollout_pending_reason(daemonset("puller", available=2))
+
+
+def test_get_rollout_pending_reason_deadline_exceeded():
+    obj = deployment("hub", available=0)
+    obj["status"]["conditions"] = [{"reason": "ProgressDeadlineExceeded"}]
+    with pytest.raises(RuntimeError):
+        get_rollout_pending_reason(obj)
+
+
+def test_wait_for_deployments_daemonsets_waits_for_all():
+    with (
+        fake_kubectl(
+            [deployment("hub", available=0), daemonset("puller", updated=1)],
+            [deployment("hub"), daemonset("puller", updated=2)],
+            [deployment("hub"), daemonset("puller")],
+        ) as kubectl,
+        mock.patch("deployer.utils.helm.time.sleep"),
+    ):
+        wait_for_deployments_daemonsets("staging")
+
+    assert kubectl.call_count == 3
+
+
+def test_wait_for_deployments_daemonsets_timeout():
+    with (
+        fake_kubectl(
+            [deployment("hub"), daemonset("puller", available=0)],
+            [deployment("hub"), daemonset("puller", available=0)],
+        ),
+        mock.patch("deployer.utils.helm.time.sleep"),
+        pytest.raises(TimeoutError, match="daemonset/puller"),
+    ):
+        wait_for_deployments_daemonsets("staging", timeout=0)